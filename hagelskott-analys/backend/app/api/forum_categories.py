@@ -24,18 +24,22 @@
 # =============================================================================
 
 import logging
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Response, status
 from datetime import datetime
 from bson import ObjectId
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field
-import time
 
 # === Om du behöver roll-check ===
 #    (Byt importväg om du ligger annorlunda i din struktur)
 from app.api.routes.auth import get_current_active_user, UserInDB
 
+from app.core.config import settings
 from app.db.mongodb import db
+from app.services.category_tree import CategoryTree, english_description, english_name
+from app.services.forum_counters import forum_counters
+from app.services.forum_loader import ForumLoader, get_forum_loader
+from app.services.shared_cache import SharedCache
 
 logger = logging.getLogger(__name__)
 
@@ -44,18 +48,43 @@ router = APIRouter(tags=["Forum Categories"])
 # ---------------------------------------------------------------------------
 # Cache-implementation för kategoristrukturen
 # ---------------------------------------------------------------------------
-# Dict med struktur: {
-#   "categories": [lista med kategorier],
-#   "last_updated": timestamp,
-#   "expires_at": timestamp
-# }
-categories_cache: Dict[str, Any] = {
-    "categories": None,
-    "last_updated": 0,
-    "expires_at": 0
-}
+# En lista per språk ("categories_sv"/"categories_en") och kategoriträdet
+# ("tree", se category_tree) i SharedCache: en laddning åt gången per nyckel,
+# gammalt värde medan ett nytt hämtas, och invalidering som når alla
+# arbetsprocesser via 'cache_versions'.
+CACHE_TTL = settings.FORUM_CATEGORY_CACHE_TTL
 
-CACHE_TTL = 5 * 60  # 5 minuter i sekunder
+categories_cache = SharedCache("categories", ttl=CACHE_TTL)
+
+
+async def _load_categories(language: str) -> List[Dict[str, Any]]:
+    logger.info(f"Category cache miss or expired for {language}. Fetching from database...")
+    database = await db.get_database()
+    
+    # Antalen underhålls i dokumenten (se forum_counters)
+    categories = []
+    async for category in database.categories.find():
+        # Konvertera ObjectId till str
+        category["_id"] = str(category["_id"])
+        
+        # Säkerställ att parent_id är en sträng eller None
+        if category.get("parent_id") and not isinstance(category["parent_id"], str):
+            category["parent_id"] = str(category["parent_id"])
+        
+        # Ange namn baserat på språkpreferens
+        if language == "en" and "english_name" in category and category["english_name"]:
+            category["display_name"] = category["english_name"]
+        else:
+            category["display_name"] = category["name"]
+        
+        # Lägg till räkningar för kategori
+        category["thread_count"] = category.get("threadCount", 0)
+        category["post_count"] = category.get("postCount", 0)
+        
+        categories.append(category)
+    
+    logger.info(f"Category cache updated for {language}. Expires in {CACHE_TTL} seconds.")
+    return categories
 
 
 async def get_cached_categories(language: str = "en", force_refresh: bool = False) -> List[Dict[str, Any]]:
@@ -65,72 +94,31 @@ async def get_cached_categories(language: str = "en", force_refresh: bool = Fals
         language: Språkkod för hämtning (sv/en)
         force_refresh: Tvinga uppdatering av cache
     """
-    current_time = time.time()
-    cache_key = f"categories_{language}"
-    
-    # Om cache:en inte finns för detta språk eller om den har gått ut
-    if (force_refresh or 
-        categories_cache.get(cache_key) is None or 
-        categories_cache.get(f"{cache_key}_expires_at", 0) < current_time):
-        
-        logger.info(f"Category cache miss or expired for {language}. Fetching from database...")
-        database = await db.get_database()
-        
-        # Hämta alla kategorier
-        cursor = database.categories.find()
-        categories = []
-        
-        async for category in cursor:
-            # Konvertera ObjectId till str
-            category["_id"] = str(category["_id"])
-            
-            # Säkerställ att parent_id är en sträng eller None
-            if category.get("parent_id") and not isinstance(category["parent_id"], str):
-                category["parent_id"] = str(category["parent_id"])
-            
-            # Hämta antal trådar
-            thread_count = await database.threads.count_documents({"category_id": category["_id"]})
-            
-            # Hämta antal inlägg
-            thread_ids = [str(thread["_id"]) async for thread in database.threads.find({"category_id": category["_id"]})]
-            post_count = 0
-            if thread_ids:
-                post_count = await database.posts.count_documents({"thread_id": {"$in": thread_ids}})
-            
-            # Ange namn baserat på språkpreferens
-            if language == "en" and "english_name" in category and category["english_name"]:
-                category["display_name"] = category["english_name"]
-            else:
-                category["display_name"] = category["name"]
-            
-            # Lägg till räkningar för kategori
-            category["thread_count"] = thread_count
-            category["post_count"] = post_count
-            
-            categories.append(category)
-        
-        # Uppdatera cache med ny data
-        expires_at = current_time + CACHE_TTL
-        categories_cache[cache_key] = categories
-        categories_cache[f"{cache_key}_last_updated"] = current_time
-        categories_cache[f"{cache_key}_expires_at"] = expires_at
-        
-        logger.info(f"Category cache updated for {language}. Expires in {CACHE_TTL} seconds.")
-        return categories
-    else:
-        # Använd cache-data
-        logger.debug(f"Using cached categories for {language}.")
-        return categories_cache[cache_key]
+    return await categories_cache.get(
+        f"categories_{language}", lambda: _load_categories(language), force_refresh=force_refresh
+    )
+
+
+async def _load_category_tree() -> CategoryTree:
+    database = await db.get_database()
+    tree = CategoryTree.from_documents(await database.categories.find().to_list(None))
+    logger.info(f"Category tree compiled ({len(tree)} categories).")
+    return tree
+
+
+async def get_category_tree(force_refresh: bool = False) -> CategoryTree:
+    """
+    Kategoriträdet med färdig JSON per språk (GET /categories och /categories/{id}).
+    """
+    return await categories_cache.get("tree", _load_category_tree, force_refresh=force_refresh)
 
 
 async def invalidate_categories_cache():
     """
-    Invaliderar cache för kategoristrukturen.
+    Invaliderar cache för kategoristrukturen (i alla arbetsprocesser).
     Anropas när kategorier ändras (skapas, uppdateras, tas bort).
     """
-    for key in list(categories_cache.keys()):
-        if key.startswith("categories_"):
-            categories_cache[key] = None
+    await categories_cache.invalidate()
     logger.info("Categories cache invalidated.")
 
 
@@ -977,112 +965,12 @@ async def create_category_recursive(database, cat_data, parent_id=None):
     for subcat in children:
         await create_category_recursive(database, subcat, parent_id=new_id)
 
-# Hjälpfunktion för att generera engelska namn (förenklade översättningar)
+# Hjälpfunktioner för engelska namn/beskrivningar (tabellerna i category_tree)
 def generate_english_name(swedish_name):
-    translations = {
-        "Jakt": "Hunting",
-        "Allmän Jakt": "General Hunting",
-        "Jaktberättelser och Upplevelser": "Hunting Stories and Experiences",
-        "Nyheter och Uppdateringar": "News and Updates",
-        "Jaktetik och Säkerhet": "Hunting Ethics and Safety",
-        "Jaktmetoder": "Hunting Methods",
-        "Jaktformer": "Hunting Forms",
-        "Smygjakt": "Stalking",
-        "Vakjakt": "Stand Hunting",
-        "Drivjakt": "Driven Hunt",
-        "Viltarter": "Game Species",
-        "Klövvilt": "Hoofed Game",
-        "Rovdjur": "Predators",
-        "Fågeljakt": "Bird Hunting",
-        "Jakt i Olika Miljöer": "Hunting in Different Environments",
-        "Jaktresor och Internationell Jakt": "Hunting Trips and International Hunting",
-        "Utrustning för Jakt": "Hunting Equipment",
-        "Viltvård och Ekologi": "Game Management and Ecology",
-        "Jakt och Mat": "Hunting and Food",
-        "Tradition och Kultur inom Jakt": "Tradition and Culture in Hunting",
-        "Etik och Filosofi kring Jakt": "Ethics and Philosophy of Hunting",
-        "Jakthundar och Träning": "Hunting Dogs and Training",
-        "Vapen och Ammunition": "Weapons and Ammunition",
-        "Handladdning": "Reloading",
-        "Bushcraft och Prepping": "Bushcraft and Prepping",
-        "Vapenpolitik och Juridik": "Weapons Policy and Law",
-        "Marknad och Utbyte": "Market and Exchange",
-        "Gemenskap och Diskussionsämnen": "Community and Discussion Topics",
-        # Nya översättningar för återstående kategorier
-        "Jakt i Sverige": "Hunting in Sweden",
-        "Jakt i Norden": "Hunting in Scandinavia",
-        "Jakt i Europa": "Hunting in Europe",
-        "Jakt i Övriga Världen": "Hunting in the Rest of the World",
-        "Vapen och Optik": "Firearms and Optics",
-        "Kläder och Utrustning": "Clothing and Equipment",
-        "Jaktfordon": "Hunting Vehicles",
-        "Viltförvaltning": "Wildlife Management",
-        "Biotopvård": "Habitat Management",
-        "Rovdjursförvaltning": "Predator Management",
-        "Styckning och Slakt": "Butchering and Slaughtering",
-        "Viltkött och Matlagning": "Game Meat and Cooking",
-        "Förvaring och Konservering": "Storage and Preservation",
-        "Allmän Vapendiskussion": "General Firearms Discussion",
-        "Vapenrecensioner": "Firearm Reviews",
-        "Vapentyper": "Types of Firearms",
-        "Vapenvård och Underhåll": "Firearm Care and Maintenance",
-        "Ammunition": "Ammunition",
-        "Långhållsskytte": "Long-Range Shooting",
-        "Tävlingsskytte": "Competitive Shooting",
-        "Tillbehör och Utrustning": "Accessories and Equipment",
-        "Historia och Kultur": "History and Culture",
-        "Handladdning - kula": "Reloading - Bullets",
-        "Introduktion till Handladdning av kula": "Introduction to Bullet Reloading",
-        "Lagkrav och Regler för Handladdning": "Legal Requirements and Rules for Reloading",
-        "Fördelar och Nackdelar med Handladdning": "Pros and Cons of Reloading",
-        "Utrustning och Verktyg": "Equipment and Tools",
-        "Säkerhet vid Handladdning": "Reloading Safety",
-        "Recept och Tester": "Recipes and Tests",
-        "Kulor och Krut": "Bullets and Powder",
-        "Precision och Optimering": "Precision and Optimization",
-        "Handladdning - hagel": "Reloading - Shotshells",
-        "Överlevnadstekniker": "Survival Techniques",
-        "Eldstart och Matlagning": "Fire Starting and Cooking",
-        "Skydd och Boende i Naturen": "Shelter and Living in Nature",
-        "Ryggsäckar och Utrustning för Vandring": "Backpacks and Hiking Equipment",
-        "Prepping och Krisberedskap": "Prepping and Emergency Preparedness",
-        "Matlagring och Vattenförvaring": "Food Storage and Water Preservation",
-        "Krisplaner och Kommunikation": "Emergency Plans and Communication",
-        "Första Hjälpen och Medicinsk Utrustning": "First Aid and Medical Equipment",
-        "Fördjupningar och Specialämnen": "Deep Dives and Special Topics",
-        "Vapenlagar": "Firearms Laws",
-        "Sverige och Internationella Jämförelser": "Sweden and International Comparisons",
-        "Diskutera Nya Förslag": "Discussing New Proposals",
-        "Aktivism och Föreningar": "Activism and Associations",
-        "Bevara Vapenägande": "Preserving Gun Ownership",
-        "Amerikansk Vapenpolitik": "American Gun Politics",
-        "Köp och Sälj": "Buy and Sell",
-        "Jaktutbyte och Arrangemang": "Hunting Exchange and Arrangements",
-        "Specialerbjudanden och Tips": "Special Offers and Tips",
-        "Byteshandel och Donationer": "Bartering and Donations",
-        "Internationellt Utbyte": "International Exchange",
-        "Introduktioner": "Introductions",
-        "Off-Topic": "Off-Topic",
-        "Händelser och Mässor": "Events and Trade Shows",
-        "Hobbyer och Sidoprojekt": "Hobbies and Side Projects",
-        "Lokala Grupper och Gemenskaper": "Local Groups and Communities",
-        "Livsstil och Filosofi": "Lifestyle and Philosophy",
-        "Välgörenhet och Samhällsprojekt": "Charity and Community Projects"
-    }
-    return translations.get(swedish_name, swedish_name)
+    return english_name(swedish_name)
 
-# Hjälpfunktion för att generera enkla engelska beskrivningar
 def generate_english_description(swedish_description):
-    # Förenklade översättningar av vanliga beskrivningar
-    translations = {
-        "Diskussioner om jakt, metoder, arter och utrustning": 
-            "Discussions about hunting, methods, species and equipment",
-        "Jaktberättelser och upplevelser": 
-            "Hunting stories and experiences",
-        "Strategier och tekniker för olika jaktformer": 
-            "Strategies and techniques for different hunting forms"
-    }
-    return translations.get(swedish_description, swedish_description)
+    return english_description(swedish_description)
 
 # 3) reset_forum_categories – rensar alla kategorier
 @router.post("/categories/reset")
@@ -1095,6 +983,7 @@ async def reset_forum_categories(
 
     database = await db.get_database()
     result = await database.categories.delete_many({})
+    await invalidate_categories_cache()
     return {"message": f"Raderade {result.deleted_count} kategorier"}
 
 # 4) seed_forum_categories_internal
@@ -1110,6 +999,7 @@ async def seed_forum_categories_internal():
         # Skapa kategorier rekursivt
         for cat_data in FORUM_CATEGORIES:
             await create_category_recursive(database, cat_data)
+        await invalidate_categories_cache()
             
         logger.info("Forum categories seeded successfully")
         return True
@@ -1140,279 +1030,20 @@ async def seed_forum_categories(
 # 5) get_all_categories – platt list av alla
 @router.get("/categories", response_model=List[CategoryResponse])
 async def get_all_categories(language: str = "en"):
-    database = await db.get_database()
-    cursor = database.categories.find()
-    cats = await cursor.to_list(None)
-    # Konvertera ObjectId -> str
-    results = []
-    for c in cats:
-        c["_id"] = str(c["_id"])
-        if c.get("parent_id"):
-            c["parent_id"] = str(c["parent_id"])
-
-        # Lägg till språkversioner om de inte finns
-        # Här mappar vi svenska namn till engelska
-        c["name_sv"] = c.get("name_sv", c["name"])
-        
-        if not c.get("name_en"):
-            swedish_name = c["name"]
-            # Mappar vanliga svenska kategorinamn till engelska
-            name_map = {
-                "Jakt": "Hunting",
-                "Allmän Jakt": "General Hunting",
-                "Jaktberättelser och Upplevelser": "Hunting Stories and Experiences",
-                "Nyheter och Uppdateringar": "News and Updates",
-                "Jaktetik och Säkerhet": "Hunting Ethics and Safety",
-                "Jaktmetoder": "Hunting Methods",
-                "Jaktformer": "Hunting Forms",
-                "Smygjakt": "Stalking",
-                "Vakjakt": "Stand Hunting",
-                "Drivjakt": "Driven Hunt",
-                "Viltarter": "Game Species",
-                "Klövvilt": "Hoofed Game",
-                "Rovdjur": "Predators",
-                "Fågeljakt": "Bird Hunting",
-                "Jakt i Olika Miljöer": "Hunting in Different Environments",
-                "Jaktresor och Internationell Jakt": "Hunting Trips and International Hunting",
-                "Utrustning för Jakt": "Hunting Equipment",
-                "Viltvård och Ekologi": "Game Management and Ecology",
-                "Jakt och Mat": "Hunting and Food",
-                "Tradition och Kultur inom Jakt": "Tradition and Culture in Hunting",
-                "Etik och Filosofi kring Jakt": "Ethics and Philosophy of Hunting",
-                "Jakthundar och Träning": "Hunting Dogs and Training",
-                "Vapen och Ammunition": "Weapons and Ammunition",
-                "Handladdning": "Reloading",
-                "Bushcraft och Prepping": "Bushcraft and Prepping",
-                "Vapenpolitik och Juridik": "Weapons Policy and Law",
-                "Marknad och Utbyte": "Market and Exchange",
-                "Gemenskap och Diskussionsämnen": "Community and Discussion Topics",
-                # Nya översättningar för återstående kategorier
-                "Jakt i Sverige": "Hunting in Sweden",
-                "Jakt i Norden": "Hunting in Scandinavia",
-                "Jakt i Europa": "Hunting in Europe",
-                "Jakt i Övriga Världen": "Hunting in the Rest of the World",
-                "Vapen och Optik": "Firearms and Optics",
-                "Kläder och Utrustning": "Clothing and Equipment",
-                "Jaktfordon": "Hunting Vehicles",
-                "Viltförvaltning": "Wildlife Management",
-                "Biotopvård": "Habitat Management",
-                "Rovdjursförvaltning": "Predator Management",
-                "Styckning och Slakt": "Butchering and Slaughtering",
-                "Viltkött och Matlagning": "Game Meat and Cooking",
-                "Förvaring och Konservering": "Storage and Preservation",
-                "Allmän Vapendiskussion": "General Firearms Discussion",
-                "Vapenrecensioner": "Firearm Reviews",
-                "Vapentyper": "Types of Firearms",
-                "Vapenvård och Underhåll": "Firearm Care and Maintenance",
-                "Ammunition": "Ammunition",
-                "Långhållsskytte": "Long-Range Shooting",
-                "Tävlingsskytte": "Competitive Shooting",
-                "Tillbehör och Utrustning": "Accessories and Equipment",
-                "Historia och Kultur": "History and Culture",
-                "Handladdning - kula": "Reloading - Bullets",
-                "Introduktion till Handladdning av kula": "Introduction to Bullet Reloading",
-                "Lagkrav och Regler för Handladdning": "Legal Requirements and Rules for Reloading",
-                "Fördelar och Nackdelar med Handladdning": "Pros and Cons of Reloading",
-                "Utrustning och Verktyg": "Equipment and Tools",
-                "Säkerhet vid Handladdning": "Reloading Safety",
-                "Recept och Tester": "Recipes and Tests",
-                "Kulor och Krut": "Bullets and Powder",
-                "Precision och Optimering": "Precision and Optimization",
-                "Handladdning - hagel": "Reloading - Shotshells",
-                "Överlevnadstekniker": "Survival Techniques",
-                "Eldstart och Matlagning": "Fire Starting and Cooking",
-                "Skydd och Boende i Naturen": "Shelter and Living in Nature",
-                "Ryggsäckar och Utrustning för Vandring": "Backpacks and Hiking Equipment",
-                "Prepping och Krisberedskap": "Prepping and Emergency Preparedness",
-                "Matlagring och Vattenförvaring": "Food Storage and Water Preservation",
-                "Krisplaner och Kommunikation": "Emergency Plans and Communication",
-                "Första Hjälpen och Medicinsk Utrustning": "First Aid and Medical Equipment",
-                "Fördjupningar och Specialämnen": "Deep Dives and Special Topics",
-                "Vapenlagar": "Firearms Laws",
-                "Sverige och Internationella Jämförelser": "Sweden and International Comparisons",
-                "Diskutera Nya Förslag": "Discussing New Proposals",
-                "Aktivism och Föreningar": "Activism and Associations",
-                "Bevara Vapenägande": "Preserving Gun Ownership",
-                "Amerikansk Vapenpolitik": "American Gun Politics",
-                "Köp och Sälj": "Buy and Sell",
-                "Jaktutbyte och Arrangemang": "Hunting Exchange and Arrangements",
-                "Specialerbjudanden och Tips": "Special Offers and Tips",
-                "Byteshandel och Donationer": "Bartering and Donations",
-                "Internationellt Utbyte": "International Exchange",
-                "Introduktioner": "Introductions",
-                "Off-Topic": "Off-Topic",
-                "Händelser och Mässor": "Events and Trade Shows",
-                "Hobbyer och Sidoprojekt": "Hobbies and Side Projects",
-                "Lokala Grupper och Gemenskaper": "Local Groups and Communities",
-                "Livsstil och Filosofi": "Lifestyle and Philosophy",
-                "Välgörenhet och Samhällsprojekt": "Charity and Community Projects"
-            }
-            c["name_en"] = name_map.get(swedish_name, swedish_name)
-        
-        # Sätt beskrivningar
-        c["description_sv"] = c.get("description_sv", c.get("description", ""))
-        
-        if not c.get("description_en"):
-            swedish_desc = c.get("description", "")
-            # Mappar vanliga svenska beskrivningar till engelska
-            desc_map = {
-                "Diskussioner om jakt, metoder, arter och utrustning": 
-                    "Discussions about hunting, methods, species and equipment",
-                "Jaktberättelser och upplevelser": 
-                    "Hunting stories and experiences",
-                "Strategier och tekniker för olika jaktformer": 
-                    "Strategies and techniques for different hunting forms"
-            }
-            c["description_en"] = desc_map.get(swedish_desc, swedish_desc)
-            
-        # Sätt namn baserat på språk
-        if language == "en":
-            c["name"] = c["name_en"]
-            c["description"] = c["description_en"]
-        elif language == "sv":
-            c["name"] = c["name_sv"]
-            c["description"] = c["description_sv"]
-            
-        results.append(c)
-    return results
+    # Färdigrenderad JSON ur kategoriträdet => ingen databasfråga per request
+    tree = await get_category_tree()
+    return Response(content=tree.json(language), media_type="application/json")
 
 # 6) get_single_category – enskild kategori
 @router.get("/categories/{category_id}", response_model=CategoryResponse)
 async def get_single_category(category_id: str, language: str = "en"):
     if not ObjectId.is_valid(category_id):
         raise HTTPException(status_code=400, detail="Ogiltigt kategori-ID-format")
-    database = await db.get_database()
-    cat_doc = await database.categories.find_one({"_id": ObjectId(category_id)})
-    if not cat_doc:
+    tree = await get_category_tree()
+    content = tree.node_json(category_id, language)
+    if content is None:
         raise HTTPException(status_code=404, detail="Kategorin hittades inte")
-    cat_doc["_id"] = str(cat_doc["_id"])
-    if cat_doc.get("parent_id"):
-        cat_doc["parent_id"] = str(cat_doc["parent_id"])
-        
-    # Lägg till språkversioner om de inte finns
-    # Här mappar vi svenska namn till engelska
-    cat_doc["name_sv"] = cat_doc.get("name_sv", cat_doc["name"])
-    
-    if not cat_doc.get("name_en"):
-        swedish_name = cat_doc["name"]
-        # Mappar vanliga svenska kategorinamn till engelska
-        name_map = {
-            "Jakt": "Hunting",
-            "Allmän Jakt": "General Hunting",
-            "Jaktberättelser och Upplevelser": "Hunting Stories and Experiences",
-            "Nyheter och Uppdateringar": "News and Updates",
-            "Jaktetik och Säkerhet": "Hunting Ethics and Safety",
-            "Jaktmetoder": "Hunting Methods",
-            "Jaktformer": "Hunting Forms",
-            "Smygjakt": "Stalking",
-            "Vakjakt": "Stand Hunting",
-            "Drivjakt": "Driven Hunt",
-            "Viltarter": "Game Species",
-            "Klövvilt": "Hoofed Game",
-            "Rovdjur": "Predators",
-            "Fågeljakt": "Bird Hunting",
-            "Jakt i Olika Miljöer": "Hunting in Different Environments",
-            "Jaktresor och Internationell Jakt": "Hunting Trips and International Hunting",
-            "Utrustning för Jakt": "Hunting Equipment",
-            "Viltvård och Ekologi": "Game Management and Ecology",
-            "Jakt och Mat": "Hunting and Food",
-            "Tradition och Kultur inom Jakt": "Tradition and Culture in Hunting",
-            "Etik och Filosofi kring Jakt": "Ethics and Philosophy of Hunting",
-            "Jakthundar och Träning": "Hunting Dogs and Training",
-            "Vapen och Ammunition": "Weapons and Ammunition",
-            "Handladdning": "Reloading",
-            "Bushcraft och Prepping": "Bushcraft and Prepping",
-            "Vapenpolitik och Juridik": "Weapons Policy and Law",
-            "Marknad och Utbyte": "Market and Exchange",
-            "Gemenskap och Diskussionsämnen": "Community and Discussion Topics",
-            # Nya översättningar för återstående kategorier
-            "Jakt i Sverige": "Hunting in Sweden",
-            "Jakt i Norden": "Hunting in Scandinavia",
-            "Jakt i Europa": "Hunting in Europe",
-            "Jakt i Övriga Världen": "Hunting in the Rest of the World",
-            "Vapen och Optik": "Firearms and Optics",
-            "Kläder och Utrustning": "Clothing and Equipment",
-            "Jaktfordon": "Hunting Vehicles",
-            "Viltförvaltning": "Wildlife Management",
-            "Biotopvård": "Habitat Management",
-            "Rovdjursförvaltning": "Predator Management",
-            "Styckning och Slakt": "Butchering and Slaughtering",
-            "Viltkött och Matlagning": "Game Meat and Cooking",
-            "Förvaring och Konservering": "Storage and Preservation",
-            "Allmän Vapendiskussion": "General Firearms Discussion",
-            "Vapenrecensioner": "Firearm Reviews",
-            "Vapentyper": "Types of Firearms",
-            "Vapenvård och Underhåll": "Firearm Care and Maintenance",
-            "Ammunition": "Ammunition",
-            "Långhållsskytte": "Long-Range Shooting",
-            "Tävlingsskytte": "Competitive Shooting",
-            "Tillbehör och Utrustning": "Accessories and Equipment",
-            "Historia och Kultur": "History and Culture",
-            "Handladdning - kula": "Reloading - Bullets",
-            "Introduktion till Handladdning av kula": "Introduction to Bullet Reloading",
-            "Lagkrav och Regler för Handladdning": "Legal Requirements and Rules for Reloading",
-            "Fördelar och Nackdelar med Handladdning": "Pros and Cons of Reloading",
-            "Utrustning och Verktyg": "Equipment and Tools",
-            "Säkerhet vid Handladdning": "Reloading Safety",
-            "Recept och Tester": "Recipes and Tests",
-            "Kulor och Krut": "Bullets and Powder",
-            "Precision och Optimering": "Precision and Optimization",
-            "Handladdning - hagel": "Reloading - Shotshells",
-            "Överlevnadstekniker": "Survival Techniques",
-            "Eldstart och Matlagning": "Fire Starting and Cooking",
-            "Skydd och Boende i Naturen": "Shelter and Living in Nature",
-            "Ryggsäckar och Utrustning för Vandring": "Backpacks and Hiking Equipment",
-            "Prepping och Krisberedskap": "Prepping and Emergency Preparedness",
-            "Matlagring och Vattenförvaring": "Food Storage and Water Preservation",
-            "Krisplaner och Kommunikation": "Emergency Plans and Communication",
-            "Första Hjälpen och Medicinsk Utrustning": "First Aid and Medical Equipment",
-            "Fördjupningar och Specialämnen": "Deep Dives and Special Topics",
-            "Vapenlagar": "Firearms Laws",
-            "Sverige och Internationella Jämförelser": "Sweden and International Comparisons",
-            "Diskutera Nya Förslag": "Discussing New Proposals",
-            "Aktivism och Föreningar": "Activism and Associations",
-            "Bevara Vapenägande": "Preserving Gun Ownership",
-            "Amerikansk Vapenpolitik": "American Gun Politics",
-            "Köp och Sälj": "Buy and Sell",
-            "Jaktutbyte och Arrangemang": "Hunting Exchange and Arrangements",
-            "Specialerbjudanden och Tips": "Special Offers and Tips",
-            "Byteshandel och Donationer": "Bartering and Donations",
-            "Internationellt Utbyte": "International Exchange",
-            "Introduktioner": "Introductions",
-            "Off-Topic": "Off-Topic",
-            "Händelser och Mässor": "Events and Trade Shows",
-            "Hobbyer och Sidoprojekt": "Hobbies and Side Projects",
-            "Lokala Grupper och Gemenskaper": "Local Groups and Communities",
-            "Livsstil och Filosofi": "Lifestyle and Philosophy",
-            "Välgörenhet och Samhällsprojekt": "Charity and Community Projects"
-        }
-        cat_doc["name_en"] = name_map.get(swedish_name, swedish_name)
-    
-    # Sätt beskrivningar
-    cat_doc["description_sv"] = cat_doc.get("description_sv", cat_doc.get("description", ""))
-    
-    if not cat_doc.get("description_en"):
-        swedish_desc = cat_doc.get("description", "")
-        # Mappar vanliga svenska beskrivningar till engelska
-        desc_map = {
-            "Diskussioner om jakt, metoder, arter och utrustning": 
-                "Discussions about hunting, methods, species and equipment",
-            "Jaktberättelser och upplevelser": 
-                "Hunting stories and experiences",
-            "Strategier och tekniker för olika jaktformer": 
-                "Strategies and techniques for different hunting forms"
-        }
-        cat_doc["description_en"] = desc_map.get(swedish_desc, swedish_desc)
-        
-    # Sätt namn baserat på språk
-    if language == "en":
-        cat_doc["name"] = cat_doc["name_en"]
-        cat_doc["description"] = cat_doc["description_en"]
-    elif language == "sv":
-        cat_doc["name"] = cat_doc["name_sv"]
-        cat_doc["description"] = cat_doc["description_sv"]
-        
-    return cat_doc
+    return Response(content=content, media_type="application/json")
 
 # =============================================================================
 # NYA ADMIN-ENDPOINTS FÖR MANUELL CRUD AV KATEGORIER
@@ -1444,9 +1075,15 @@ async def create_category(
         if not parent_cat:
             raise HTTPException(status_code=404, detail="Angiven parent-kategori finns ej.")
 
+    name = cat_in.name.strip()
+    description = cat_in.description.strip() if cat_in.description else ""
     new_doc = {
-        "name": cat_in.name.strip(),
-        "description": cat_in.description.strip() if cat_in.description else "",
+        "name": name,
+        "name_sv": name,
+        "name_en": english_name(name),
+        "description": description,
+        "description_sv": description,
+        "description_en": english_description(description),
         "type": cat_in.type.strip() if cat_in.type else "discussion",
         "parent_id": parent_obj_id,
         "threadCount": 0,
@@ -1459,6 +1096,8 @@ async def create_category(
     if not res.acknowledged:
         raise HTTPException(500, "Kunde inte skapa kategori i DB")
 
+    await invalidate_categories_cache()
+
     new_doc["_id"] = str(res.inserted_id)
     if new_doc["parent_id"]:
         new_doc["parent_id"] = str(new_doc["parent_id"])
@@ -1487,9 +1126,11 @@ async def update_category(
 
     to_set = {}
     if cat_in.name is not None:
-        to_set["name"] = cat_in.name.strip()
+        to_set["name"] = to_set["name_sv"] = cat_in.name.strip()
+        to_set["name_en"] = english_name(to_set["name"])
     if cat_in.description is not None:
-        to_set["description"] = cat_in.description.strip()
+        to_set["description"] = to_set["description_sv"] = cat_in.description.strip()
+        to_set["description_en"] = english_description(to_set["description"])
     if cat_in.type is not None:
         to_set["type"] = cat_in.type.strip()
 
@@ -1510,6 +1151,10 @@ async def update_category(
     if not to_set:
         raise HTTPException(status_code=400, detail="Inga fält att uppdatera.")
 
+    # Flytt => kategorins antal flyttas mellan föräldrarna
+    if "parent_id" in to_set and str(to_set["parent_id"] or "") != str(old_cat.get("parent_id") or ""):
+        await forum_counters.category_moved(old_cat, to_set["parent_id"])
+
     to_set["updated_at"] = datetime.utcnow()
 
     updated = await database.categories.find_one_and_update(
@@ -1519,6 +1164,7 @@ async def update_category(
     )
     if not updated:
         raise HTTPException(500, "Kunde inte uppdatera kategori i DB")
+    await invalidate_categories_cache()
 
     updated["_id"] = str(updated["_id"])
     if updated.get("parent_id"):
@@ -1555,8 +1201,32 @@ async def delete_category(
         await database.categories.delete_one({"_id": cat_id})
 
     await recursive_delete(ObjectId(category_id))
+    await forum_counters.category_deleted(cat_doc)
+    await invalidate_categories_cache()
     return {"message": "Kategorin + subkategorier raderades."}
 
+
+@router.post("/counters/reconcile")
+async def reconcile_forum_counters(
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Räknar om trådars och kategoriers antal ur posts/threads (admin).
+    Körs annars periodiskt av ForumCountersJob.
+    """
+    if "admin" not in (current_user.roles or []):
+        raise HTTPException(status_code=403, detail="Endast admin får räkna om forumantal.")
+    try:
+        summary = await forum_counters.reconcile()
+        await invalidate_categories_cache()
+        return {"message": "Forumantal omräknade.", **summary}
+    except Exception as e:
+        logger.error(f"Error reconciling forum counters: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to reconcile forum counters: {str(e)}"
+        )
+
 @router.get("/categories-with-counts", response_description="Get all categories with counts")
 async def get_categories_with_counts(language: str = "en", refresh_cache: bool = False):
     """
@@ -1585,31 +1255,23 @@ async def get_subcategories(category_id: str):
             
         database = await db.get_database()
         
-        # Find subcategories
-        cursor = database.categories.find({"parent_id": category_id})
+        # Find subcategories (parent_id kan vara ObjectId eller sträng)
+        parent_ids = [category_id, ObjectId(category_id)]
+        cursor = database.categories.find({"parent_id": {"$in": parent_ids}})
         subcategories = []
         
         async for cat in cursor:
             # Convert ObjectId to str
             cat_id = str(cat["_id"])
             
-            # Get thread count
-            thread_count = await database.threads.count_documents({"category_id": cat_id})
-            
-            # Get post count
-            thread_ids = [str(thread["_id"]) for thread in await database.threads.find({"category_id": cat_id}).to_list(None)]
-            post_count = 0
-            if thread_ids:
-                post_count = await database.posts.count_documents({"thread_id": {"$in": thread_ids}})
-            
             subcategory = {
                 "id": cat_id,
                 "name": cat["name"],
                 "description": cat["description"],
                 "english_name": cat.get("english_name", ""),
-                "parent_id": cat.get("parent_id"),
-                "thread_count": thread_count,
-                "post_count": post_count,
+                "parent_id": str(cat["parent_id"]) if cat.get("parent_id") else None,
+                "thread_count": cat.get("threadCount", 0),
+                "post_count": cat.get("postCount", 0),
                 "created_at": cat.get("created_at"),
                 "updated_at": cat.get("updated_at")
             }
@@ -1632,7 +1294,8 @@ async def get_category_threads(
     category_id: str,
     limit: int = 20,
     skip: int = 0,
-    sort: str = "latest"  # 'latest' eller 'popular'
+    sort: str = "latest",  # 'latest' eller 'popular'
+    loader: ForumLoader = Depends(get_forum_loader),
 ):
     """
     Get all threads in a specific category, with pagination and sorting
@@ -1660,14 +1323,13 @@ async def get_category_threads(
         ).skip(skip).limit(limit)
         
         threads = []
+        page = await cursor.to_list(length=limit)
         
-        async for thread in cursor:
-            # Get author info
-            author = await database.users.find_one({"_id": ObjectId(thread["author_id"])})
-            author_name = author["username"] if author else "Unknown User"
-            
-            # Get post count
-            post_count = await database.posts.count_documents({"thread_id": str(thread["_id"])})
+        # Author info för hela sidan (en fråga)
+        await loader.load_users(thread["author_id"] for thread in page)
+        
+        for thread in page:
+            author_name = loader.author_name(thread["author_id"])
             
             thread_obj = {
                 "id": str(thread["_id"]),
@@ -1676,7 +1338,7 @@ async def get_category_threads(
                 "author_name": author_name,
                 "created_at": thread["created_at"],
                 "updated_at": thread["updated_at"],
-                "reply_count": post_count - 1 if post_count > 0 else 0,  # Exclude first post as it's the thread content
+                "reply_count": thread.get("reply_count", 0),  # Underhålls av forum_counters
                 "views": thread.get("views", 0),
                 "last_activity": thread.get("last_activity", thread["created_at"]),
             }
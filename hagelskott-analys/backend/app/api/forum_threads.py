@@ -13,6 +13,8 @@ from app.models.forum_thread import ForumThread
 from app.models.user import User
 from app.utils.forum_utils import generate_english_name, upload_file
 from app.api.routes.auth import get_current_user, get_current_active_user, UserInDB
+from app.services.forum_counters import forum_counters
+from app.services.forum_loader import ForumLoader, get_forum_loader
 
 # Konfigurera logger
 logger = logging.getLogger(__name__)
@@ -82,6 +84,7 @@ async def get_threads(
     limit: int = 50,
     skip: int = 0,
     category_id: Optional[str] = None,
+    loader: ForumLoader = Depends(get_forum_loader),
 ):
     """
     Get all forum threads with optional filtering by category.
@@ -94,17 +97,14 @@ async def get_threads(
     # Sort threads by created_at in descending order
     cursor = database.threads.find(query).sort("created_at", -1).skip(skip).limit(limit)
     threads = []
+    page = await cursor.to_list(length=limit)
     
-    for thread in await cursor.to_list(length=limit):
-        # Get category info
-        category = await database.categories.find_one({"_id": ObjectId(thread["category_id"])})
-        
-        # Get author info
-        author = await database.users.find_one({"_id": ObjectId(thread["author_id"])})
-        author_name = author["username"] if author else "Unknown User"
-        
-        # Get post count
-        post_count = await database.posts.count_documents({"thread_id": str(thread["_id"])})
+    # Author + category info för hela sidan (en fråga per kollektion)
+    await loader.prime(page)
+    
+    for thread in page:
+        category = loader.category(thread["category_id"])
+        author_name = loader.author_name(thread["author_id"])
         
         thread_obj = {
             "id": str(thread["_id"]),
@@ -116,7 +116,7 @@ async def get_threads(
             "author_name": author_name,
             "created_at": thread["created_at"],
             "updated_at": thread["updated_at"],
-            "post_count": post_count,
+            "post_count": thread.get("post_count", 0),  # Underhålls av forum_counters
             "views": thread.get("views", 0),
             "last_activity": thread.get("last_activity", thread["created_at"]),
         }
@@ -165,12 +165,15 @@ async def create_thread(
         "updated_at": now,
         "views": 0,
         "last_activity": now,
+        "post_count": 0,
+        "reply_count": 0,
     }
 
     # 4) Infoga i DB
     res = await db_conn.threads.insert_one(thread_data)
     if not res.acknowledged:
         raise HTTPException(status_code=500, detail="Kunde inte skapa tråd i databasen.")
+    await forum_counters.thread_created(thread_data["category_id"])
 
     # 5) Spara ev. bifogade filer
     #    (HÄR bestämmer du hur du vill hantera filerna)
@@ -188,6 +191,7 @@ async def create_thread(
 @router.get("/threads/{thread_id}", response_description="Get a single thread")
 async def get_thread(
     thread_id: str,
+    loader: ForumLoader = Depends(get_forum_loader),
 ):
     """
     Get a single thread by ID and increment view count.
@@ -206,11 +210,9 @@ async def get_thread(
     if not thread:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found")
     
-    # Get category info
-    category = await database.categories.find_one({"_id": ObjectId(thread["category_id"])})
-    
-    # Get author info
-    author = await database.users.find_one({"_id": ObjectId(thread["author_id"])})
+    # Get category + author info
+    await loader.prime([thread])
+    category = loader.category(thread["category_id"])
     
     # Get first post content
     first_post = await database.posts.find_one(
@@ -225,7 +227,7 @@ async def get_thread(
         "category_name": category["name"] if category else "Unknown Category",
         "category_english_name": category.get("english_name", "") if category else "",
         "author_id": thread["author_id"],
-        "author_name": author["username"] if author else "Unknown User",
+        "author_name": loader.author_name(thread["author_id"]),
         "content": first_post["content"] if first_post else "",
         "created_at": thread["created_at"],
         "updated_at": thread["updated_at"],
@@ -304,8 +306,9 @@ async def delete_thread(
     if not ObjectId.is_valid(thread_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid thread ID")
     
+    database = await db.get_database()
     # Check if thread exists and user is the author
-    thread = await db.threads.find_one({"_id": ObjectId(thread_id)})
+    thread = await database.threads.find_one({"_id": ObjectId(thread_id)})
     if not thread:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found")
     
@@ -313,10 +316,12 @@ async def delete_thread(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this thread")
     
     # Delete all posts in the thread
-    await db.posts.delete_many({"thread_id": thread_id})
+    deleted_posts = await database.posts.delete_many({"thread_id": thread_id})
     
     # Delete the thread
-    await db.threads.delete_one({"_id": ObjectId(thread_id)})
+    deleted = await database.threads.delete_one({"_id": ObjectId(thread_id)})
+    if deleted.deleted_count:
+        await forum_counters.thread_deleted(thread["category_id"], deleted_posts.deleted_count)
     
     return {"message": "Thread and all its posts deleted successfully"}
 
@@ -325,6 +330,7 @@ async def get_posts(
     thread_id: str,
     skip: int = 0,
     limit: int = 50,
+    loader: ForumLoader = Depends(get_forum_loader),
 ):
     """
     Get all posts in a thread.
@@ -333,22 +339,23 @@ async def get_posts(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid thread ID")
     
     # Check if thread exists
-    thread = await db.threads.find_one({"_id": ObjectId(thread_id)})
+    thread = await loader.database.threads.find_one({"_id": ObjectId(thread_id)}, {"_id": 1})
     if not thread:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found")
     
-    cursor = db.posts.find({"thread_id": thread_id}).sort("created_at", 1).skip(skip).limit(limit)
+    cursor = loader.database.posts.find({"thread_id": thread_id}).sort("created_at", 1).skip(skip).limit(limit)
     posts = []
+    page = await cursor.to_list(length=limit)
     
-    for post in await cursor.to_list(length=limit):
-        # Get author info
-        author = await db.users.find_one({"_id": ObjectId(post["author_id"])})
-        
+    # Author info för hela sidan (en fråga)
+    await loader.load_users(post["author_id"] for post in page)
+    
+    for post in page:
         post_obj = {
             "id": str(post["_id"]),
             "content": post["content"],
             "author_id": post["author_id"],
-            "author_name": author["username"] if author else "Unknown User",
+            "author_name": loader.author_name(post["author_id"]),
             "created_at": post["created_at"],
             "updated_at": post["updated_at"],
             "attachments": post.get("attachments", []),
@@ -373,8 +380,9 @@ async def create_post(
     if not ObjectId.is_valid(thread_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid thread ID")
     
+    database = await db.get_database()
     # Check if thread exists
-    thread = await db.threads.find_one({"_id": ObjectId(thread_id)})
+    thread = await database.threads.find_one({"_id": ObjectId(thread_id)})
     if not thread:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Thread not found")
     
@@ -406,7 +414,7 @@ async def create_post(
     
     # Insert post into database
     try:
-        result = await db.posts.insert_one(post)
+        result = await database.posts.insert_one(post)
         post_id = str(result.inserted_id)
     except Exception as e:
         raise HTTPException(
@@ -415,10 +423,11 @@ async def create_post(
         )
     
     # Update thread last_activity
-    await db.threads.update_one(
+    await database.threads.update_one(
         {"_id": ObjectId(thread_id)},
         {"$set": {"last_activity": now, "updated_at": now}}
     )
+    await forum_counters.post_created(thread)
     
     return {"post_id": post_id}
 
@@ -477,8 +486,9 @@ async def delete_post(
     if not ObjectId.is_valid(post_id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid post ID")
     
+    database = await db.get_database()
     # Check if post exists and user is the author
-    post = await db.posts.find_one({"_id": ObjectId(post_id)})
+    post = await database.posts.find_one({"_id": ObjectId(post_id)})
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
     
@@ -486,7 +496,11 @@ async def delete_post(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this post")
     
     # Delete post
-    await db.posts.delete_one({"_id": ObjectId(post_id)})
+    deleted = await database.posts.delete_one({"_id": ObjectId(post_id)})
+    if deleted.deleted_count:
+        thread = await database.threads.find_one({"_id": ObjectId(post["thread_id"])}, {"category_id": 1})
+        if thread:
+            await forum_counters.post_deleted(thread)
     
     return {"message": "Post deleted successfully"}
 
@@ -550,7 +564,7 @@ async def get_hot_threads(
         # Hämta trådar från de senaste 7 dagarna
         cutoff_date = datetime.datetime.utcnow() - timedelta(days=7)
         
-        # Hämta trådar och sortera efter antal svar
+        # Hämta trådar och sortera efter antal svar (reply_count underhålls av forum_counters)
         cursor = database.threads.find({
             "created_at": {"$gte": cutoff_date}
         }).sort("reply_count", -1).limit(limit)
@@ -5,22 +5,38 @@ from fastapi import (
     HTTPException,
     Query,
     Depends,
-    Body
+    Body,
+    Response
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from bson import ObjectId
+import asyncio
+import json
 import logging
 import cv2
 import numpy as np
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.models.user import User
 from app.api.routes.auth import get_current_active_user, UserInDB
+from app.api.routes.admin import get_current_admin
 
 # Egna imports
 from app.services.pattern_analysis import PatternAnalyzer
 from app.services.image_processing import ImageProcessor
+from app.services.analysis_executor import analysis_executor
+from app.services.analysis_service import analysis_service
+from app.services.pattern_aggregates import METRICS, pattern_aggregates
+from app.services.pellet_storage import expand_results, expand_shot
+from app.services.result_pages import SORT_FIELDS, SUMMARY_PROJECTION, encode_cursor, page_query
+from app.services.upload_storage import (
+    EmptyUploadError,
+    UploadTooLargeError,
+    decode_image_file,
+    spool_upload,
+)
+from app.core.config import settings
 from app.db.mongodb import db
 # OBS: Importera RÄTT "AnalysisFilter" från schemas/analysis.py, 
 # där du har ammunition_type, gun_manufacturer, etc.
@@ -49,6 +65,41 @@ def _cast_floats(obj):
     return obj
 
 
+VALID_IMAGE_FORMATS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def _file_ext(filename: str) -> str:
+    return "." + filename.split(".")[-1].lower()
+
+
+def _batch_save_path(filename: str) -> str:
+    """
+    uploads/<ObjectId><ext>: ark i samma batch har ofta samma namn
+    (t.ex. flera "image.jpg") och spoolas samtidigt => egen sökväg per fil.
+    """
+    return f"uploads/{ObjectId()}{_file_ext(filename)}"
+
+
+def _upload_doc(filename: str, metadata: Dict[str, Any], analysis_results: Dict[str, Any],
+                image: np.ndarray, save_path: str,
+                analysis_timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Shot-dokumentet som /upload och /upload/batch sparar i 'shots'.
+    """
+    return {
+        "filename": filename,
+        "timestamp": datetime.utcnow(),
+        "metadata": metadata,
+        "analysis_results": analysis_results,
+        "analysis_timings": analysis_timings or {},
+        "image_dimensions": {
+            "width": image.shape[1],
+            "height": image.shape[0]
+        },
+        "image_path": save_path  # Viktigt för reAnalyze
+    }
+
+
 class ExtendedShotMetadata(ShotMetadata):
     """
     Extra metadata (tidigare använt):
@@ -68,74 +119,192 @@ async def upload_shot_image(
 ):
     """
     Ladda upp en hagelskottsbild + metadata.
-    1) Läser bild i OpenCV
-    2) Sparar bilden fysiskt i 'uploads/<filnamn>'
+    1) Strömmar originalet till 'uploads/<filnamn>' (storleksgräns under läsningen)
+    2) Avkodar den sparade filen i OpenCV
     3) Analyserar med (ex) sensitivity=0.5, pix_per_cm=1.0
     4) Sparar 'image_path' => reanalyze_shot kan läsa från disk
     """
     try:
-        valid_formats = {".jpg", ".jpeg", ".png", ".bmp"}
-        file_ext = "." + file.filename.split(".")[-1].lower()
-        if file_ext not in valid_formats:
+        file_ext = _file_ext(file.filename)
+        if file_ext not in VALID_IMAGE_FORMATS:
             raise HTTPException(
                 status_code=400,
                 detail=f"Ogiltigt filformat '{file_ext}'."
             )
 
-        # 1) Läs filen i minnet
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if image is None:
-            raise HTTPException(400, "Kunde ej avkoda bilden (OpenCV gav None).")
-
-        # 2) Spara bilden på disk => "uploads/<filnamn>"
+        # 1) Spara originalet på disk => "uploads/<filnamn>" (ingen omkodning)
         #    Se till att mappen "uploads" finns på servern
         save_path = f"uploads/{file.filename}"
-        cv2.imwrite(save_path, image)
+        try:
+            await spool_upload(file, save_path)
+        except (UploadTooLargeError, EmptyUploadError) as e:
+            raise HTTPException(400, str(e))
+
+        # 2) Avkoda från filen (memmap)
+        image = await asyncio.to_thread(decode_image_file, save_path)
+        if image is None:
+            raise HTTPException(400, "Kunde ej avkoda bilden (OpenCV gav None).")
 
-        # 3) Analysera i PatternAnalyzer
-        analyzer = PatternAnalyzer()
-        processed = ImageProcessor().preprocess_image(image)
-        analysis_results = analyzer.analyze_shot_pattern(
-            processed,
+        # 3) Analysera i PatternAnalyzer (processpool, blockerar ej event-loopen)
+        analysis = await analysis_executor.analyze(
+            image,
             sensitivity=0.5,   # default
-            pix_per_cm=1.0
+            pix_per_cm=1.0,
+            artifact_path=save_path
         )
-        analysis_results = _cast_floats(analysis_results)
+        analysis_results = _cast_floats(analysis["analysis_results"])
 
         # 4) Bygg doc med all metadata
-        doc = {
-            "filename": file.filename,
-            "timestamp": datetime.utcnow(),
-            "metadata": metadata.dict(),
-            "analysis_results": analysis_results,
-            "image_dimensions": {
-                "width": image.shape[1],
-                "height": image.shape[0]
-            },
-            "image_path": save_path  # Viktigt för reAnalyze
-        }
+        doc = _upload_doc(file.filename, metadata.dict(), analysis_results, image, save_path,
+                          analysis.get("analysis_timings"))
 
         db_conn = await db.get_database()
         shots_coll = db_conn["shots"]
         insert_res = await shots_coll.insert_one(doc)
+        await pattern_aggregates.sync_shot(insert_res.inserted_id)
 
         return JSONResponse(
             status_code=200,
             content={
                 "id": str(insert_res.inserted_id),
-                "results": analysis_results,
+                "results": expand_results(analysis_results),
                 "metadata": metadata.dict(),
                 "message": "Analys genomförd och sparad."
             }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Fel i /upload => {e}", exc_info=True)
         raise HTTPException(500, f"Fel vid upload_shot_image => {e}")
 
 
+@router.post("/upload/batch")
+async def upload_shot_batch(
+    files: List[UploadFile] = File(...),
+    metadata: ExtendedShotMetadata = Depends()
+):
+    """
+    Ladda upp flera bilder (t.ex. alla ark för en patron/choke) med samma
+    metadata. Bilderna avkodas parallellt och analyseras i processpoolen.
+
+    Svaret strömmas som NDJSON (en JSON-rad per händelse):
+      {"event": "result", "index", "filename", "completed", "total", "results"}
+      {"event": "error",  "index", "filename", "completed", "total", "detail"}
+      {"event": "done", "ids": [...], "comparison": {..., "pattern_similarity"}}
+    "result"/"error" kommer i den ordning analyserna blir klara. Alla lyckade
+    analyser sparas med en insert_many innan "done" skickas.
+    """
+    if not files:
+        raise HTTPException(400, "Inga filer skickades.")
+    if len(files) > settings.ANALYSIS_BATCH_MAX_FILES:
+        raise HTTPException(400, f"Max {settings.ANALYSIS_BATCH_MAX_FILES} bilder per batch.")
+    for file in files:
+        if _file_ext(file.filename) not in VALID_IMAGE_FORMATS:
+            raise HTTPException(400, f"Ogiltigt filformat i '{file.filename}'.")
+
+    meta = metadata.dict()
+    # UploadFile stängs när endpointen returnerat => spara originalen innan strömningen startar
+    filenames = [file.filename for file in files]
+    save_paths = [_batch_save_path(name) for name in filenames]
+    spooled = await asyncio.gather(
+        *(spool_upload(file, path) for file, path in zip(files, save_paths)),
+        return_exceptions=True
+    )
+
+    async def _prepare(index: int):
+        if isinstance(spooled[index], Exception):
+            raise spooled[index]
+        image = await asyncio.to_thread(decode_image_file, save_paths[index])
+        if image is None:
+            raise ValueError("Kunde ej avkoda bilden (OpenCV gav None).")
+        return image, save_paths[index]
+
+    async def _process(index: int):
+        """
+        (index, doc, None) eller (index, None, fel) – ett fel stoppar inte resten.
+        """
+        filename = filenames[index]
+        try:
+            image, save_path = await _prepare(index)
+            analysis = await analysis_executor.analyze(
+                image,
+                sensitivity=0.5,
+                pix_per_cm=1.0,
+                artifact_path=save_path
+            )
+            analysis_results = _cast_floats(analysis["analysis_results"])
+            doc = _upload_doc(filename, meta, analysis_results, image, save_path, analysis.get("analysis_timings"))
+            return index, doc, None
+        except Exception as e:
+            logger.error(f"Fel i /upload/batch ({filename}) => {e}")
+            return index, None, e
+
+    async def _stream():
+        total = len(filenames)
+        tasks = [asyncio.create_task(_process(i)) for i in range(total)]
+        docs: Dict[int, Dict[str, Any]] = {}
+        completed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, doc, error = await next_done
+                completed += 1
+                if error is not None:
+                    yield json.dumps({
+                        "event": "error",
+                        "index": index,
+                        "filename": filenames[index],
+                        "completed": completed,
+                        "total": total,
+                        "detail": str(error)
+                    }) + "\n"
+                    continue
+
+                docs[index] = doc
+                yield json.dumps({
+                    "event": "result",
+                    "index": index,
+                    "filename": doc["filename"],
+                    "completed": completed,
+                    "total": total,
+                    "results": expand_results(doc["analysis_results"])
+                }) + "\n"
+
+            ordered = [docs[i] for i in sorted(docs)]
+            ids = [None] * total
+            if ordered:
+                db_conn = await db.get_database()
+                insert_res = await db_conn["shots"].insert_many(ordered)
+                for i, inserted_id in zip(sorted(docs), insert_res.inserted_ids):
+                    ids[i] = str(inserted_id)
+                    await pattern_aggregates.sync_shot(inserted_id)
+
+            hits = [d["analysis_results"].get("hit_count", 0) for d in ordered]
+            spreads = [d["analysis_results"].get("spread", 0) for d in ordered]
+            yield json.dumps({
+                "event": "done",
+                "ids": ids,
+                "metadata": meta,
+                "comparison": {
+                    "hit_count_variance": float(np.var(hits)) if hits else 0.0,
+                    "spread_variance": float(np.var(spreads)) if spreads else 0.0,
+                    "pattern_similarity": PatternAnalyzer.calculate_pattern_similarity(ordered)
+                },
+                "message": f"{len(ordered)} av {total} bilder analyserade och sparade."
+            }, default=str) + "\n"
+
+        except Exception as e:
+            logger.error(f"Fel i /upload/batch => {e}", exc_info=True)
+            yield json.dumps({"event": "error", "detail": f"Fel vid upload_shot_batch => {e}"}) + "\n"
+        finally:
+            # Klienten kopplade ner => avbryt analyser som inte hunnit bli klara
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
 class RecoilRequest(BaseModel):
     shotWeight: float  # gram
     powderWeight: float  # gram
@@ -209,7 +378,7 @@ async def get_shot_results(shot_id: str):
         if not doc:
             raise HTTPException(404, "Analysen hittades ej.")
         doc["_id"] = str(doc["_id"])
-        return doc
+        return expand_shot(doc)
 
     except Exception as e:
         logger.error(f"Fel i get_shot_results => {e}", exc_info=True)
@@ -218,10 +387,13 @@ async def get_shot_results(shot_id: str):
 
 @router.get("/results", response_model=List[ShotAnalysisResult])
 async def get_all_results(
+    response: Response,
     limit: int = Query(10, ge=1, le=100),
     skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor från föregående sida"),
     sort_by: str = Query("timestamp", regex="^(timestamp|hit_count|spread)$"),
     sort_order: int = Query(-1, ge=-1, le=1),
+    view: str = Query("full", regex="^(full|summary)$"),
     filter_params: AnalysisFilter = Depends()
 ):
     """
@@ -230,12 +402,20 @@ async def get_all_results(
       - min_hits / max_hits
       - ammunition_type
       - gun_manufacturer, gun_model
+      - user_id
       - ...
+
+    Sidor hämtas med keyset-paginering (se result_pages): svaret har
+    huvudet X-Next-Cursor när det finns fler rader, och nästa sida hämtas
+    med ?cursor=<värdet> och samma sortering/filter. skip fungerar som
+    förut men blir långsammare ju längre in i listan man bläddrar.
+    view=summary utelämnar pellet-listorna (för listvyer).
     """
     try:
         db_conn = await db.get_database()
         shots_coll = db_conn["shots"]
         q: Dict[str, Any] = {}
+        sort_order = -1 if sort_order < 0 else 1
 
         # Datumfilter
         if filter_params.start_date or filter_params.end_date:
@@ -265,20 +445,38 @@ async def get_all_results(
         if filter_params.gun_model:
             q["metadata.shotgun.model"] = filter_params.gun_model
 
+        if filter_params.user_id:
+            q["user_id"] = filter_params.user_id
+
         # Du kan lägga fler filter om du vill
 
-        cursor = shots_coll.find(q)\
-            .sort(sort_by, sort_order)\
-            .skip(skip)\
-            .limit(limit)
+        try:
+            q = page_query(q, sort_by, sort_order, cursor)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+        projection = SUMMARY_PROJECTION if view == "summary" else None
+        # _id som andra nyckel => entydig ordning (krävs för cursorn)
+        docs = shots_coll.find(q, projection)\
+            .sort([(SORT_FIELDS[sort_by], sort_order), ("_id", sort_order)])\
+            .limit(limit + 1)
+        if skip and not cursor:
+            docs = docs.skip(skip)
+
+        page = await docs.to_list(limit + 1)
+        if len(page) > limit:
+            page = page[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(page[-1], sort_by, sort_order)
 
         results = []
-        async for doc in cursor:
+        for doc in page:
             doc["_id"] = str(doc["_id"])
-            results.append(doc)
+            results.append(expand_shot(doc))
 
         return results
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Fel i get_all_results => {e}", exc_info=True)
         raise HTTPException(500, "Kunde inte hämta listan av resultat.")
@@ -292,10 +490,14 @@ async def delete_shot_result(shot_id: str):
     try:
         db_conn = await db.get_database()
         shots_coll = db_conn["shots"]
-        res = await shots_coll.delete_one({"_id": ObjectId(shot_id)})
+        deleted = await shots_coll.find_one_and_delete(
+            {"_id": ObjectId(shot_id)},
+            projection={"aggregate_contribution": 1}
+        )
 
-        if res.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(404, "Hittade ingen att radera.")
+        await pattern_aggregates.remove_shot(deleted)
 
         return {"message": "Resultatet raderat."}
 
@@ -322,7 +524,7 @@ async def compare_shots(shot_ids: List[str] = Body(...)):
         docs = []
         async for doc in cursor:
             doc["_id"] = str(doc["_id"])
-            docs.append(doc)
+            docs.append(expand_shot(doc))
 
         if len(docs) < 2:
             raise HTTPException(404, "Några ID saknas i databasen.")
@@ -352,106 +554,143 @@ async def compare_shots(shot_ids: List[str] = Body(...)):
         raise HTTPException(500, f"Kunde inte jämföra => {e}")
 
 
+# -------------------------------- GET /aggregates --------------------------------
+
+@router.get("/aggregates")
+async def get_pattern_aggregates(
+    load: Optional[str] = None,
+    gauge: Optional[str] = None,
+    choke: Optional[str] = None,
+    distance: Optional[float] = None,
+    min_shots: int = Query(1, ge=1)
+):
+    """
+    Förberäknade resultat (medel + standardavvikelse per mått) per
+    laddning/kaliber/choke/avstånd, se pattern_aggregates.
+    """
+    try:
+        rows = await pattern_aggregates.query(load, gauge, choke, distance, min_shots)
+        return {"count": len(rows), "rows": rows}
+    except Exception as e:
+        logger.error(f"Fel i /aggregates => {e}", exc_info=True)
+        raise HTTPException(500, f"Kunde inte hämta aggregat => {e}")
+
+
+@router.get("/aggregates/best-choke")
+async def get_best_choke(
+    load: str,
+    distance: float,
+    gauge: Optional[str] = None,
+    metric: str = "pattern_density",
+    min_shots: int = Query(1, ge=1)
+):
+    """
+    Bästa choke för en laddning på ett avstånd (t.ex. ?load=Gyttorp%20Mirage&distance=35),
+    rangordnat efter metric ("max"/"min" enligt METRICS).
+    """
+    if metric not in METRICS:
+        raise HTTPException(400, f"Okänt mått '{metric}', välj bland {', '.join(METRICS)}.")
+    try:
+        return await pattern_aggregates.best_choke(load, distance, gauge, metric, min_shots)
+    except Exception as e:
+        logger.error(f"Fel i /aggregates/best-choke => {e}", exc_info=True)
+        raise HTTPException(500, f"Kunde inte hämta bästa choke => {e}")
+
+
+@router.post("/aggregates/rebuild")
+async def rebuild_pattern_aggregates(current_user: User = Depends(get_current_admin)):
+    """
+    Bygger om pattern_aggregates från 'shots' (endast admin).
+    """
+    try:
+        shots, rows = await pattern_aggregates.rebuild()
+        return {"message": "Aggregaten ombyggda.", "shots": shots, "rows": rows}
+    except Exception as e:
+        logger.error(f"Fel i /aggregates/rebuild => {e}", exc_info=True)
+        raise HTTPException(500, f"Kunde inte bygga om aggregaten => {e}")
+
+
 # -------------------------------- PATCH /hits --------------------------------
 
 class HitsUpdateModel(BaseModel):
     addedHits: Optional[List[Dict[str, float]]] = None
+    # Närmaste träff inom removeRadius px (standard HIT_SELECT_RADIUS_PX) per punkt
     removedHits: Optional[List[Dict[str, float]]] = None
+    removeRadius: Optional[float] = Field(None, gt=0)
+    # Rektangel {"x0", "y0", "x1", "y1"} resp. lasso [{"x", "y"}, ...] i procent
+    removedBox: Optional[Dict[str, float]] = None
+    removedPolygon: Optional[List[Dict[str, float]]] = None
+
+
+class HitsSelectModel(BaseModel):
+    points: Optional[List[Dict[str, float]]] = None
+    radius: Optional[float] = Field(None, gt=0)
+    box: Optional[Dict[str, float]] = None
+    polygon: Optional[List[Dict[str, float]]] = None
+
 
 @router.patch("/results/{shot_id}/hits")
 async def update_hits(shot_id: str, update_data: HitsUpdateModel):
     """
-    Lägg till / ta bort hagelträffar i 'analysis_results.individual_pellets',
-    sedan re-beräkna stats (spread, density, centroid m.m.) "offline".
+    Lägg till / ta bort hagelträffar ({"x": %, "y": %}). Borttagning sker med
+    skottets rumsliga index (närmaste träff, rektangel eller lasso), så
+    klienten behöver inte skicka exakta koordinater. Statistiken (centrum,
+    spridning, zoner, kvadranter m.m.) uppdateras inkrementellt med en riktad
+    uppdatering, se AnalysisService.edit_hits.
     """
     try:
-        db_conn = await db.get_database()
-        shots_coll = db_conn["shots"]
-        doc = await shots_coll.find_one({"_id": ObjectId(shot_id)})
-        if not doc:
-            raise HTTPException(404, "Analysen saknas.")
-
-        if "analysis_results" not in doc:
-            doc["analysis_results"] = {}
-        if "individual_pellets" not in doc["analysis_results"]:
-            doc["analysis_results"]["individual_pellets"] = []
-
-        pellets = doc["analysis_results"]["individual_pellets"]
-
-        # 1) add
-        if update_data.addedHits:
-            for h in update_data.addedHits:
-                pellets.append({"x": float(h["x"]), "y": float(h["y"])})
-
-        # 2) remove
-        if update_data.removedHits:
-            remove_set = {(float(r["x"]), float(r["y"])) for r in update_data.removedHits}
-            pellets = [
-                p for p in pellets
-                if (float(p["x"]), float(p["y"])) not in remove_set
-            ]
-
-        doc["analysis_results"]["individual_pellets"] = pellets
-        new_count = len(pellets)
-        doc["analysis_results"]["hit_count"] = new_count
-
-        w = doc["analysis_results"].get("image_dimensions", {}).get("width", 0)
-        h = doc["analysis_results"].get("image_dimensions", {}).get("height", 0)
-
-        if w > 0 and h > 0 and new_count > 0:
-            import numpy as np
-            from app.services.pattern_analysis import Point
-
-            point_list = []
-            for p in pellets:
-                px = (p["x"] / 100.0) * w
-                py = (p["y"] / 100.0) * h
-                point_list.append(Point(px, py))
-
-            if point_list:
-                arr = np.array([[pt.x, pt.y] for pt in point_list], dtype=np.float32)
-                c = np.mean(arr, axis=0)
-                dists = np.linalg.norm(arr - c, axis=1)
-
-                doc["analysis_results"]["spread"] = float(np.std(dists))
-                max_dist = float(np.max(dists))
-                area = np.pi * (max_dist ** 2)
-                dens = float(new_count / area) if area > 0 else 0.0
-
-                doc["analysis_results"]["centroid"] = {
-                    "x": round((c[0] / w) * 100, 2),
-                    "y": round((c[1] / h) * 100, 2)
-                }
-                doc["analysis_results"]["pattern_radius"] = round(max_dist, 2)
-                doc["analysis_results"]["pattern_density"] = round(dens, 4)
-
-                # ex. offline zoneAnalysis
-                doc["analysis_results"]["zone_analysis"] = {}
-        else:
-            # Om inga pellets / ingen dimension => enbart uppdatera hit_count
-            pass
-
-        doc["analysis_results"] = _cast_floats(doc["analysis_results"])
-        await shots_coll.update_one(
+        doc, summary = await analysis_service.edit_hits(
             {"_id": ObjectId(shot_id)},
-            {
-                "$set": {
-                    "analysis_results": doc["analysis_results"],
-                    "updated_at": datetime.utcnow()
-                }
-            }
+            added=update_data.addedHits,
+            removed=update_data.removedHits,
+            projection={"analysis_results.hit_count": 1},
+            radius=update_data.removeRadius,
+            box=update_data.removedBox,
+            polygon=update_data.removedPolygon
         )
+        if not doc:
+            raise HTTPException(404, "Analysen saknas.")
 
         return {
             "message": "Hagelträffar uppdaterade.",
-            "totalHits": len(pellets)
+            "totalHits": summary.get("hit_count", doc.get("analysis_results", {}).get("hit_count", 0)),
+            "added": summary.get("added", 0),
+            "removed": summary.get("removed", 0)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[update_hits] => {e}", exc_info=True)
         raise HTTPException(500, f"Kunde inte uppdatera hagelträffar => {e}")
 
 
+@router.post("/results/{shot_id}/hits/select")
+async def select_hits(shot_id: str, selection: HitsSelectModel):
+    """
+    Vilka träffar ett urval (närmaste inom radius, rektangel, lasso) skulle
+    ta bort, utan att ändra något => förhandsvisning i editorn. Använder
+    samma cachade index som PATCH /hits.
+    """
+    try:
+        hits = await analysis_service.find_hits(
+            {"_id": ObjectId(shot_id)},
+            points=selection.points,
+            radius=selection.radius,
+            box=selection.box,
+            polygon=selection.polygon
+        )
+        if hits is None:
+            raise HTTPException(404, "Analysen saknas.")
+        return {"count": len(hits), "hits": hits}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[select_hits] => {e}", exc_info=True)
+        raise HTTPException(500, f"Kunde inte välja hagelträffar => {e}")
+
+
 # -------------------------------- PATCH /ring --------------------------------
 
 class RingUpdateModel(BaseModel):
@@ -508,6 +747,33 @@ class ReAnalyzeModel(BaseModel):
     sensitivity: float = 0.5
     pixPerCm: float = 1.0
 
+async def _analyze_from_path(image_path: str, sensitivity: float, pix_per_cm: float) -> Dict[str, Any]:
+    """
+    Reanalys av en sparad bild: i första hand från de sparade artefakterna
+    (bara filtrering, millisekunder), annars full analys som samtidigt
+    skapar artefakterna till nästa gång.
+    """
+    analysis = await analysis_executor.refilter(
+        image_path,
+        sensitivity=sensitivity,
+        pix_per_cm=pix_per_cm
+    )
+    if analysis is not None:
+        return analysis
+
+    image = await asyncio.to_thread(cv2.imread, image_path)
+    if image is None:
+        raise HTTPException(400, f"Kunde ej läsa bild: {image_path}")
+
+    return await analysis_executor.analyze(
+        image,
+        sensitivity=sensitivity,
+        pix_per_cm=pix_per_cm,
+        use_cache=False,
+        artifact_path=image_path
+    )
+
+
 @router.patch("/results/{shot_id}/reanalyze")
 async def reanalyze_shot(shot_id: str, body: ReAnalyzeModel):
     """
@@ -527,39 +793,62 @@ async def reanalyze_shot(shot_id: str, body: ReAnalyzeModel):
         if not image_path:
             raise HTTPException(400, "Ingen image_path => kan ej reAnalyze.")
 
-        image = cv2.imread(image_path)
-        if image is None:
-            raise HTTPException(400, f"Kunde ej läsa bild: {image_path}")
-
-        processed = ImageProcessor().preprocess_image(image)
-        analyzer = PatternAnalyzer()
-
-        new_res = analyzer.analyze_shot_pattern(
-            processed,
-            sensitivity=body.sensitivity,
-            pix_per_cm=body.pixPerCm
-        )
-        new_res = _cast_floats(new_res)
+        analysis = await _analyze_from_path(image_path, body.sensitivity, body.pixPerCm)
+        new_res = _cast_floats(analysis["analysis_results"])
 
         doc["analysis_results"] = new_res
-        doc["analysis_results"]["image_dimensions"] = {
-            "width": image.shape[1],
-            "height": image.shape[0]
-        }
+        doc["analysis_timings"] = analysis.get("analysis_timings") or {}
 
         await shots_coll.update_one(
             {"_id": ObjectId(shot_id)},
             {
                 "$set": {
                     "analysis_results": doc["analysis_results"],
+                    "analysis_timings": doc["analysis_timings"],
                     "updated_at": datetime.utcnow()
                 }
             }
         )
+        await pattern_aggregates.sync_shot(doc["_id"])
 
         doc["_id"] = str(doc["_id"])
-        return doc
+        return expand_shot(doc)
 
     except Exception as e:
         logger.error(f"Fel i reanalyze_shot => {e}", exc_info=True)
         raise HTTPException(500, f"Kunde inte reanalysera => {e}")
+
+
+@router.get("/results/{shot_id}/preview")
+async def preview_reanalysis(
+    shot_id: str,
+    sensitivity: float = Query(0.5, ge=0.0, le=1.0),
+    pixPerCm: float = Query(1.0, gt=0.0)
+):
+    """
+    Förhandsvisning för sensitivity-reglaget i UI:t => samma resultat som
+    PATCH /reanalyze men sparas inte. Körs från artefakterna => millisekunder.
+    """
+    try:
+        db_conn = await db.get_database()
+        doc = await db_conn["shots"].find_one({"_id": ObjectId(shot_id)}, {"image_path": 1})
+        if not doc:
+            raise HTTPException(404, "Analysen saknas.")
+
+        image_path = doc.get("image_path")
+        if not image_path:
+            raise HTTPException(400, "Ingen image_path => kan ej förhandsvisa.")
+
+        analysis = await _analyze_from_path(image_path, sensitivity, pixPerCm)
+        return {
+            "id": shot_id,
+            "sensitivity": sensitivity,
+            "pixPerCm": pixPerCm,
+            "analysis_results": expand_results(_cast_floats(analysis["analysis_results"]))
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Fel i preview_reanalysis => {e}", exc_info=True)
+        raise HTTPException(500, f"Kunde inte förhandsvisa => {e}")
@@ -179,7 +179,7 @@ class ShotAnalysisResult(BaseModel):
 class AnalysisFilter(BaseModel):
     """
     Filter-klass: start_date, end_date, min_hits, max_hits, 
-    ammunition_type, gun_manufacturer, gun_model, etc.
+    ammunition_type, gun_manufacturer, gun_model, user_id, etc.
     """
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
@@ -189,6 +189,7 @@ class AnalysisFilter(BaseModel):
     ammunition_type: Optional[str] = None
     gun_manufacturer: Optional[str] = None
     gun_model: Optional[str] = None
+    user_id: Optional[str] = None
     choke_type: Optional[ChokeName] = None
     shot_material: Optional[ShotMaterial] = None
     distance_range: Optional[Dict[str, int]] = None
@@ -48,6 +48,7 @@ class Settings(BaseSettings):
     # =================== Fil- och bildhantering ===================
     UPLOAD_DIR: Path = Path("uploads")
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10 MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024     # 1 MB per läsning vid strömmande uppladdning
     ALLOWED_IMAGE_TYPES: List[str] = ["image/jpeg", "image/png", "image/bmp", "image/webp"]
     IMAGE_QUALITY: int = 85           # JPEG-kvalitet
     MAX_IMAGE_DIMENSION: int = 1024   # Max bred/höjd för uppladdade bilder
@@ -80,15 +81,65 @@ class Settings(BaseSettings):
         ],
     }
 
+    # Antal arbetsprocesser för bildanalysen (0 => kör i trådpool i samma process)
+    ANALYSIS_WORKERS: int = 2
+    # Jobbkö för analyser (collection 'analysis_jobs')
+    ANALYSIS_JOB_WORKERS: int = 2           # antal bakgrundsarbetare per process
+    ANALYSIS_JOB_LEASE_SECONDS: int = 120   # hur länge ett taget jobb är låst
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = 3
+    ANALYSIS_JOB_RETENTION_DAYS: int = 7    # TTL för färdiga jobb
+    # Periodisk omräkning av user_statistics ur shots (sekunder, 0 => av)
+    USER_STATS_REFRESH_INTERVAL: int = 6 * 60 * 60
+    # Max antal rader per fråga mot pattern_aggregates
+    PATTERN_AGGREGATES_MAX_ROWS: int = 500
+    # Batch-uppladdning (/api/analysis/upload/batch)
+    ANALYSIS_BATCH_MAX_FILES: int = 20
+    # ROI-läge: hitta målet på grov nivå och analysera bara det området
+    ANALYSIS_ROI_MODE: bool = False
+    ANALYSIS_ROI_COARSE_DIMENSION: int = 512   # px, grovnivån för lokaliseringen
+    ANALYSIS_ROI_MARGIN: float = 0.03          # marginal runt ringen / indrag från arkets kant (andel av längsta sidan)
+    ANALYSIS_ROI_MIN_GAIN: float = 0.15        # beskär bara om minst 15 % av ytan försvinner
+    # Rutläge: full upplösning (högupplösta skanningar), detektering per ruta i trådpool
+    ANALYSIS_TILED_MODE: bool = False
+    ANALYSIS_TILED_MAX_DIMENSION: int = 12000  # pipelinens max_dimension i rutläget
+    ANALYSIS_TILE_SIZE: int = 1024             # px per ruta (utan överlapp)
+    ANALYSIS_TILE_OVERLAP: int = 96            # px per sida, > största pellet + filtrens räckvidd
+    ANALYSIS_TILE_WORKERS: int = 0             # trådar per process, 0 => kärnor / ANALYSIS_WORKERS
+    # Steg-tider (GET /api/health/analysis-timings): antal analyser i p50/p95-fönstret
+    ANALYSIS_TIMINGS_WINDOW: int = 1000
+
     # =================== Cache ===================
     CACHE_TTL: int = 3600  # sekunder
     ENABLE_CACHE: bool = True
+    # Analysresultat (collection 'analysis_cache' + LRU i processen)
+    ANALYSIS_CACHE_TTL: int = 7 * 24 * 60 * 60  # sekunder
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 256
+    # Rumsligt index per skott vid träffredigering (pellet_index)
+    HIT_INDEX_CACHE_MAX_ENTRIES: int = 128
+    HIT_INDEX_CACHE_TTL: int = 30 * 60  # sekunder sedan senaste användning
+    HIT_INDEX_CELL_PX: float = 32.0
+    HIT_SELECT_RADIUS_PX: float = 8.0   # "ta bort närmaste träff" inom så många px
+
+    # =================== Forum ===================
+    # Omräkning av trådars/kategoriers antal (forum_counters), sekunder, 0 => av
+    FORUM_COUNTERS_RECONCILE_INTERVAL: int = 24 * 60 * 60
+    # Kategorilistan (SharedCache): TTL i processen, och hur ofta 'cache_versions'
+    # läses => hur snabbt en ändring i en process syns i de andra
+    FORUM_CATEGORY_CACHE_TTL: int = 5 * 60
+    CACHE_VERSION_CHECK_INTERVAL: float = 1.0
 
     # =================== Loggning ===================
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     LOG_FILE: Optional[Path] = Path("logs/app.log")
 
+    # =================== Profilering ===================
+    # En enskild request profileras när PROFILING_HEADER skickas med PROFILING_TOKEN
+    PROFILING_ENABLED: bool = False
+    PROFILING_HEADER: str = "X-Profile"
+    PROFILING_TOKEN: Optional[str] = None
+    PROFILING_DIR: Path = Path("logs/profiles")
+
     # =================== Prestanda & databaspoolning ===================
     WORKER_COUNT: int = 4
     BATCH_SIZE: int = 100
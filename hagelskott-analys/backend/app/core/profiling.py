@@ -0,0 +1,131 @@
+"""
+Profilering av en enskild request.
+
+Med PROFILING_ENABLED profileras requests som skickar headern
+PROFILING_HEADER (värdet måste vara PROFILING_TOKEN om en sådan är satt).
+Requesten körs under pyinstrument om paketet finns installerat (HTML-rapport),
+annars under cProfile (.prof, öppnas med snakeviz/pstats). Rapporten sparas
+i PROFILING_DIR och filnamnet returneras i svarshuvudet X-Profile-File.
+
+Profileraren följer event-loopens tråd, dvs. även andra requests som råkar
+köras samtidigt syns i rapporten. Bildanalysen körs i AnalysisExecutor
+(annan process/tråd) och profileras därför separat med cProfile till
+<samma namn>.worker.prof (se profile_target). Svar som strömmas mäts bara
+fram till att headers skickas.
+"""
+import asyncio
+import cProfile
+import hmac
+import logging
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+from fastapi import Request
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:  # valfritt beroende
+    _Pyinstrument = None
+
+# Sökväg (utan filändelse) för den request som profileras just nu
+_profile_target: ContextVar[Optional[str]] = ContextVar("profile_target", default=None)
+# En profilerare per tråd => en profilerad request åt gången
+_lock = asyncio.Lock()
+
+
+def profiling_requested(request: Request) -> bool:
+    if not settings.PROFILING_ENABLED:
+        return False
+    value = request.headers.get(settings.PROFILING_HEADER)
+    if value is None:
+        return False
+    if settings.PROFILING_TOKEN:
+        return hmac.compare_digest(value, settings.PROFILING_TOKEN)
+    return True
+
+
+def profile_target(suffix: str = "") -> Optional[str]:
+    """
+    Filnamn för en delprofil (t.ex. ".worker.prof") till den request som
+    profileras, None om ingen profilering pågår.
+    """
+    target = _profile_target.get()
+    return f"{target}{suffix}" if target else None
+
+
+@contextmanager
+def profile_to(path: Optional[str]) -> Iterator[None]:
+    """
+    cProfile runt blocket => path. path None => ingen profilering.
+    Används i analysens arbetsprocess/-tråd.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+        except Exception as e:
+            logger.warning(f"[profiling] Kunde ej spara {path} => {e}")
+
+
+def _target_for(request: Request) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", request.url.path).strip("-") or "root"
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{stamp}_{request.method.lower()}_{slug[:80]}"
+
+
+async def profile_request(request: Request, call_next):
+    """
+    Kör call_next under profileraren och sparar rapporten. Pågår redan en
+    profilering körs requesten som vanligt (utan X-Profile-File).
+    """
+    if _lock.locked():
+        return await call_next(request)
+    async with _lock:
+        return await _profile(request, call_next)
+
+
+async def _profile(request: Request, call_next):
+    target = _target_for(request)
+    token = _profile_target.set(str(target))
+    try:
+        if _Pyinstrument is not None:
+            profiler = _Pyinstrument(async_mode="disabled")
+            profiler.start()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.stop()
+            report = target.with_name(target.name + ".html")
+            await asyncio.to_thread(report.write_text, profiler.output_html(), encoding="utf-8")
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+            report = target.with_name(target.name + ".prof")
+            await asyncio.to_thread(profiler.dump_stats, str(report))
+    finally:
+        _profile_target.reset(token)
+
+    logger.info(f"[profiling] {request.method} {request.url.path} => {report}")
+    response.headers["X-Profile-File"] = report.name
+    return response
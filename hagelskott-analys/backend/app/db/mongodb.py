@@ -56,10 +56,44 @@ class MongoDB:
                 # Exempel: Index för "shots"
                 # ---------------------------------------------------
                 await self.database.shots.create_index([("userId", 1)])
-                await self.database.shots.create_index([("timestamp", -1)])
                 await self.database.shots.create_index([("metadata.shotgun.gauge", 1)])
                 await self.database.shots.create_index([("metadata.distance", 1)])
 
+                # GET /results: keyset-paginering på (sorteringsfält, _id), se result_pages.
+                # Likhetsfilter först, sedan sorteringen; user_id-indexen täcker även
+                # frågor på bara user_id (statistik, omräkning).
+                for sort_field in ("timestamp", "analysis_results.hit_count", "analysis_results.spread"):
+                    await self.database.shots.create_index([(sort_field, -1), ("_id", -1)])
+                    await self.database.shots.create_index([("user_id", 1), (sort_field, -1), ("_id", -1)])
+                await self.database.shots.create_index(
+                    [("metadata.ammunition.type", 1), ("timestamp", -1), ("_id", -1)]
+                )
+                await self.database.shots.create_index(
+                    [("metadata.shotgun.manufacturer", 1), ("metadata.shotgun.model", 1),
+                     ("timestamp", -1), ("_id", -1)]
+                )
+
+                # user_statistics (ett dokument per användare, $merge på user_id)
+                await self.database.user_statistics.create_index([("user_id", 1)], unique=True)
+
+                # pattern_aggregates (en rad per laddning/kaliber/choke/avstånd)
+                await self.database.pattern_aggregates.create_index([("load", 1), ("distance", 1), ("gauge", 1)])
+
+                # analysis_jobs (jobbkö: claim-sortering, lease-utgång, polling per user)
+                await self.database.analysis_jobs.create_index([("status", 1), ("created_at", 1)])
+                await self.database.analysis_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+                await self.database.analysis_jobs.create_index([("user_id", 1), ("created_at", -1)])
+                await self.database.analysis_jobs.create_index(
+                    [("finished_at", 1)],
+                    expireAfterSeconds=settings.ANALYSIS_JOB_RETENTION_DAYS * 24 * 60 * 60
+                )
+
+                # analysis_cache (innehållsadresserade analysresultat)
+                await self.database.analysis_cache.create_index(
+                    [("created_at", 1)],
+                    expireAfterSeconds=settings.ANALYSIS_CACHE_TTL
+                )
+
                 # user_settings
                 await self.database.user_settings.create_index([("user_id", 1)], unique=True)
 
@@ -106,6 +140,8 @@ class MongoDB:
                 await self.database.threads.create_index([("category_id", 1)])
                 await self.database.threads.create_index([("author_id", 1)])
                 await self.database.threads.create_index([("created_at", -1)])
+                # /hot: sortering på reply_count (forum_counters) inom senaste veckan
+                await self.database.threads.create_index([("reply_count", -1), ("created_at", -1)])
                 # posts
                 await self.database.posts.create_index([("thread_id", 1)])
                 await self.database.posts.create_index([("author_id", 1)])
@@ -0,0 +1,161 @@
+"""
+Sparade mellanresultat ("artefakter") bredvid uppladdade bilder.
+
+En reanalys med ny sensitivity/pixPerCm ändrar bara filtreringen i
+PatternAnalyzer (area/cirkularitet) och skalningen till cm. Allt dyrt före
+det (avkodning, förbehandling, brusreducering, ring, tröskling, konturer)
+är detsamma. Vid första analysen sparas därför:
+
+  <bild utan ändelse>.frame.npy       förbehandlad gråskalebild (uint8),
+                                      läses med mmap
+  <bild utan ändelse>.candidates.npz  kandidattabell (area, perimeter, cx, cy),
+                                      ring, tider, bildmått, image_quality, samt
+                                      bildens beskärning (ROI-läge)
+
+Båda märks med fingeravtryck av förbehandlingens resp. analysens parametrar.
+Stämmer inte kandidaternas fingeravtryck men bildens gör det räknas
+kandidaterna om från den sparade bilden; annars ignoreras artefakterna.
+"""
+import json
+import logging
+import os
+from functools import lru_cache
+from hashlib import sha256
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.services.preprocessing import PreprocessedFrame
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = "2"
+
+
+def artifact_paths(image_path: str) -> Tuple[str, str]:
+    base, _ = os.path.splitext(str(image_path))
+    return f"{base}.frame.npy", f"{base}.candidates.npz"
+
+
+@lru_cache(maxsize=1)
+def current_fingerprints() -> Tuple[str, str]:
+    """
+    (frame_fingerprint, candidates_fingerprint) för aktuell kod + settings.
+    """
+    from app.services.image_processing import ImageProcessor
+    from app.services.pattern_analysis import PatternAnalyzer
+
+    pipeline = ImageProcessor().pipeline.describe()
+    analyzer = PatternAnalyzer().describe()
+    frame_fp = sha256(json.dumps([ARTIFACT_VERSION, pipeline], sort_keys=True).encode()).hexdigest()
+    candidates_fp = sha256(json.dumps([frame_fp, analyzer], sort_keys=True).encode()).hexdigest()
+    return frame_fp, candidates_fp
+
+
+def _atomic_write(path: str, writer) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        writer(fh)
+    os.replace(tmp_path, path)
+
+
+def save_artifacts(
+    image_path: str,
+    frame: PreprocessedFrame,
+    candidates: Dict[str, Any],
+    image_quality: Dict[str, Any],
+    write_frame: bool = True
+) -> None:
+    """
+    Sparar bild + kandidater bredvid image_path. write_frame=False => bara
+    kandidaterna skrivs om (bilden på disk är redan aktuell).
+    """
+    frame_path, candidates_path = artifact_paths(image_path)
+    frame_fp, candidates_fp = current_fingerprints()
+
+    if write_frame:
+        _atomic_write(frame_path, lambda fh: np.save(fh, np.ascontiguousarray(frame.image)))
+
+    full_size = frame.full_size or (0, 0)
+
+    ring = candidates.get("ring") or {}
+    _atomic_write(
+        candidates_path,
+        lambda fh: np.savez_compressed(
+            fh,
+            features=np.asarray(candidates["features"], dtype=np.float64),
+            size=np.array([candidates["width"], candidates["height"]], dtype=np.int64),
+            ring=np.array(json.dumps(ring)),
+            timings=np.array(json.dumps(candidates.get("timings") or {})),
+            image_quality=np.array(json.dumps(image_quality)),
+            frame_roi=np.array([*frame.offset, *full_size], dtype=np.int64),
+            frame_fingerprint=np.array(frame_fp),
+            candidates_fingerprint=np.array(candidates_fp),
+        )
+    )
+
+
+def has_artifacts(image_path: str) -> bool:
+    """
+    Finns båda filerna? (Fingeravtrycken kontrolleras först vid läsning.)
+    """
+    return all(os.path.exists(path) for path in artifact_paths(image_path))
+
+
+def load_frame(image_path: str) -> Optional[PreprocessedFrame]:
+    """
+    Förbehandlad bild (read-only memmap) + ev. beskärning, None om den
+    saknas eller är inaktuell.
+    """
+    frame_path, candidates_path = artifact_paths(image_path)
+    if not (os.path.exists(frame_path) and os.path.exists(candidates_path)):
+        return None
+    try:
+        with np.load(candidates_path) as data:
+            if str(data["frame_fingerprint"]) != current_fingerprints()[0]:
+                return None
+            offset_x, offset_y, full_w, full_h = (int(v) for v in data["frame_roi"])
+        image = np.asarray(np.load(frame_path, mmap_mode="r"))
+        return PreprocessedFrame(
+            image=image,
+            denoised=image,
+            offset=(offset_x, offset_y),
+            full_size=(full_w, full_h) if full_w and full_h else None
+        )
+    except Exception as e:
+        logger.warning(f"[analysis_artifacts] Kunde ej läsa {frame_path} => {e}")
+        return None
+
+
+def load_candidates(image_path: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    (candidates, image_quality) om kandidaterna finns och är aktuella, annars None.
+    """
+    _, candidates_path = artifact_paths(image_path)
+    if not os.path.exists(candidates_path):
+        return None
+    try:
+        with np.load(candidates_path) as data:
+            if str(data["candidates_fingerprint"]) != current_fingerprints()[1]:
+                return None
+            width, height = (int(v) for v in data["size"])
+            candidates = {
+                "features": data["features"],
+                "ring": json.loads(str(data["ring"])),
+                "timings": json.loads(str(data["timings"])),
+                "width": width,
+                "height": height,
+            }
+            image_quality = json.loads(str(data["image_quality"]))
+        return candidates, image_quality
+    except Exception as e:
+        logger.warning(f"[analysis_artifacts] Kunde ej läsa {candidates_path} => {e}")
+        return None
+
+
+def remove_artifacts(image_path: str) -> None:
+    for path in artifact_paths(image_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,181 @@
+"""
+Innehållsadresserad cache för analysresultat.
+
+Samma målbild laddas ofta upp flera gånger och reanalyze_shot kör om hela
+pipelinen även när sensitivity/pixPerCm är oförändrade. Nyckeln byggs av
+ - SHA-256 över bildens pixlar (form + dtype + data)
+ - förbehandlingens parametrar (PreprocessingPipeline.describe(),
+   BLUR_KERNEL_SIZE, ADAPTIVE_*)
+ - analysparametrar (PatternAnalyzer.describe() inkl. VERSION,
+   sensitivity, pix_per_cm)
+=> ändras en version eller parameter blir det nya nycklar och gamla poster
+   åldras ut via TTL-indexet.
+
+Två nivåer:
+ 1) LRU i processen (OrderedDict, ANALYSIS_CACHE_MAX_ENTRIES)
+ 2) MongoDB-collection 'analysis_cache' med TTL (ANALYSIS_CACHE_TTL)
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.mongodb import db
+
+logger = logging.getLogger(__name__)
+
+
+def _to_bson(obj: Any) -> Any:
+    """
+    Numpy-skalärer/arrayer => Python-typer så att resultatet kan sparas i MongoDB.
+    """
+    if isinstance(obj, dict):
+        return {str(k): _to_bson(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_bson(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _hash_image(image: np.ndarray) -> str:
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256()
+    digest.update(f"{image.shape}|{image.dtype.str}|".encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    AnalysisCache
+    -------------
+    get()/set() tar emot den avkodade bilden + analysparametrarna. Fel mot
+    MongoDB loggas men stoppar aldrig analysen (cachen är bara en genväg).
+    """
+
+    COLLECTION = "analysis_cache"
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.enabled = settings.ENABLE_CACHE
+        self.max_entries = settings.ANALYSIS_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._fingerprint: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------------------------
+    # Nycklar
+    # -------------------------------------------------
+    def _parameter_fingerprint(self) -> str:
+        """
+        Hash över alla versioner/parametrar som påverkar resultatet.
+        Beräknas en gång per process (parametrarna ändras inte i drift).
+        """
+        if self._fingerprint is None:
+            from app.services.image_processing import ImageProcessor
+            from app.services.pattern_analysis import PatternAnalyzer
+
+            payload = {
+                "preprocessing": ImageProcessor().pipeline.describe(),
+                "analyzer": PatternAnalyzer().describe(),
+                "settings": {
+                    "blur_kernel_size": list(settings.BLUR_KERNEL_SIZE),
+                    "adaptive_block_size": settings.ADAPTIVE_BLOCK_SIZE,
+                    "adaptive_c": settings.ADAPTIVE_C,
+                },
+            }
+            self._fingerprint = hashlib.sha256(
+                json.dumps(payload, sort_keys=True).encode()
+            ).hexdigest()
+        return self._fingerprint
+
+    async def make_key(self, image: np.ndarray, sensitivity: float, pix_per_cm: float) -> str:
+        # sha256 släpper GIL => hashningen av stora bilder körs i tråd
+        image_hash = await asyncio.to_thread(_hash_image, image)
+        raw = f"{image_hash}|{self._parameter_fingerprint()}|{float(sensitivity)!r}|{float(pix_per_cm)!r}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # -------------------------------------------------
+    # Läs / skriv
+    # -------------------------------------------------
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry)
+
+        try:
+            db_conn = await db.get_database()
+            doc = await db_conn[self.COLLECTION].find_one({"_id": key})
+        except Exception as e:
+            logger.warning(f"[AnalysisCache] Kunde ej läsa cache från MongoDB => {e}")
+            doc = None
+
+        if not doc:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        result = doc["result"]
+        self._remember(key, result)
+        return copy.deepcopy(result)
+
+    async def set(self, key: str, result: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+
+        result = _to_bson(result)
+        self._remember(key, result)
+
+        try:
+            db_conn = await db.get_database()
+            await db_conn[self.COLLECTION].replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "result": result,
+                    "fingerprint": self._parameter_fingerprint(),
+                    "created_at": datetime.utcnow(),
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"[AnalysisCache] Kunde ej spara cache i MongoDB => {e}")
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._lru[key] = copy.deepcopy(result)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._lru),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Singleton-instans (används av AnalysisExecutor.analyze)
+analysis_cache = AnalysisCache()
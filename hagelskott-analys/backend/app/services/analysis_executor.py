@@ -0,0 +1,381 @@
+"""
+Processpool för bildanalysen.
+
+ImageProcessor.preprocess_image + PatternAnalyzer.analyze_shot_pattern är ren
+CPU-tung OpenCV-kod (fastNlMeansDenoising, HoughCircles, konturer). Körs den
+direkt i en `async def`-route fryser hela event-loopen för alla andra requests.
+
+AnalysisExecutor lämnar därför över den avkodade bilden till en pool av
+arbetsprocesser via delat minne (ingen pickling av stora arrayer) och väntar
+asynkront på resultatet. Varje arbetsprocess har egna "varma" instanser av
+ImageProcessor och PatternAnalyzer.
+
+Varje beräknat resultat får analysis_timings (ms per steg, se
+app.services.timing) som också förs in i analysis_timing_stats.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.core.profiling import profile_target, profile_to
+from app.services.analysis_artifacts import has_artifacts, load_candidates, load_frame, save_artifacts
+from app.services.analysis_cache import analysis_cache
+from app.services.timing import StageTimer, analysis_timing_stats
+
+logger = logging.getLogger(__name__)
+
+# Per-process-instanser (skapas i _init_worker resp. vid första fallback-körningen)
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker() -> None:
+    """
+    Körs en gång i varje arbetsprocess. Skapar analysinstanserna så att
+    de inte behöver byggas upp per bild.
+    """
+    from app.services.image_processing import ImageProcessor
+    from app.services.pattern_analysis import PatternAnalyzer
+
+    # En OpenCV-tråd per process => poolen skalar över kärnor utan överbokning
+    if multiprocessing.parent_process() is not None:
+        cv2.setNumThreads(1)
+
+    _worker_state["image_processor"] = ImageProcessor()
+    _worker_state["pattern_analyzer"] = PatternAnalyzer()
+
+
+def _run_pipeline(
+    image: np.ndarray,
+    sensitivity: float,
+    pix_per_cm: float,
+    artifact_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Förbehandling + kvalitetsmått + mönsteranalys för en bild.
+    Med artifact_path sparas förbehandlad bild + kandidater bredvid bilden
+    (se analysis_artifacts) så att reanalys kan hoppa över de dyra stegen.
+    """
+    if not _worker_state:
+        _init_worker()
+
+    image_processor = _worker_state["image_processor"]
+    if multiprocessing.parent_process() is not None:
+        pattern_analyzer = _worker_state["pattern_analyzer"]
+    else:
+        # Trådläge (ANALYSIS_WORKERS=0): analyze_candidates sätter trösklar på
+        # instansen => egen PatternAnalyzer per anrop, som i _refilter_from_artifacts
+        from app.services.pattern_analysis import PatternAnalyzer
+        pattern_analyzer = PatternAnalyzer()
+    start = time.perf_counter()
+    timer = StageTimer()
+
+    # En enda förbehandling (inkl. brusreducering) som analysen återanvänder
+    frame = image_processor.preprocess(image)
+    with timer.stage("quality"):
+        quality_metrics = image_processor.analyze_image_quality(frame.image)
+    try:
+        candidates = pattern_analyzer.extract_candidates(frame)
+    except Exception as e:
+        logger.error(f"extract_candidates => {e}", exc_info=True)
+        return {
+            "analysis_results": pattern_analyzer._create_empty_analysis(),
+            "image_quality": quality_metrics,
+            "analysis_timings": _pipeline_timings(frame.timings, {}, timer, start),
+            "failed": True,
+        }
+
+    if artifact_path:
+        with timer.stage("artifacts"):
+            try:
+                save_artifacts(artifact_path, frame, candidates, quality_metrics)
+            except Exception as e:
+                logger.warning(f"Kunde ej spara artefakter för {artifact_path} => {e}")
+
+    analysis_results = pattern_analyzer.analyze_candidates(
+        candidates,
+        sensitivity=sensitivity,
+        pix_per_cm=pix_per_cm
+    )
+    failed = bool(analysis_results.pop("failed", False))
+    return {
+        "analysis_results": analysis_results,
+        "image_quality": quality_metrics,
+        "analysis_timings": _pipeline_timings(frame.timings, analysis_results.get("timings"), timer, start),
+        "failed": failed,
+    }
+
+
+def _pipeline_timings(
+    preprocess: Dict[str, float],
+    analysis: Optional[Dict[str, float]],
+    timer: StageTimer,
+    start: float
+) -> Dict[str, float]:
+    """
+    analysis_timings: förbehandlingens steg (preprocess_<steg>_ms),
+    PatternAnalyzers steg, pipelinens egna steg och total_ms.
+    """
+    timer.add("total", (time.perf_counter() - start) * 1000)
+    return {
+        **{f"preprocess_{name}_ms": ms for name, ms in preprocess.items()},
+        **(analysis or {}),
+        **timer.as_dict(),
+    }
+
+
+def _profiled_pipeline(
+    image: np.ndarray,
+    sensitivity: float,
+    pix_per_cm: float,
+    artifact_path: Optional[str] = None,
+    profile_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    _run_pipeline, med profile_path under cProfile (requesten profileras,
+    se app.core.profiling).
+    """
+    with profile_to(profile_path):
+        return _run_pipeline(image, sensitivity, pix_per_cm, artifact_path)
+
+
+def _refilter_from_artifacts(
+    image_path: str,
+    sensitivity: float,
+    pix_per_cm: float
+) -> Optional[Dict[str, Any]]:
+    """
+    Reanalys från sparade artefakter. Egen PatternAnalyzer per anrop
+    (analyze_candidates sätter trösklar på instansen, anropen körs i trådar).
+    """
+    from app.services.image_processing import ImageProcessor
+    from app.services.pattern_analysis import PatternAnalyzer
+
+    pattern_analyzer = PatternAnalyzer()
+    start = time.perf_counter()
+    timer = StageTimer()
+    with timer.stage("load_artifacts"):
+        loaded = load_candidates(image_path)
+    if loaded is None:
+        # Analysparametrarna har ändrats => räkna om kandidaterna från sparad bild
+        with timer.stage("load_artifacts"):
+            frame = load_frame(image_path)
+        if frame is None:
+            return None
+        candidates = pattern_analyzer.extract_candidates(frame)
+        with timer.stage("quality"):
+            quality_metrics = ImageProcessor().analyze_image_quality(frame.image)
+        with timer.stage("artifacts"):
+            try:
+                save_artifacts(image_path, frame, candidates, quality_metrics, write_frame=False)
+            except Exception as e:
+                logger.warning(f"Kunde ej spara artefakter för {image_path} => {e}")
+    else:
+        candidates, quality_metrics = loaded
+
+    analysis_results = pattern_analyzer.analyze_candidates(
+        candidates,
+        sensitivity=sensitivity,
+        pix_per_cm=pix_per_cm
+    )
+    # Inget cachas här => flaggan behövs inte (och ska inte sparas i analysen)
+    analysis_results.pop("failed", None)
+    timings = dict(analysis_results.get("timings") or {})
+    if loaded is not None:
+        # De sparade kandidaternas tider gäller den ursprungliga analysen
+        for key in candidates.get("timings") or {}:
+            timings.pop(key, None)
+    timer.add("total", (time.perf_counter() - start) * 1000)
+    timings.update(timer.as_dict())
+    # Egna nycklar => reanalyser blandas inte med hela analyser i p50/p95
+    return {
+        "analysis_results": analysis_results,
+        "image_quality": quality_metrics,
+        "analysis_timings": {f"refilter_{key}": value for key, value in timings.items()},
+    }
+
+
+def _analyze_shared_image(
+    shm_name: str,
+    shape: tuple,
+    dtype: str,
+    sensitivity: float,
+    pix_per_cm: float,
+    artifact_path: Optional[str] = None,
+    profile_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Ingångspunkt i arbetsprocessen: kopplar upp mot det delade minnet,
+    läser bilden som en vy (ingen kopia) och kör pipelinen.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        try:
+            return _profiled_pipeline(image, sensitivity, pix_per_cm, artifact_path, profile_path)
+        finally:
+            # Vyn måste släppas innan minnet kan stängas
+            del image
+    finally:
+        shm.close()
+
+
+class AnalysisExecutor:
+    """
+    AnalysisExecutor
+    ----------------
+    Startas/stoppas i appens lifespan (start() / shutdown()).
+
+    - settings.ANALYSIS_WORKERS > 0  => processpool med så många arbetare
+    - settings.ANALYSIS_WORKERS == 0 => analysen körs i default-trådpoolen
+      (samma process), event-loopen blockeras ändå inte.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = settings.ANALYSIS_WORKERS if max_workers is None else max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._pool is not None
+
+    def start(self) -> None:
+        if self._pool is not None or self.max_workers <= 0:
+            return
+        # "spawn" => arbetarna ärver inte Motor-klientens trådar/sockets
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        logger.info(f"[AnalysisExecutor] Startade processpool med {self.max_workers} arbetare.")
+
+    def shutdown(self) -> None:
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        logger.info("[AnalysisExecutor] Processpool stängd.")
+
+    async def analyze(
+        self,
+        image: np.ndarray,
+        sensitivity: float = 0.5,
+        pix_per_cm: float = 1.0,
+        use_cache: bool = True,
+        artifact_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Kör förbehandling + mönsteranalys utanför event-loopen.
+        Samma bild + samma parametrar => resultatet hämtas från analysis_cache.
+        artifact_path (sökvägen till den sparade bilden) => mellanresultaten
+        sparas bredvid bilden för refilter(); saknas de där ännu går anropet
+        förbi cachen (en cacheträff skulle lämna bilden utan artefakter).
+        En profilerad request (app.core.profiling) går också förbi cachen,
+        och en misslyckad analys (tomt resultat efter ett fel) cachas inte.
+
+        Returns:
+            {"analysis_results": {...}, "image_quality": {...},
+             "analysis_timings": {...}, "cached": bool}
+        """
+        if image is None or image.size == 0:
+            raise ValueError("Ogiltig eller tom bild")
+
+        start = time.perf_counter()
+        profile_path = profile_target(".worker.prof")
+        cache_key = None
+        if use_cache and analysis_cache.enabled and profile_path is None:
+            cache_key = await analysis_cache.make_key(image, sensitivity, pix_per_cm)
+            needs_artifacts = artifact_path is not None and not has_artifacts(artifact_path)
+            cached = None if needs_artifacts else await analysis_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"[AnalysisExecutor] Cache-träff {cache_key[:12]}.")
+                cached["analysis_timings"] = {"cache_lookup_ms": round((time.perf_counter() - start) * 1000, 3)}
+                cached["cached"] = True
+                return cached
+
+        result = await self._compute(image, sensitivity, pix_per_cm, artifact_path, profile_path)
+        # Väntan på ledig arbetare + överföringen till/från processen ingår
+        result["analysis_timings"]["executor_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        analysis_timing_stats.record(result["analysis_timings"])
+        if result.pop("failed", False):
+            # Tillfälligt fel (t.ex. OOM) => nästa anrop ska försöka igen
+            logger.warning("[AnalysisExecutor] Analysen misslyckades, resultatet cachas inte.")
+        elif cache_key is not None:
+            await analysis_cache.set(cache_key, {k: v for k, v in result.items() if k != "analysis_timings"})
+        result["cached"] = False
+        return result
+
+    async def _compute(
+        self,
+        image: np.ndarray,
+        sensitivity: float,
+        pix_per_cm: float,
+        artifact_path: Optional[str] = None,
+        profile_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+
+        if self._pool is None:
+            return await loop.run_in_executor(
+                None, _profiled_pipeline, image, sensitivity, pix_per_cm, artifact_path, profile_path
+            )
+
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        try:
+            shared = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+            shared[...] = image
+            del shared
+
+            return await loop.run_in_executor(
+                self._pool,
+                _analyze_shared_image,
+                shm.name,
+                image.shape,
+                image.dtype.str,
+                sensitivity,
+                pix_per_cm,
+                artifact_path,
+                profile_path,
+            )
+        except BrokenProcessPool:
+            # En arbetare har dött (t.ex. OOM) => bygg om poolen till nästa anrop
+            logger.error("[AnalysisExecutor] Processpoolen är trasig, startar om den.")
+            broken, self._pool = self._pool, None
+            if broken is not None:
+                broken.shutdown(wait=False, cancel_futures=True)
+            self.start()
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def refilter(
+        self,
+        image_path: str,
+        sensitivity: float = 0.5,
+        pix_per_cm: float = 1.0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Reanalys från artefakterna bredvid image_path (bara filtrering +
+        statistik, millisekunder). None => inga giltiga artefakter, anroparen
+        får köra analyze(..., artifact_path=image_path) i stället.
+        """
+        result = await asyncio.to_thread(_refilter_from_artifacts, image_path, sensitivity, pix_per_cm)
+        if result is not None:
+            analysis_timing_stats.record(result["analysis_timings"])
+            result["cached"] = False
+        return result
+
+
+# Singleton-instans, startas i main.py:s lifespan
+analysis_executor = AnalysisExecutor()
@@ -0,0 +1,392 @@
+"""
+Persistent jobbkö för bildanalyser (MongoDB-kollektionen 'analysis_jobs').
+
+Flöde:
+  1) POST /api/analyze sparar bilden och lägger ett jobb i kön => svarar direkt
+     med job_id (HTTP-anslutningen hålls inte öppen under OpenCV-pipelinen).
+  2) Bakgrundsarbetare (asyncio-tasks, startas i lifespan) tar jobb via
+     find_one_and_update med en tidsbegränsad "lease".
+  3) Arbetaren kör analysen (analysis_executor), skriver shot-dokumentet och
+     pushar resultatet via websocket (ConnectionManager.send_personal_message).
+
+Om en arbetare/process dör mitt i ett jobb löper leasen ut och jobbet tas
+av nästa lediga arbetare. Shot-dokumentets _id bestäms redan när jobbet
+skapas => en omkörning skapar aldrig dubbletter.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.db.mongodb import db
+from app.services.analysis_service import analysis_service
+from app.api.websocket import manager
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def _ms_between(start: Optional[datetime], end: Optional[datetime]) -> Optional[int]:
+    if not start or not end:
+        return None
+    return int((end - start).total_seconds() * 1000)
+
+
+def _serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Gör om ett jobb-dokument till JSON-vänligt format för API/websocket.
+    """
+    out = {
+        "job_id": str(job["_id"]),
+        "status": job.get("status"),
+        "shot_id": job.get("shot_id"),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "queue_wait_ms": job.get("queue_wait_ms"),
+        "processing_ms": job.get("processing_ms"),
+        "total_ms": job.get("total_ms"),
+    }
+    for key in ("created_at", "started_at", "finished_at"):
+        value = job.get(key)
+        out[key] = value.isoformat() if isinstance(value, datetime) else value
+    return out
+
+
+class AnalysisJobQueue:
+    """
+    AnalysisJobQueue
+    ----------------
+    - enqueue_upload(file, user_id, metadata) => nytt jobb (status 'queued')
+    - get_job(job_id, user_id)                => status för polling
+    - queue_stats()                           => ködjup + latens
+    - start() / stop()                        => bakgrundsarbetarna (lifespan)
+    """
+
+    def __init__(
+        self,
+        worker_count: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        poll_interval: float = 1.0
+    ):
+        self.worker_count = settings.ANALYSIS_JOB_WORKERS if worker_count is None else worker_count
+        self.lease_seconds = lease_seconds or settings.ANALYSIS_JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.ANALYSIS_JOB_MAX_ATTEMPTS
+        self.poll_interval = poll_interval
+
+        # Unikt per process => syns i jobbet vem som håller leasen
+        self.instance_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    async def _collection(self):
+        database = await db.get_database()
+        return database["analysis_jobs"]
+
+    # -------------------------------------------------
+    # Publikt API
+    # -------------------------------------------------
+    async def enqueue_upload(
+        self,
+        file: UploadFile,
+        user_id: str,
+        metadata: Dict[str, Any],
+        sensitivity: float = 0.5,
+        pix_per_cm: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Sparar bilden och lägger ett analysjobb i kön. Returnerar direkt.
+        """
+        image_info = await analysis_service.store_uploaded_image(file, user_id)
+
+        now = datetime.utcnow()
+        job = {
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "shot_id": str(ObjectId()),
+            "metadata": metadata,
+            "image_info": image_info,
+            "sensitivity": sensitivity,
+            "pix_per_cm": pix_per_cm,
+            "attempts": 0,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+
+        try:
+            jobs_coll = await self._collection()
+            res = await jobs_coll.insert_one(job)
+        except Exception as e:
+            logger.error(f"[AnalysisJobQueue] Kunde ej skapa jobb => {e}", exc_info=True)
+            await analysis_service._cleanup_image(image_info["saved_path"])
+            raise HTTPException(500, "Kunde inte lägga analysen i kön.")
+
+        job["_id"] = res.inserted_id
+        self._wakeup.set()
+        logger.info(f"[AnalysisJobQueue] Nytt jobb {res.inserted_id} för user={user_id}")
+        return _serialize_job(job)
+
+    async def get_job(self, job_id: str, user_id: str) -> Dict[str, Any]:
+        if not ObjectId.is_valid(job_id):
+            raise HTTPException(400, "Ogiltigt jobb-id.")
+        jobs_coll = await self._collection()
+        job = await jobs_coll.find_one({"_id": ObjectId(job_id), "user_id": user_id})
+        if not job:
+            raise HTTPException(404, "Jobbet hittades ej.")
+
+        out = _serialize_job(job)
+        if job.get("status") == JOB_QUEUED:
+            out["queue_position"] = await jobs_coll.count_documents({
+                "status": JOB_QUEUED,
+                "created_at": {"$lt": job["created_at"]}
+            }) + 1
+        return out
+
+    async def queue_stats(self, window_minutes: int = 60) -> Dict[str, Any]:
+        """
+        Ködjup (queued/running), äldsta väntande jobb samt latens
+        (kötid/bearbetning) för jobb klara inom 'window_minutes'.
+        """
+        jobs_coll = await self._collection()
+        now = datetime.utcnow()
+
+        queued = await jobs_coll.count_documents({"status": JOB_QUEUED})
+        running = await jobs_coll.count_documents({"status": JOB_RUNNING})
+        expired = await jobs_coll.count_documents({
+            "status": JOB_RUNNING,
+            "lease_expires_at": {"$lt": now}
+        })
+
+        oldest = await jobs_coll.find_one(
+            {"status": JOB_QUEUED},
+            sort=[("created_at", 1)],
+            projection={"created_at": 1}
+        )
+
+        pipeline = [
+            {"$match": {
+                "status": {"$in": [JOB_COMPLETED, JOB_FAILED]},
+                "finished_at": {"$gte": now - timedelta(minutes=window_minutes)}
+            }},
+            {"$group": {
+                "_id": "$status",
+                "count": {"$sum": 1},
+                "avg_queue_wait_ms": {"$avg": "$queue_wait_ms"},
+                "max_queue_wait_ms": {"$max": "$queue_wait_ms"},
+                "avg_processing_ms": {"$avg": "$processing_ms"},
+                "max_processing_ms": {"$max": "$processing_ms"},
+                "avg_total_ms": {"$avg": "$total_ms"},
+            }}
+        ]
+        recent = {}
+        async for row in jobs_coll.aggregate(pipeline):
+            status = row.pop("_id")
+            recent[status] = row
+
+        return {
+            "queued": queued,
+            "running": running,
+            "expired_leases": expired,
+            "oldest_queued_age_ms": _ms_between(oldest["created_at"], now) if oldest else None,
+            "workers": len(self._tasks),
+            "window_minutes": window_minutes,
+            "recent": recent,
+        }
+
+    # -------------------------------------------------
+    # Livscykel
+    # -------------------------------------------------
+    def start(self) -> None:
+        if self._tasks or self.worker_count <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        for i in range(self.worker_count):
+            worker_id = f"{self.instance_id}-w{i}"
+            self._tasks.append(asyncio.create_task(self._worker_loop(worker_id)))
+        logger.info(f"[AnalysisJobQueue] Startade {self.worker_count} arbetare ({self.instance_id}).")
+
+    async def stop(self) -> None:
+        """
+        Stoppar arbetarna. Pågående jobb avbryts; deras lease löper ut
+        och de tas om av nästa process som startar.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("[AnalysisJobQueue] Arbetare stoppade.")
+
+    # -------------------------------------------------
+    # Arbetare
+    # -------------------------------------------------
+    async def _worker_loop(self, worker_id: str) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim_next(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[AnalysisJobQueue] {worker_id} kunde ej hämta jobb => {e}")
+                await asyncio.sleep(self.poll_interval * 5)
+                continue
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._run_job(job, worker_id)
+
+    async def _claim_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Tar äldsta väntande jobb, eller ett 'running'-jobb vars lease löpt ut
+        (arbetaren dog/omstart). Atomiskt via find_one_and_update.
+        """
+        jobs_coll = await self._collection()
+        now = datetime.utcnow()
+
+        # Jobb som redan försökts max antal gånger och tappat leasen => failed
+        await jobs_coll.update_many(
+            {
+                "status": JOB_RUNNING,
+                "lease_expires_at": {"$lt": now},
+                "attempts": {"$gte": self.max_attempts}
+            },
+            {"$set": {
+                "status": JOB_FAILED,
+                "error": "Max antal försök uppnått (lease löpte ut).",
+                "finished_at": now
+            }}
+        )
+
+        return await jobs_coll.find_one_and_update(
+            {
+                "$or": [
+                    {"status": JOB_QUEUED},
+                    {"status": JOB_RUNNING, "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts}
+            },
+            {
+                "$set": {
+                    "status": JOB_RUNNING,
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _heartbeat(self, job_id: ObjectId, worker_id: str) -> None:
+        """
+        Förlänger leasen medan jobbet pågår (analysen kan ta längre tid än en lease).
+        """
+        jobs_coll = await self._collection()
+        interval = max(1.0, self.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            await jobs_coll.update_one(
+                {"_id": job_id, "worker_id": worker_id, "status": JOB_RUNNING},
+                {"$set": {
+                    "lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+                }}
+            )
+
+    async def _run_job(self, job: Dict[str, Any], worker_id: str) -> None:
+        jobs_coll = await self._collection()
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"], worker_id))
+        try:
+            shot_doc = await analysis_service.analyze_saved_image(
+                shot_id=job["shot_id"],
+                user_id=job["user_id"],
+                metadata=job.get("metadata") or {},
+                image_info=job["image_info"],
+                sensitivity=job.get("sensitivity", 0.5),
+                pix_per_cm=job.get("pix_per_cm", 1.0)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[AnalysisJobQueue] Jobb {job['_id']} misslyckades => {e}", exc_info=True)
+            final = job.get("attempts", 1) >= self.max_attempts
+            now = datetime.utcnow()
+            update = {
+                "status": JOB_FAILED if final else JOB_QUEUED,
+                "error": str(e),
+                "worker_id": None,
+                "lease_expires_at": None,
+            }
+            if final:
+                update["finished_at"] = now
+                update["total_ms"] = _ms_between(job["created_at"], now)
+            await jobs_coll.update_one({"_id": job["_id"], "worker_id": worker_id}, {"$set": update})
+            if final:
+                job.update(update)
+                await self._notify(job)
+            return
+        finally:
+            heartbeat.cancel()
+
+        now = datetime.utcnow()
+        update = {
+            "status": JOB_COMPLETED,
+            "error": None,
+            "lease_expires_at": None,
+            "finished_at": now,
+            "queue_wait_ms": _ms_between(job["created_at"], job["started_at"]),
+            "processing_ms": _ms_between(job["started_at"], now),
+            "total_ms": _ms_between(job["created_at"], now),
+        }
+        await jobs_coll.update_one({"_id": job["_id"], "worker_id": worker_id}, {"$set": update})
+        job.update(update)
+
+        logger.info(
+            f"[AnalysisJobQueue] Jobb {job['_id']} klart => shot={job['shot_id']}, "
+            f"kö={update['queue_wait_ms']} ms, analys={update['processing_ms']} ms"
+        )
+        await self._notify(job, shot_doc)
+
+    async def _notify(self, job: Dict[str, Any], shot_doc: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Pushar jobbstatus till användarens websocket-anslutningar (om några).
+        """
+        data = _serialize_job(job)
+        if shot_doc is not None:
+            data["results"] = shot_doc.get("analysis_results")
+            data["image_url"] = shot_doc.get("image_url")
+        try:
+            await manager.send_personal_message(
+                {"type": "analysis_job", "data": data},
+                job["user_id"]
+            )
+        except Exception as e:
+            logger.warning(f"[AnalysisJobQueue] Kunde ej pusha jobb {job['_id']} => {e}")
+
+
+# Singleton-instans, startas/stoppas i main.py:s lifespan
+analysis_job_queue = AnalysisJobQueue()
@@ -1,11 +1,11 @@
 from datetime import datetime
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
 import logging
-import cv2
-import numpy as np
 from fastapi import HTTPException, UploadFile
 from bson import ObjectId
-import aiofiles
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 from pathlib import Path
 
@@ -15,6 +15,27 @@ from app.db.mongodb import db
 # Import av mönsteranalys (om du vill anropa PatternAnalyzer i stället)
 from app.services.pattern_analysis import PatternAnalyzer
 from app.services.image_processing import ImageProcessor
+from app.services.analysis_artifacts import remove_artifacts
+from app.services.analysis_executor import analysis_executor
+from app.services.incremental_stats import (
+    cancel_pending,
+    compact_update,
+    edit_update,
+    needs_compaction,
+    new_epoch,
+    version_filter,
+)
+from app.services.pellet_index import PelletIndex, index_key, pellet_index_cache, select_hits
+from app.services.pellet_storage import SCHEMA_VERSION, compact_results, expand_shot, is_compact
+from app.services.pattern_aggregates import pattern_aggregates
+from app.services.user_statistics import user_statistics
+from app.services.upload_storage import (
+    EmptyUploadError,
+    SpooledUpload,
+    UploadTooLargeError,
+    decode_image_file,
+    spool_upload,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,6 +43,9 @@ logger = logging.getLogger(__name__)
 # Publik åtkomst (ex. http://127.0.0.1:8000 => statiska bilder)
 IMAGES_BASE_URL = "http://127.0.0.1:8000"
 
+# Försök per träffredigering vid samtidiga ändringar (se edit_hits)
+HIT_EDIT_ATTEMPTS = 5
+
 
 class AnalysisService:
     """
@@ -41,8 +65,12 @@ class AnalysisService:
       7) update_ring(shot_id, user_id, ring_data)
 
     Nytt/utökat:
-      - _recalc_analysis_stats(analysis_results) => snabb omberäkning av hit_count, spread, etc.
-        baserat på existerande individual_pellets.
+      - edit_hits(shot_filter, added, removed) => riktad uppdatering av träffar
+        + inkrementell statistik (incremental_stats), används av 5), 6) och PATCH /hits.
+      - find_hits(shot_filter, ...) => träffar i ett urval (närmaste/rektangel/lasso)
+        ur skottets cachade rumsliga index (pellet_index).
+      - användarstatistiken skrivs via user_statistics (atomiska $inc/$max,
+        omräkning med aggregering över shots).
     """
 
     def __init__(self):
@@ -66,47 +94,25 @@ class AnalysisService:
         Tar emot en uppladdad bild + metadata, kör analys och sparar i DB.
 
         Steg:
-          1) Verifiera filtyp + storlek.
-          2) Öppna med OpenCV.
-          3) Spara originalbild lokalt.
-          4) Preprocess + pattern_analysis.
+          1) Verifiera filtyp, strömma filen till disk (storlek kontrolleras under tiden).
+          2) Avkoda den sparade filen med OpenCV.
+          3) (utgår, originalet sparades redan i steg 1)
+          4) Preprocess + pattern_analysis (via analysis_executor).
           5) Bygg shot_doc, inkl. image_info + image_url.
           6) Spara i DB (shots) och returnera doc.
         """
         logger.info("=== [AnalysisService] analyze_shot_image: START ===")
         try:
-            # 1) Filtyp & storlek
-            logger.debug(
-                "Kontrollerar bildtyp=%s, filnamn=%s, user_id=%s",
-                file.content_type, file.filename, user_id
-            )
-            if file.content_type not in self.valid_image_types:
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        f"Otillåten bildtyp '{file.content_type}'. "
-                        f"Tillåtet är: {list(self.valid_image_types.keys())}"
-                    )
-                )
-
-            contents = await file.read()
-            if not contents:
-                raise HTTPException(400, "Uppladdad bild är tom (inga bytes).")
-
-            file_size = len(contents)
-            logger.debug("[AnalysisService] Filstorlek (bytes): %d", file_size)
-            if file_size > settings.MAX_UPLOAD_SIZE:
-                max_mb = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
-                raise HTTPException(
-                    400,
-                    detail=f"Bildfilen överskrider {max_mb:.2f} MB."
-                )
+            # 1) Filtyp & storlek => originalet strömmas direkt till disk
+            upload = await self._store_upload(file, user_id)
+            file_path = upload.path
+            file_size = upload.size_bytes
 
-            # 2) Läs in via OpenCV
-            nparr = np.frombuffer(contents, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # 2) Avkoda från den sparade filen (memmap, i tråd => blockerar ej event-loopen)
+            image = await asyncio.to_thread(decode_image_file, file_path)
             if image is None:
                 logger.error("OpenCV kunde ej avkoda bilden => korrupt fil?")
+                await self._cleanup_image(file_path)
                 raise HTTPException(400, "Fel: kunde ej avkoda bilddata via OpenCV.")
 
             logger.info(
@@ -114,27 +120,13 @@ class AnalysisService:
                 file.filename, image.shape, file_size
             )
 
-            # 3) Spara bild lokalt
-            file_path = await self._save_image(contents, file.filename, user_id)
-            logger.debug("Lokalt sparad bild: %s", file_path)
-
-            # 4) Förbehandling + analys
+            # 4) Förbehandling + analys (i processpoolen => blockerar ej event-loopen)
             try:
-                logger.debug("Preprocessar bild via ImageProcessor...")
-                processed_img = self.image_processor.preprocess_image(image)
-                quality_metrics = self.image_processor.analyze_image_quality(processed_img)
+                logger.debug("Kör preprocess + pattern-analys via analysis_executor...")
+                analysis = await analysis_executor.analyze(image, artifact_path=file_path)
+                quality_metrics = analysis["image_quality"]
+                analysis_results = analysis["analysis_results"]
                 logger.debug("image_quality => %s", quality_metrics)
-            except Exception as e:
-                logger.error("Fel i image_processor => %s", e, exc_info=True)
-                raise HTTPException(500, f"Fel vid bildförbehandling: {str(e)}")
-
-            try:
-                logger.debug("Kallar pattern_analyzer.analyze_shot_pattern...")
-                analysis_results = self.pattern_analyzer.analyze_shot_pattern(processed_img)
-                # Se till att "individual_pellets" alltid finns
-                if "individual_pellets" not in analysis_results:
-                    logger.debug("Ingen 'individual_pellets' => skapar tom []")
-                    analysis_results["individual_pellets"] = []
 
                 logger.info(
                     "Pattern analysis => hits=%s, ring=%s",
@@ -142,37 +134,26 @@ class AnalysisService:
                     analysis_results.get('ring')
                 )
             except Exception as e:
-                logger.error("pattern_analyzer-fel => %s", e, exc_info=True)
+                logger.error("Fel i bildanalysen => %s", e, exc_info=True)
                 raise HTTPException(500, f"Kunde ej genomföra pattern-analys: {str(e)}")
 
             # 5) Bygg shot_doc
-            valid_meta = self._validate_metadata(metadata)
-            shot_doc = {
-                "user_id": user_id,
-                "metadata": valid_meta,  # shotgun/ammunition/conditions
-                "analysis_results": analysis_results,
-                "image_quality": quality_metrics,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-                "status": "auto_detected"
-            }
-
-            # Lägg till info om bild
-            shot_doc["image_info"] = {
-                "filename": file.filename,
-                "saved_path": file_path,
-                "width": image.shape[1],
-                "height": image.shape[0],
-                "content_type": file.content_type,
-                "size_bytes": file_size
-            }
-            # Publik URL
-            basename = os.path.basename(file_path)
-            shot_doc["image_url"] = f"{IMAGES_BASE_URL}/uploads/{user_id}/{basename}"
-
-            # Bygg tags
-            shot_doc["tags"] = self._generate_tags(valid_meta, analysis_results)
-            logger.debug("shot_doc => %s", shot_doc)
+            shot_doc = self._build_shot_doc(
+                user_id=user_id,
+                metadata=metadata,
+                analysis_results=analysis_results,
+                quality_metrics=quality_metrics,
+                image_info={
+                    "filename": file.filename,
+                    "saved_path": file_path,
+                    "width": image.shape[1],
+                    "height": image.shape[0],
+                    "content_type": file.content_type,
+                    "size_bytes": file_size,
+                    "sha256": upload.sha256
+                },
+                analysis_timings=analysis.get("analysis_timings")
+            )
 
             # 6) Spara i DB
             try:
@@ -181,11 +162,12 @@ class AnalysisService:
                 resp = await shots_coll.insert_one(shot_doc)
                 shot_doc["_id"] = str(resp.inserted_id)
 
-                # Uppdatera user-stats
-                await self._update_user_statistics(user_id, analysis_results)
+                # Uppdatera user-stats + mönsteraggregat
+                await user_statistics.record_shot(user_id, analysis_results)
+                await pattern_aggregates.sync_shot(resp.inserted_id)
 
                 logger.info("Sparat _id=%s i 'shots'.", shot_doc["_id"])
-                return shot_doc
+                return expand_shot(shot_doc)
 
             except Exception as e:
                 logger.error("DB insert fel => %s", e, exc_info=True)
@@ -201,6 +183,89 @@ class AnalysisService:
         finally:
             logger.info("=== [AnalysisService] analyze_shot_image: END ===")
 
+    async def store_uploaded_image(self, file: UploadFile, user_id: str) -> Dict[str, Any]:
+        """
+        Validerar + sparar en uppladdad bild utan att analysera den.
+        Används av jobbkön (app.services.analysis_jobs) => själva analysen
+        körs senare av en bakgrundsarbetare via analyze_saved_image().
+
+        Returnerar image_info (utan width/height, de sätts vid analysen).
+        """
+        upload = await self._store_upload(file, user_id)
+        return {
+            "filename": file.filename,
+            "saved_path": upload.path,
+            "content_type": file.content_type,
+            "size_bytes": upload.size_bytes,
+            "sha256": upload.sha256
+        }
+
+    async def analyze_saved_image(
+        self,
+        shot_id: str,
+        user_id: str,
+        metadata: Dict[str, Any],
+        image_info: Dict[str, Any],
+        sensitivity: float = 0.5,
+        pix_per_cm: float = 1.0
+    ) -> Dict[str, Any]:
+        """
+        Analyserar en redan sparad bild och skapar shot-dokumentet med ett
+        förutbestämt _id (shot_id). Om dokumentet redan finns (t.ex. när ett
+        jobb körts om efter en avbruten arbetare) returneras det befintliga
+        => idempotent.
+        """
+        db_conn = await db.get_database()
+        shots_coll = db_conn["shots"]
+
+        existing = await shots_coll.find_one({"_id": ObjectId(shot_id)})
+        if existing:
+            logger.info("analyze_saved_image => shot %s finns redan, hoppar över analys.", shot_id)
+            existing["_id"] = str(existing["_id"])
+            return expand_shot(existing)
+
+        saved_path = image_info["saved_path"]
+        image = await asyncio.to_thread(decode_image_file, saved_path)
+        if image is None:
+            raise ValueError(f"Kunde ej läsa/avkoda sparad bild: {saved_path}")
+
+        analysis = await analysis_executor.analyze(
+            image,
+            sensitivity=sensitivity,
+            pix_per_cm=pix_per_cm,
+            artifact_path=saved_path
+        )
+        analysis_results = analysis["analysis_results"]
+
+        shot_doc = self._build_shot_doc(
+            user_id=user_id,
+            metadata=metadata,
+            analysis_results=analysis_results,
+            quality_metrics=analysis["image_quality"],
+            image_info={
+                **image_info,
+                "width": image.shape[1],
+                "height": image.shape[0]
+            },
+            analysis_timings=analysis.get("analysis_timings")
+        )
+        shot_doc["_id"] = ObjectId(shot_id)
+
+        try:
+            await shots_coll.insert_one(shot_doc)
+        except DuplicateKeyError:
+            logger.info("analyze_saved_image => shot %s skapades parallellt.", shot_id)
+            existing = await shots_coll.find_one({"_id": ObjectId(shot_id)})
+            existing["_id"] = str(existing["_id"])
+            return expand_shot(existing)
+
+        await user_statistics.record_shot(user_id, analysis_results)
+        await pattern_aggregates.sync_shot(shot_id)
+
+        shot_doc["_id"] = shot_id
+        logger.info("Sparat _id=%s i 'shots' (jobb).", shot_id)
+        return expand_shot(shot_doc)
+
     async def get_shot_analysis(self, shot_id: str, user_id: str) -> Dict[str, Any]:
         """
         Hämtar ett sparat dokument (shot) i DB via _id + user_id.
@@ -216,7 +281,7 @@ class AnalysisService:
                 raise HTTPException(404, "Analysen hittades ej (fel id eller user).")
 
             doc["_id"] = str(doc["_id"])
-            return doc
+            return expand_shot(doc)
 
         except HTTPException:
             raise
@@ -239,55 +304,69 @@ class AnalysisService:
             db_conn = await db.get_database()
             shots_coll = db_conn["shots"]
 
-            existing = await shots_coll.find_one({"_id": ObjectId(shot_id), "user_id": user_id})
-            if not existing:
-                logger.warning("Inget doc funnet => shot_id=%s, user_id=%s", shot_id, user_id)
-                raise HTTPException(404, "Analysen finns ej eller fel user.")
-
-            analysis_results = existing.get("analysis_results", {})
-            logger.debug("Befintliga analysis_results => %s", analysis_results)
-
-            # Ex: final_ring
-            if "ring" in final_data:
-                logger.info("Sätter final_ring => %s", final_data["ring"])
-                analysis_results["final_ring"] = dict(final_data["ring"])
-
-            # Ex: final_pellets
-            if "pellets" in final_data:
-                logger.info("Sätter final_pellets => %s", final_data["pellets"])
-                analysis_results["final_pellets"] = list(final_data["pellets"])
-
-            # Räkna om stats (enkel approach)
-            final_count = len(analysis_results.get("final_pellets", []))
-            new_density = round(final_count / 100.0, 2)
-            analysis_results["hit_count"] = final_count
-            analysis_results["pattern_density"] = new_density
-
-            existing["status"] = "completed"
-            existing["analysis_results"] = analysis_results
-            existing["updated_at"] = datetime.utcnow()
-
-            logger.debug("Uppdaterade analysis_results => %s", analysis_results)
-
-            result = await shots_coll.update_one(
-                {"_id": ObjectId(shot_id)},
-                {
-                    "$set": {
-                        "analysis_results": analysis_results,
-                        "status": "completed",
-                        "updated_at": existing["updated_at"]
+            shot_filter = {"_id": ObjectId(shot_id), "user_id": user_id}
+            for _ in range(HIT_EDIT_ATTEMPTS):
+                existing = await shots_coll.find_one(shot_filter)
+                if not existing:
+                    logger.warning("Inget doc funnet => shot_id=%s, user_id=%s", shot_id, user_id)
+                    raise HTTPException(404, "Analysen finns ej eller fel user.")
+
+                analysis_results = existing.get("analysis_results", {})
+                logger.debug("Befintliga analysis_results => %s", analysis_results)
+                hits_before = analysis_results.get("hit_count", 0)
+                density_before = analysis_results.get("pattern_density", 0.0)
+                # Villkor på summornas version (som edit_hits) => en redigering
+                # mellan läsningen och skrivningen går inte förlorad
+                expected = version_filter(analysis_results)
+
+                # Ex: final_ring
+                if "ring" in final_data:
+                    logger.info("Sätter final_ring => %s", final_data["ring"])
+                    analysis_results["final_ring"] = dict(final_data["ring"])
+
+                # Ex: final_pellets
+                if "pellets" in final_data:
+                    logger.info("Sätter final_pellets => %s", final_data["pellets"])
+                    analysis_results["final_pellets"] = list(final_data["pellets"])
+
+                # Räkna om stats (enkel approach)
+                final_count = len(analysis_results.get("final_pellets", []))
+                new_density = round(final_count / 100.0, 2)
+                analysis_results["hit_count"] = final_count
+                analysis_results["pattern_density"] = new_density
+                if analysis_results.get("accumulators"):
+                    # Hela resultatet skrivs om => ny epoch, så att (epoch, version)
+                    # aldrig återkommer och cachade index blir inaktuella
+                    analysis_results["accumulators"] = {**analysis_results["accumulators"], "epoch": new_epoch()}
+
+                existing["status"] = "completed"
+                existing["analysis_results"] = analysis_results
+                existing["updated_at"] = datetime.utcnow()
+
+                logger.debug("Uppdaterade analysis_results => %s", analysis_results)
+
+                result = await shots_coll.update_one(
+                    {**shot_filter, **expected},
+                    {
+                        "$set": {
+                            "analysis_results": analysis_results,
+                            "status": "completed",
+                            "updated_at": existing["updated_at"]
+                        }
                     }
-                }
-            )
-            if result.modified_count == 0:
-                logger.error("DB update => modified_count=0 => ingen uppdatering.")
-                raise HTTPException(500, "Kunde inte uppdatera shot i databasen.")
+                )
+                if result.matched_count:
+                    break
+            else:
+                raise HTTPException(409, "Analysen ändrades samtidigt, försök igen.")
+            pellet_index_cache.discard(existing["_id"])
 
             # uppdatera user-stats
-            await self._update_user_statistics(user_id, analysis_results)
+            await user_statistics.record_edit(user_id, hits_before, density_before, analysis_results)
+            await pattern_aggregates.sync_shot(existing["_id"])
 
             existing["_id"] = str(existing["_id"])
-            return existing
+            return expand_shot(existing)
 
         except HTTPException:
             raise
@@ -310,6 +389,9 @@ class AnalysisService:
                 logger.warning("delete_analysis => ingen doc raderades, shot_id=%s", shot_id)
                 raise HTTPException(404, "Analysen fanns ej eller fel user?")
 
+            await user_statistics.record_delete(user_id, doc.get("analysis_results") or {})
+            await pattern_aggregates.remove_shot(doc)
+
             # Rensa fil om den finns
             saved_path = doc.get("image_info", {}).get("saved_path")
             if saved_path:
@@ -331,46 +413,26 @@ class AnalysisService:
     async def add_hits_to_analysis(self, shot_id: str, user_id: str,
                                    hits_to_add: List[Dict[str, float]]) -> Dict[str, Any]:
         """
-        Lägger till nya hagelträffar (individual_pellets) i analysis_results.
-        Reberäknar sedan statistiken innan vi sparar.
+        Lägger till nya hagelträffar ({"x": %, "y": %}) i analysis_results.
+        Statistiken uppdateras inkrementellt (se edit_hits).
         """
         logger.debug("add_hits_to_analysis => shot_id=%s, hits_to_add=%s", shot_id, hits_to_add)
         try:
-            db_conn = await db.get_database()
-            shots_coll = db_conn["shots"]
-            doc = await shots_coll.find_one({"_id": ObjectId(shot_id), "user_id": user_id})
+            doc, summary = await self.edit_hits({"_id": ObjectId(shot_id), "user_id": user_id}, added=hits_to_add)
             if not doc:
                 raise HTTPException(404, "Analysen finns ej eller fel user.")
 
-            analysis_results = doc.get("analysis_results", {})
-            # se till att individual_pellets finns
-            analysis_results.setdefault("individual_pellets", [])
-
-            for h in hits_to_add:
-                new_hit = {"x": h["x"], "y": h["y"]}
-                analysis_results["individual_pellets"].append(new_hit)
-
-            # => Recalc stats (utökad metod)
-            analysis_results = self._recalc_analysis_stats(doc, analysis_results)
-
-            # Spara
-            doc["analysis_results"] = analysis_results
-            doc["updated_at"] = datetime.utcnow()
-
-            await shots_coll.update_one(
-                {"_id": ObjectId(shot_id)},
-                {"$set": {
-                    "analysis_results": analysis_results,
-                    "updated_at": doc["updated_at"]
-                }}
-            )
-
-            # uppdatera user-stats
-            await self._update_user_statistics(user_id, analysis_results)
+            # uppdatera user-stats (bara skillnaden)
+            if summary.get("added") or summary.get("removed"):
+                await user_statistics.record_edit(
+                    user_id, summary["hit_count_before"], summary["pattern_density_before"], summary
+                )
 
             doc["_id"] = str(doc["_id"])
-            return doc
+            return expand_shot(doc)
 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("add_hits_to_analysis fel => %s", e, exc_info=True)
             raise HTTPException(500, f"Kunde ej lägga till hagelträffar => {str(e)}")
@@ -378,47 +440,188 @@ class AnalysisService:
     async def remove_hits_from_analysis(self, shot_id: str, user_id: str,
                                         hits_to_remove: List[Dict[str, float]]) -> Dict[str, Any]:
         """
-        Tar bort hagelträffar (individual_pellets) baserat på exakta (x,y)-matchningar.
-        Reberäknar sedan statistiken.
+        Tar bort närmaste hagelträff inom HIT_SELECT_RADIUS_PX px per angiven
+        träff (rumsligt index, se pellet_index).
+        Statistiken uppdateras inkrementellt (se edit_hits).
         """
         logger.debug("remove_hits_from_analysis => shot_id=%s, hits_to_remove=%s", shot_id, hits_to_remove)
         try:
-            db_conn = await db.get_database()
-            shots_coll = db_conn["shots"]
-            doc = await shots_coll.find_one({"_id": ObjectId(shot_id), "user_id": user_id})
+            doc, summary = await self.edit_hits({"_id": ObjectId(shot_id), "user_id": user_id}, removed=hits_to_remove)
             if not doc:
                 raise HTTPException(404, "Analysen finns ej eller fel user.")
 
-            analysis_results = doc.get("analysis_results", {})
-            pellets = analysis_results.get("individual_pellets", [])
+            # uppdatera user-stats (bara skillnaden)
+            if summary.get("added") or summary.get("removed"):
+                await user_statistics.record_edit(
+                    user_id, summary["hit_count_before"], summary["pattern_density_before"], summary
+                )
 
-            remove_set = {(h["x"], h["y"]) for h in hits_to_remove}
-            new_pellets = [p for p in pellets if (p["x"], p["y"]) not in remove_set]
-            analysis_results["individual_pellets"] = new_pellets
+            doc["_id"] = str(doc["_id"])
+            return expand_shot(doc)
 
-            # => Recalc stats
-            analysis_results = self._recalc_analysis_stats(doc, analysis_results)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("remove_hits_from_analysis fel => %s", e, exc_info=True)
+            raise HTTPException(500, f"Kunde ej ta bort hagelträffar => {str(e)}")
 
-            doc["analysis_results"] = analysis_results
-            doc["updated_at"] = datetime.utcnow()
+    async def edit_hits(
+        self,
+        shot_filter: Dict[str, Any],
+        added: Optional[List[Dict[str, float]]] = None,
+        removed: Optional[List[Dict[str, float]]] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        radius: Optional[float] = None,
+        box: Optional[Dict[str, float]] = None,
+        polygon: Optional[List[Dict[str, float]]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Lägger till/tar bort träffar med en riktad uppdatering ($push/$addToSet/
+        $inc, se incremental_stats) i stället för att skriva om hela
+        analysis_results. Uppdateringen villkoras på summornas version; har
+        någon annan hunnit redigera emellan görs ett nytt försök.
+
+        Borttagning: removed = närmaste träff inom radius px per punkt, box =
+        rektangel {x0, y0, x1, y1} och polygon = lasso (procent), via skottets
+        rumsliga index (pellet_index_cache). Finns indexet för aktuell version
+        läses inte pellet-kolumnerna alls.
+
+        Returns:
+            (dokumentet efter uppdateringen med projection, None om det saknas;
+             sammanfattning {hit_count, centroid, spread, added, removed,
+             hit_count_before, pattern_density_before, ...})
+        """
+        added, removed = cancel_pending(added or [], removed or [])
+        selecting = bool(removed or box or polygon)
+        db_conn = await db.get_database()
+        shots_coll = db_conn["shots"]
+
+        for _ in range(HIT_EDIT_ATTEMPTS):
+            loaded = await self._load_hit_index(shots_coll, shot_filter, need_index=selecting)
+            if loaded is None:
+                return None, {}
+            shot_id, results, index = loaded
+            if results is None:
+                # Precis konverterat från äldre format => läs om
+                continue
+
+            removed_idx = select_hits(index, removed, radius, box, polygon) if selecting else []
+            update, summary = edit_update(results, index, added, removed_idx)
+            added_points = summary.pop("added_points", None)
+            new_key = summary.pop("index_key", None)
+            if update is None:
+                doc = await shots_coll.find_one(shot_filter, projection)
+                return doc, summary
+            update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+
+            doc = await shots_coll.find_one_and_update(
+                {**shot_filter, **version_filter(results)},
+                update,
+                projection=projection,
+                return_document=ReturnDocument.AFTER
+            )
+            if doc is not None:
+                await pattern_aggregates.sync_shot(shot_id)
+                summary["hit_count_before"] = results.get("hit_count", 0)
+                summary["pattern_density_before"] = results.get("pattern_density", 0.0)
+                if index is not None:
+                    # Indexet följer med till nästa redigering i sessionen
+                    index.advance(new_key, removed_idx, added_points)
+                    if needs_compaction(index.active):
+                        await self._compact_pellets(shots_coll, shot_filter, shot_id)
+                    else:
+                        pellet_index_cache.put(shot_id, index)
+                logger.debug("edit_hits => %s", summary)
+                return doc, summary
+            pellet_index_cache.discard(shot_id)
+
+        raise HTTPException(409, "Analysen ändrades samtidigt, försök igen.")
+
+    async def _compact_pellets(self, shots_coll, shot_filter: Dict[str, Any], shot_id: Any) -> None:
+        """
+        Skriver om pellet-kolumnerna utan borttagna rader (compact_update).
+        Har någon annan hunnit redigera emellan hoppas det över; nästa
+        redigering som passerar gränsen försöker igen.
+        """
+        pellet_index_cache.discard(shot_id)
+        doc = await shots_coll.find_one(shot_filter, {"analysis_results": 1})
+        results = (doc or {}).get("analysis_results") or {}
+        update = compact_update(results)
+        if update is None:
+            return
+        res = await shots_coll.update_one({**shot_filter, **version_filter(results)}, update)
+        if res.modified_count:
+            logger.info("Kompakterade pellets => shot_id=%s (%d borttagna rader)",
+                        shot_id, len(results.get("removed_idx") or []))
+
+    async def find_hits(
+        self,
+        shot_filter: Dict[str, Any],
+        points: Optional[List[Dict[str, float]]] = None,
+        radius: Optional[float] = None,
+        box: Optional[Dict[str, float]] = None,
+        polygon: Optional[List[Dict[str, float]]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Träffarna i ett urval (samma regler som borttagning i edit_hits),
+        None om skottet saknas. [{"index", "x": %, "y": %}, ...]
+        """
+        db_conn = await db.get_database()
+        shots_coll = db_conn["shots"]
+        for _ in range(2):
+            loaded = await self._load_hit_index(shots_coll, shot_filter, need_index=True)
+            if loaded is None:
+                return None
+            _, results, index = loaded
+            if results is not None:
+                break
+        else:
+            return None
+
+        return [
+            {
+                "index": i,
+                "x": round(float(index.points[i, 0]) / index.width * 100, 2),
+                "y": round(float(index.points[i, 1]) / index.height * 100, 2)
+            }
+            for i in select_hits(index, points, radius, box, polygon)
+        ]
 
+    async def _load_hit_index(
+        self,
+        shots_coll,
+        shot_filter: Dict[str, Any],
+        need_index: bool
+    ) -> Optional[Tuple[Any, Optional[Dict[str, Any]], Optional[PelletIndex]]]:
+        """
+        (shot_id, analysis_results, index) för en redigering; None om skottet
+        saknas. Finns summor + cachat index för aktuell version läses inte
+        pellet-kolumnerna. Ett dokument i äldre format (schema 1) konverteras
+        och ger results None => anroparen läser om.
+        """
+        doc = await shots_coll.find_one(shot_filter, {"analysis_results.pellets": 0})
+        if not doc:
+            return None
+        results = doc.get("analysis_results") or {}
+        index = pellet_index_cache.get(doc["_id"], index_key(results))
+        if index is not None or (not need_index and results.get("accumulators")):
+            return doc["_id"], results, index
+
+        doc = await shots_coll.find_one(shot_filter, {"analysis_results": 1})
+        if not doc:
+            return None
+        results = doc.get("analysis_results") or {}
+        if not is_compact(results):
+            # Äldre format (schema 1) => kolumnformat först, en gång
             await shots_coll.update_one(
-                {"_id": ObjectId(shot_id)},
-                {"$set": {
-                    "analysis_results": analysis_results,
-                    "updated_at": doc["updated_at"]
-                }}
+                {**shot_filter, "analysis_results.schema_version": {"$ne": SCHEMA_VERSION}},
+                {"$set": {"analysis_results": compact_results(results or self.pattern_analyzer._create_empty_analysis())}}
             )
+            return doc["_id"], None, None
 
-            # uppdatera user-stats
-            await self._update_user_statistics(user_id, analysis_results)
-
-            doc["_id"] = str(doc["_id"])
-            return doc
-
-        except Exception as e:
-            logger.error("remove_hits_from_analysis fel => %s", e, exc_info=True)
-            raise HTTPException(500, f"Kunde ej ta bort hagelträffar => {str(e)}")
+        index = PelletIndex.from_results(results)
+        pellet_index_cache.put(doc["_id"], index)
+        return doc["_id"], results, index
 
     async def update_ring(self, shot_id: str, user_id: str, ring_data: Dict[str, float]) -> Dict[str, Any]:
         """
@@ -429,35 +632,26 @@ class AnalysisService:
         try:
             db_conn = await db.get_database()
             shots_coll = db_conn["shots"]
-            doc = await shots_coll.find_one({"_id": ObjectId(shot_id), "user_id": user_id})
-            if not doc:
-                raise HTTPException(404, "Analysen finns ej eller fel user?")
-
-            analysis_results = doc.get("analysis_results", {})
-            # se till att ring finns
-            analysis_results["ring"] = {
+            # Bara ringen skrivs => samtidiga träffredigeringar (och summornas
+            # version, se incremental_stats) påverkas inte
+            ring = {
                 "centerX": ring_data["centerX"],
                 "centerY": ring_data["centerY"],
                 "radius_px": ring_data["radiusPx"]
             }
-
-            # Om du vill kan du re-calc nåt baserat på ring, men här är det valfritt
-            doc["analysis_results"] = analysis_results
-            doc["updated_at"] = datetime.utcnow()
-
-            await shots_coll.update_one(
-                {"_id": ObjectId(shot_id)},
-                {
-                    "$set": {
-                        "analysis_results": analysis_results,
-                        "updated_at": doc["updated_at"]
-                    }
-                }
+            doc = await shots_coll.find_one_and_update(
+                {"_id": ObjectId(shot_id), "user_id": user_id},
+                {"$set": {"analysis_results.ring": ring, "updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER
             )
+            if not doc:
+                raise HTTPException(404, "Analysen finns ej eller fel user?")
 
             doc["_id"] = str(doc["_id"])
-            return doc
+            return expand_shot(doc)
 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("update_ring fel => %s", e, exc_info=True)
             raise HTTPException(500, f"Kunde ej uppdatera ring => {str(e)}")
@@ -465,30 +659,83 @@ class AnalysisService:
     # -------------------------------------------------
     # Hjälpmetoder för filhantering & metadata
     # -------------------------------------------------
-    async def _save_image(self, image_data: bytes, filename: str, user_id: str) -> str:
+    async def _store_upload(self, file: UploadFile, user_id: str) -> SpooledUpload:
         """
-        Sparar bilden i UPLOAD_DIR/<user_id>/<timestamp>_ObjectId.<ext>
-        Returnerar den absoluta sökvägen.
+        Kontrollerar filtyp och strömmar filen till UPLOAD_DIR/<user_id>/...
+        Storleken kontrolleras under läsningen => för stora filer avbryts
+        direkt och lämnar inget kvar på disk.
         """
-        logger.debug("_save_image => user_id=%s, filename=%s", user_id, filename)
+        logger.debug(
+            "Kontrollerar bildtyp=%s, filnamn=%s, user_id=%s",
+            file.content_type, file.filename, user_id
+        )
+        if file.content_type not in self.valid_image_types:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"Otillåten bildtyp '{file.content_type}'. "
+                    f"Tillåtet är: {list(self.valid_image_types.keys())}"
+                )
+            )
+
+        file_path = self._upload_path(file.filename, user_id)
         try:
-            user_dir = Path(settings.UPLOAD_DIR) / user_id
-            user_dir.mkdir(parents=True, exist_ok=True)
+            upload = await spool_upload(file, file_path)
+        except (UploadTooLargeError, EmptyUploadError) as e:
+            raise HTTPException(400, detail=str(e))
+        except Exception as e:
+            logger.error("_store_upload => %s", e, exc_info=True)
+            raise HTTPException(500, f"Kunde inte spara bildfil: {str(e)}")
 
-            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-            extension = Path(filename).suffix
-            new_filename = f"{timestamp}_{ObjectId()}{extension}"
-            file_path = user_dir / new_filename
+        logger.info("Sparade bild => %s (%d bytes)", upload.path, upload.size_bytes)
+        return upload
 
-            async with aiofiles.open(file_path, "wb") as out_file:
-                await out_file.write(image_data)
+    def _build_shot_doc(
+        self,
+        user_id: str,
+        metadata: Dict[str, Any],
+        analysis_results: Dict[str, Any],
+        quality_metrics: Dict[str, float],
+        image_info: Dict[str, Any],
+        analysis_timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Bygger shot-dokumentet (metadata, resultat, bildinfo, publik URL, tags).
+        analysis_timings = ms per analyssteg (se app.services.timing).
+        """
+        valid_meta = self._validate_metadata(metadata)
+        now = datetime.utcnow()
+        shot_doc = {
+            "user_id": user_id,
+            "metadata": valid_meta,  # shotgun/ammunition/conditions
+            "analysis_results": analysis_results,
+            "image_quality": quality_metrics,
+            "analysis_timings": analysis_timings or {},
+            "created_at": now,
+            "updated_at": now,
+            "status": "auto_detected",
+            "image_info": image_info
+        }
 
-            logger.info("Sparade bild => %s", file_path)
-            return str(file_path)
+        # Publik URL
+        basename = os.path.basename(image_info["saved_path"])
+        shot_doc["image_url"] = f"{IMAGES_BASE_URL}/uploads/{user_id}/{basename}"
 
-        except Exception as e:
-            logger.error("_save_image => %s", e, exc_info=True)
-            raise HTTPException(500, f"Kunde inte spara bildfil: {str(e)}")
+        # Bygg tags
+        shot_doc["tags"] = self._generate_tags(valid_meta, analysis_results)
+        logger.debug("shot_doc => %s", shot_doc)
+        return shot_doc
+
+    def _upload_path(self, filename: str, user_id: str) -> str:
+        """
+        UPLOAD_DIR/<user_id>/<timestamp>_ObjectId.<ext> (mappen skapas vid behov).
+        """
+        user_dir = Path(settings.UPLOAD_DIR) / user_id
+        user_dir.mkdir(parents=True, exist_ok=True)
+
+        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        extension = Path(filename).suffix
+        return str(user_dir / f"{timestamp}_{ObjectId()}{extension}")
 
     async def _cleanup_image(self, file_path: str) -> None:
         """
@@ -499,6 +746,8 @@ class AnalysisService:
             if file_path and os.path.exists(file_path):
                 os.remove(file_path)
                 logger.debug("Fil raderad => %s", file_path)
+            if file_path:
+                remove_artifacts(file_path)
         except Exception as e:
             logger.error("_cleanup_image => %s", e, exc_info=True)
             # ingen HTTPException => vill inte stoppa flödet
@@ -514,62 +763,6 @@ class AnalysisService:
                 meta[rk] = {}
         return meta
 
-    # -------------------------------------------------
-    # Stats-uppdatering
-    # -------------------------------------------------
-    async def _update_user_statistics(self, user_id: str, analysis_results: Dict[str, Any]) -> None:
-        """
-        Uppdaterar user-statistik i 'user_statistics', ex. total_shots, total_hits etc.
-        Kallas t.ex. i slutet av 'analyze_shot_image', 'add_hits_to_analysis' m.fl.
-        Hindrar ej flödet om error uppstår.
-        """
-        logger.debug("_update_user_statistics => user=%s", user_id)
-        try:
-            db_conn = await db.get_database()
-            stats_coll = db_conn["user_statistics"]
-
-            new_hits = analysis_results.get("hit_count", 0)
-            new_density = analysis_results.get("pattern_density", 0.0)
-
-            existing = await stats_coll.find_one({"user_id": user_id})
-            if not existing:
-                doc = {
-                    "user_id": user_id,
-                    "total_shots": 1,
-                    "total_hits": new_hits,
-                    "average_hits": new_hits,
-                    "best_pattern_density": new_density,
-                    "last_updated": datetime.utcnow()
-                }
-                await stats_coll.insert_one(doc)
-                logger.debug("Skapade ny user_stats => %s", doc)
-            else:
-                # Enkelt exempel – men tänk på att remove hits ev. borde sänka total_hits
-                total_shots = existing.get("total_shots", 0) + 1
-                total_hits = existing.get("total_hits", 0) + new_hits
-                avg_hits = round(total_hits / total_shots, 2) if total_shots > 0 else new_hits
-                best_density = max(existing.get("best_pattern_density", 0.0), new_density)
-
-                await stats_coll.update_one(
-                    {"user_id": user_id},
-                    {
-                        "$set": {
-                            "total_shots": total_shots,
-                            "total_hits": total_hits,
-                            "average_hits": avg_hits,
-                            "best_pattern_density": best_density,
-                            "last_updated": datetime.utcnow()
-                        }
-                    }
-                )
-                logger.debug(
-                    "Uppdaterade user_stats => user_id=%s, total_shots=%d, total_hits=%d",
-                    user_id, total_shots, total_hits
-                )
-        except Exception as e:
-            logger.error("update_user_statistics => %s", e, exc_info=True)
-            # Kastar ingen HTTPException => vill ej stoppa flödet pga stats-fel.
-
     # -------------------------------------------------
     # Generera "tags"
     # -------------------------------------------------
@@ -616,105 +809,6 @@ class AnalysisService:
         logger.debug("Slutliga tags => %s", unique_tags)
         return unique_tags
 
-    # -------------------------------------------------
-    # Ny helper: Recalc stats från pellets
-    # -------------------------------------------------
-    def _recalc_analysis_stats(self, doc: Dict[str, Any], analysis_results: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        En förenklad metod som återberäknar ex. hit_count, spread, closest_hits baserat på
-        'individual_pellets'. Vi vill *inte* köra om hela OpenCV-analysen, utan bara räkna om
-        statistiken utifrån kända pellets.
-
-        Om du vill ha en mer avancerad approach (t.ex. DBSCAN, zone_analysis),
-        kan du kopiera logik från pattern_analysis.py.
-        """
-
-        logger.debug("[_recalc_analysis_stats] Startar omberäkning baserat på pellets...")
-
-        pellets = analysis_results.get("individual_pellets", [])
-        if not pellets:
-            analysis_results["hit_count"] = 0
-            analysis_results["pattern_density"] = 0.0
-            analysis_results["spread"] = 0.0
-            analysis_results["closest_hits"] = []
-            analysis_results["outer_hits"] = []
-            return analysis_results
-
-        # 1) Räkna antalet
-        count_hits = len(pellets)
-
-        # 2) Hämta bildstorlek (om det finns i doc["image_info"])
-        width = doc.get("image_info", {}).get("width", 1)
-        height = doc.get("image_info", {}).get("height", 1)
-
-        # 3) Räkna centroid (i pixlar)
-        #    pellets är i procent? -> Kolla hur ni sparar. I exempelkoden är x,y i %
-        #    men om de redan är i % ställer vi om dem till px innan spridning
-        px_coords = []
-        for p in pellets:
-            x_px = (p["x"] / 100.0) * width
-            y_px = (p["y"] / 100.0) * height
-            px_coords.append((x_px, y_px))
-
-        # centroid:
-        x_sum = sum([pt[0] for pt in px_coords])
-        y_sum = sum([pt[1] for pt in px_coords])
-        centroid_x_px = x_sum / count_hits
-        centroid_y_px = y_sum / count_hits
-
-        # 4) Räkna spread = standardavvikelse i radie (förenklat)
-        import math
-        import statistics
-        dists = []
-        for pt in px_coords:
-            dx = pt[0] - centroid_x_px
-            dy = pt[1] - centroid_y_px
-            dist = math.sqrt(dx * dx + dy * dy)
-            dists.append(dist)
-
-        spread_val = statistics.pstdev(dists) if len(dists) > 1 else 0.0
-
-        # 5) ex. pattern_density = hits / ( pi * max_dist^2 )? Eller en enkel approach
-        #    Här kan vi göra en enkel approach:
-        #    pattern_density = count_hits / 100.0
-        pattern_density = round(count_hits / 100.0, 2)
-
-        # 6) Hitta closest/outer hits (top 5) från centroid
-        #    Sortera dists
-        sorted_indices = sorted(range(len(dists)), key=lambda i: dists[i])
-        closest = sorted_indices[:5]
-        outer = sorted_indices[-5:] if len(sorted_indices) >= 5 else sorted_indices
-
-        closest_hits = []
-        outer_hits = []
-        for i in closest:
-            # transform back to x%, y%
-            pct_x = (px_coords[i][0] / width) * 100.0
-            pct_y = (px_coords[i][1] / height) * 100.0
-            closest_hits.append({"x": pct_x, "y": pct_y, "distance": dists[i]})
-        for i in outer:
-            pct_x = (px_coords[i][0] / width) * 100.0
-            pct_y = (px_coords[i][1] / height) * 100.0
-            outer_hits.append({"x": pct_x, "y": pct_y, "distance": dists[i]})
-
-        # 7) Spara tillbaka i analysis_results
-        analysis_results["hit_count"] = count_hits
-        analysis_results["pattern_density"] = pattern_density
-        analysis_results["spread"] = round(spread_val, 2)
-
-        # centroid i %:
-        analysis_results["centroid"] = {
-            "x": round((centroid_x_px / width) * 100, 2),
-            "y": round((centroid_y_px / height) * 100, 2)
-        }
-
-        analysis_results["closest_hits"] = closest_hits
-        analysis_results["outer_hits"] = outer_hits
-
-        logger.debug("[_recalc_analysis_stats] KLAR -> hits=%s, density=%.2f, spread=%.2f",
-                     count_hits, pattern_density, spread_val)
-        return analysis_results
-
 
 # Singleton-instans att importera och använda i dina rutter
 analysis_service = AnalysisService()
@@ -0,0 +1,264 @@
+"""
+Kategoriträdet, kompilerat en gång och oföränderligt.
+
+GET /categories byggde tidigare om en ~90 poster lång översättningstabell
+för varje kategori i varje request och ändrade dokumenten på plats.
+CategoryTree byggs i stället en gång ur 'categories' (via SharedCache i
+forum_categories, så det byggs om när kategorierna ändras) och innehåller:
+
+    nodes         id => CategoryNode (name_sv/name_en, description_sv/_en,
+                  parent_id, children, ancestors = id:n från roten och ned)
+    roots         huvudkategorierna
+    json(lang)    hela listan som färdig JSON (bytes) per språk
+    node_json()   en kategori som färdig JSON per språk
+
+så att /categories och /categories/{id} bara skickar färdiga bytes.
+Svaren har samma form som CategoryResponse. Språk utöver LANGUAGES får
+svenska.
+
+Antalen (threadCount/postCount, se forum_counters) är de som gällde när
+trädet byggdes, dvs. högst FORUM_CATEGORY_CACHE_TTL sekunder gamla.
+"""
+import json
+from dataclasses import dataclass, replace
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+LANGUAGES = ("sv", "en")
+DEFAULT_LANGUAGE = "sv"
+
+# Svenska kategorinamn => engelska (förenklade översättningar)
+NAME_TRANSLATIONS: Mapping[str, str] = MappingProxyType({
+    "Jakt": "Hunting",
+    "Allmän Jakt": "General Hunting",
+    "Jaktberättelser och Upplevelser": "Hunting Stories and Experiences",
+    "Nyheter och Uppdateringar": "News and Updates",
+    "Jaktetik och Säkerhet": "Hunting Ethics and Safety",
+    "Jaktmetoder": "Hunting Methods",
+    "Jaktformer": "Hunting Forms",
+    "Smygjakt": "Stalking",
+    "Vakjakt": "Stand Hunting",
+    "Drivjakt": "Driven Hunt",
+    "Viltarter": "Game Species",
+    "Klövvilt": "Hoofed Game",
+    "Rovdjur": "Predators",
+    "Fågeljakt": "Bird Hunting",
+    "Jakt i Olika Miljöer": "Hunting in Different Environments",
+    "Jaktresor och Internationell Jakt": "Hunting Trips and International Hunting",
+    "Utrustning för Jakt": "Hunting Equipment",
+    "Viltvård och Ekologi": "Game Management and Ecology",
+    "Jakt och Mat": "Hunting and Food",
+    "Tradition och Kultur inom Jakt": "Tradition and Culture in Hunting",
+    "Etik och Filosofi kring Jakt": "Ethics and Philosophy of Hunting",
+    "Jakthundar och Träning": "Hunting Dogs and Training",
+    "Vapen och Ammunition": "Weapons and Ammunition",
+    "Handladdning": "Reloading",
+    "Bushcraft och Prepping": "Bushcraft and Prepping",
+    "Vapenpolitik och Juridik": "Weapons Policy and Law",
+    "Marknad och Utbyte": "Market and Exchange",
+    "Gemenskap och Diskussionsämnen": "Community and Discussion Topics",
+    # Nya översättningar för återstående kategorier
+    "Jakt i Sverige": "Hunting in Sweden",
+    "Jakt i Norden": "Hunting in Scandinavia",
+    "Jakt i Europa": "Hunting in Europe",
+    "Jakt i Övriga Världen": "Hunting in the Rest of the World",
+    "Vapen och Optik": "Firearms and Optics",
+    "Kläder och Utrustning": "Clothing and Equipment",
+    "Jaktfordon": "Hunting Vehicles",
+    "Viltförvaltning": "Wildlife Management",
+    "Biotopvård": "Habitat Management",
+    "Rovdjursförvaltning": "Predator Management",
+    "Styckning och Slakt": "Butchering and Slaughtering",
+    "Viltkött och Matlagning": "Game Meat and Cooking",
+    "Förvaring och Konservering": "Storage and Preservation",
+    "Allmän Vapendiskussion": "General Firearms Discussion",
+    "Vapenrecensioner": "Firearm Reviews",
+    "Vapentyper": "Types of Firearms",
+    "Vapenvård och Underhåll": "Firearm Care and Maintenance",
+    "Ammunition": "Ammunition",
+    "Långhållsskytte": "Long-Range Shooting",
+    "Tävlingsskytte": "Competitive Shooting",
+    "Tillbehör och Utrustning": "Accessories and Equipment",
+    "Historia och Kultur": "History and Culture",
+    "Handladdning - kula": "Reloading - Bullets",
+    "Introduktion till Handladdning av kula": "Introduction to Bullet Reloading",
+    "Lagkrav och Regler för Handladdning": "Legal Requirements and Rules for Reloading",
+    "Fördelar och Nackdelar med Handladdning": "Pros and Cons of Reloading",
+    "Utrustning och Verktyg": "Equipment and Tools",
+    "Säkerhet vid Handladdning": "Reloading Safety",
+    "Recept och Tester": "Recipes and Tests",
+    "Kulor och Krut": "Bullets and Powder",
+    "Precision och Optimering": "Precision and Optimization",
+    "Handladdning - hagel": "Reloading - Shotshells",
+    "Överlevnadstekniker": "Survival Techniques",
+    "Eldstart och Matlagning": "Fire Starting and Cooking",
+    "Skydd och Boende i Naturen": "Shelter and Living in Nature",
+    "Ryggsäckar och Utrustning för Vandring": "Backpacks and Hiking Equipment",
+    "Prepping och Krisberedskap": "Prepping and Emergency Preparedness",
+    "Matlagring och Vattenförvaring": "Food Storage and Water Preservation",
+    "Krisplaner och Kommunikation": "Emergency Plans and Communication",
+    "Första Hjälpen och Medicinsk Utrustning": "First Aid and Medical Equipment",
+    "Fördjupningar och Specialämnen": "Deep Dives and Special Topics",
+    "Vapenlagar": "Firearms Laws",
+    "Sverige och Internationella Jämförelser": "Sweden and International Comparisons",
+    "Diskutera Nya Förslag": "Discussing New Proposals",
+    "Aktivism och Föreningar": "Activism and Associations",
+    "Bevara Vapenägande": "Preserving Gun Ownership",
+    "Amerikansk Vapenpolitik": "American Gun Politics",
+    "Köp och Sälj": "Buy and Sell",
+    "Jaktutbyte och Arrangemang": "Hunting Exchange and Arrangements",
+    "Specialerbjudanden och Tips": "Special Offers and Tips",
+    "Byteshandel och Donationer": "Bartering and Donations",
+    "Internationellt Utbyte": "International Exchange",
+    "Introduktioner": "Introductions",
+    "Off-Topic": "Off-Topic",
+    "Händelser och Mässor": "Events and Trade Shows",
+    "Hobbyer och Sidoprojekt": "Hobbies and Side Projects",
+    "Lokala Grupper och Gemenskaper": "Local Groups and Communities",
+    "Livsstil och Filosofi": "Lifestyle and Philosophy",
+    "Välgörenhet och Samhällsprojekt": "Charity and Community Projects"
+})
+
+# Svenska beskrivningar => engelska
+DESCRIPTION_TRANSLATIONS: Mapping[str, str] = MappingProxyType({
+    "Diskussioner om jakt, metoder, arter och utrustning":
+        "Discussions about hunting, methods, species and equipment",
+    "Jaktberättelser och upplevelser":
+        "Hunting stories and experiences",
+    "Strategier och tekniker för olika jaktformer":
+        "Strategies and techniques for different hunting forms"
+})
+
+def english_name(swedish_name: str) -> str:
+    return NAME_TRANSLATIONS.get(swedish_name, swedish_name)
+
+
+def english_description(swedish_description: str) -> str:
+    return DESCRIPTION_TRANSLATIONS.get(swedish_description, swedish_description)
+
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+@dataclass(frozen=True)
+class CategoryNode:
+    id: str
+    parent_id: Optional[str]
+    name_sv: str
+    name_en: str
+    description_sv: str
+    description_en: str
+    type: str
+    thread_count: int
+    post_count: int
+    created_at: Optional[str]
+    updated_at: Optional[str]
+    children: Tuple[str, ...] = ()
+    ancestors: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "CategoryNode":
+        name_sv = doc.get("name_sv") or doc.get("name") or ""
+        description_sv = doc.get("description_sv") or doc.get("description") or ""
+        return cls(
+            id=str(doc["_id"]),
+            parent_id=str(doc["parent_id"]) if doc.get("parent_id") else None,
+            name_sv=name_sv,
+            name_en=doc.get("name_en") or english_name(name_sv),
+            description_sv=description_sv,
+            description_en=doc.get("description_en") or english_description(description_sv),
+            type=doc.get("type") or "discussion",
+            thread_count=int(doc.get("threadCount") or 0),
+            post_count=int(doc.get("postCount") or 0),
+            created_at=_iso(doc.get("created_at")),
+            updated_at=_iso(doc.get("updated_at")),
+        )
+
+    def response(self, language: str) -> Dict[str, Any]:
+        """
+        Som CategoryResponse (by_alias => "_id").
+        """
+        english = language == "en"
+        return {
+            "_id": self.id,
+            "name": self.name_en if english else self.name_sv,
+            "description": self.description_en if english else self.description_sv,
+            "type": self.type,
+            "parent_id": self.parent_id,
+            "threadCount": self.thread_count,
+            "postCount": self.post_count,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CategoryTree:
+    """
+    CategoryTree
+    ------------
+    Oföränderligt: noderna är frysta och JSON:en renderas i konstruktorn.
+    Ett nytt träd byggs vid varje ändring (from_documents).
+    """
+
+    def __init__(self, nodes: Iterable[CategoryNode]):
+        nodes = list(nodes)
+        by_id = {node.id: node for node in nodes}
+        children: Dict[str, List[str]] = {node.id: [] for node in nodes}
+        for node in nodes:
+            if node.parent_id in children:
+                children[node.parent_id].append(node.id)
+
+        def ancestors(node: CategoryNode) -> Tuple[str, ...]:
+            path: List[str] = []
+            current = by_id.get(node.parent_id) if node.parent_id else None
+            while current is not None and current.id not in path and current.id != node.id:
+                path.append(current.id)
+                current = by_id.get(current.parent_id) if current.parent_id else None
+            return tuple(reversed(path))
+
+        compiled = [
+            replace(node, children=tuple(children[node.id]), ancestors=ancestors(node))
+            for node in nodes
+        ]
+        self.order: Tuple[str, ...] = tuple(node.id for node in compiled)
+        self.nodes: Mapping[str, CategoryNode] = MappingProxyType({node.id: node for node in compiled})
+        self.roots: Tuple[str, ...] = tuple(node.id for node in compiled if node.parent_id not in self.nodes)
+        self._json = MappingProxyType({
+            language: _dumps([self.nodes[i].response(language) for i in self.order])
+            for language in LANGUAGES
+        })
+        self._node_json = MappingProxyType({
+            language: MappingProxyType({i: _dumps(self.nodes[i].response(language)) for i in self.order})
+            for language in LANGUAGES
+        })
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Dict[str, Any]]) -> "CategoryTree":
+        return cls(CategoryNode.from_document(doc) for doc in docs)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @staticmethod
+    def _language(language: str) -> str:
+        return language if language in LANGUAGES else DEFAULT_LANGUAGE
+
+    def json(self, language: str) -> bytes:
+        return self._json[self._language(language)]
+
+    def node_json(self, category_id: str, language: str) -> Optional[bytes]:
+        return self._node_json[self._language(language)].get(category_id)
+
+    def children(self, category_id: str) -> Tuple[str, ...]:
+        node = self.nodes.get(category_id)
+        return node.children if node else ()
+
+    def ancestors(self, category_id: str) -> Tuple[str, ...]:
+        node = self.nodes.get(category_id)
+        return node.ancestors if node else ()
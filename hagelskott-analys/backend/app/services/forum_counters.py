@@ -0,0 +1,279 @@
+"""
+Denormaliserade antal i forumet, uppdaterade atomiskt med $inc.
+
+    threads     post_count, reply_count   inlägg i tråden (trådens egen text
+                                          ligger i tråddokumentet => varje
+                                          inlägg är ett svar)
+    categories  threadCount, postCount    trådar/inlägg i kategorin och alla
+                                          underkategorier (som CategoryResponse)
+
+Händelserna (ny/raderad tråd eller inlägg, flyttad/raderad kategori) ökar
+eller minskar tråden och kategorin + alla dess föräldrar med en update_many,
+så listorna kan läsa antalen direkt ur dokumenten i stället för att räkna
+per rad.
+
+Skrivningarna loggar fel men kastar aldrig; det som missats (eller data som
+ändrats vid sidan av API:t, t.ex. seedning) rättas av reconcile(), som
+räknar om allt ur 'posts'/'threads'. ForumCountersJob kör den vid start och
+sedan periodiskt (FORUM_COUNTERS_RECONCILE_INTERVAL), med en lease i
+'maintenance_locks' så att bara en process räknar. En händelse som skrivs
+medan omräkningen pågår kan skrivas över och kommer då med vid nästa.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.db.mongodb import db
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def category_counts_pipeline(match: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Kategorier (ev. filtrerade med match) med thread_count (trådar direkt i
+    kategorin) och post_count (inlägg i de trådarna), i en enda aggregering.
+
+    threads.category_id och posts.thread_id är strängar => _id konverteras i
+    $lookup. Med indexen på threads.category_id och posts.thread_id (se
+    connect_db) blir varje uppslag en indexsökning och inga tråd-id:n
+    behöver hämtas till Python.
+    """
+    return [
+        {"$match": match or {}},
+        {"$lookup": {
+            "from": "threads",
+            "let": {"category_id": {"$toString": "$_id"}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$category_id", "$$category_id"]}}},
+                {"$lookup": {
+                    "from": "posts",
+                    "let": {"thread_id": {"$toString": "$_id"}},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$thread_id", "$$thread_id"]}}},
+                        {"$count": "n"},
+                    ],
+                    "as": "posts",
+                }},
+                {"$group": {
+                    "_id": None,
+                    "thread_count": {"$sum": 1},
+                    "post_count": {"$sum": {"$ifNull": [{"$arrayElemAt": ["$posts.n", 0]}, 0]}},
+                }},
+            ],
+            "as": "counts",
+        }},
+        {"$addFields": {
+            "thread_count": {"$ifNull": [{"$arrayElemAt": ["$counts.thread_count", 0]}, 0]},
+            "post_count": {"$ifNull": [{"$arrayElemAt": ["$counts.post_count", 0]}, 0]},
+        }},
+        {"$project": {"counts": 0}},
+    ]
+
+
+def _thread_counts_pipeline() -> List[Dict[str, Any]]:
+    """
+    threads => post_count/reply_count ur 'posts', skrivet tillbaka med $merge.
+    """
+    return [
+        {"$lookup": {
+            "from": "posts",
+            "let": {"thread_id": {"$toString": "$_id"}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$thread_id", "$$thread_id"]}}},
+                {"$count": "n"},
+            ],
+            "as": "posts",
+        }},
+        {"$project": {"post_count": {"$ifNull": [{"$arrayElemAt": ["$posts.n", 0]}, 0]}}},
+        {"$addFields": {"reply_count": "$post_count"}},
+        {"$merge": {"into": "threads", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}},
+    ]
+
+
+def _category_id(value: Any) -> Optional[str]:
+    return str(value) if value else None
+
+
+class ForumCounters:
+    """
+    ForumCounters
+    -------------
+    Kategori-id:n är strängar (som threads.category_id); parent_id kan vara
+    ObjectId eller sträng.
+    """
+
+    async def _chain(self, database, category_id: Optional[str]) -> List[Any]:
+        """
+        _id för kategorin och alla dess föräldrar (en fråga, ~100 kategorier).
+        """
+        if not category_id:
+            return []
+        parents: Dict[str, Any] = {}
+        ids: Dict[str, Any] = {}
+        async for cat in database.categories.find({}, {"parent_id": 1}):
+            ids[str(cat["_id"])] = cat["_id"]
+            parents[str(cat["_id"])] = _category_id(cat.get("parent_id"))
+        chain = []
+        current = str(category_id)
+        while current in ids and ids[current] not in chain:
+            chain.append(ids[current])
+            current = parents[current]
+        return chain
+
+    async def _inc_categories(self, category_id: Optional[str], threads: int, posts: int) -> None:
+        if not threads and not posts:
+            return
+        try:
+            database = await db.get_database()
+            chain = await self._chain(database, category_id)
+            if chain:
+                await database.categories.update_many(
+                    {"_id": {"$in": chain}},
+                    {"$inc": {"threadCount": threads, "postCount": posts}}
+                )
+        except Exception as e:
+            logger.error(f"[forum_counters] Kunde ej uppdatera kategori {category_id} => {e}", exc_info=True)
+
+    async def _inc_thread(self, thread_id: str, posts: int) -> None:
+        try:
+            database = await db.get_database()
+            await database.threads.update_one(
+                {"_id": ObjectId(thread_id)},
+                {"$inc": {"post_count": posts, "reply_count": posts}}
+            )
+        except Exception as e:
+            logger.error(f"[forum_counters] Kunde ej uppdatera tråd {thread_id} => {e}", exc_info=True)
+
+    async def thread_created(self, category_id: str) -> None:
+        await self._inc_categories(category_id, 1, 0)
+
+    async def thread_deleted(self, category_id: str, posts: int) -> None:
+        await self._inc_categories(category_id, -1, -posts)
+
+    async def post_created(self, thread: Dict[str, Any]) -> None:
+        await self._inc_thread(str(thread["_id"]), 1)
+        await self._inc_categories(thread.get("category_id"), 0, 1)
+
+    async def post_deleted(self, thread: Dict[str, Any]) -> None:
+        await self._inc_thread(str(thread["_id"]), -1)
+        await self._inc_categories(thread.get("category_id"), 0, -1)
+
+    async def category_moved(self, category: Dict[str, Any], new_parent_id: Optional[str]) -> None:
+        """
+        Kategorins antal flyttas från de gamla föräldrarna till de nya
+        (anropas före uppdateringen, category = dokumentet före flytten).
+        """
+        threads, posts = int(category.get("threadCount") or 0), int(category.get("postCount") or 0)
+        await self._inc_categories(_category_id(category.get("parent_id")), -threads, -posts)
+        await self._inc_categories(_category_id(new_parent_id), threads, posts)
+
+    async def category_deleted(self, category: Dict[str, Any]) -> None:
+        """
+        En raderad kategori (med underkategorier) => minus hos föräldrarna.
+        """
+        await self._inc_categories(
+            _category_id(category.get("parent_id")),
+            -int(category.get("threadCount") or 0), -int(category.get("postCount") or 0)
+        )
+
+    async def reconcile(self) -> Dict[str, int]:
+        """
+        Räknar om alla antal från grunden: trådarna med en aggregering
+        ($merge tillbaka till 'threads'), kategorierna med
+        category_counts_pipeline + summering uppåt i trädet.
+        """
+        database = await db.get_database()
+        await database.threads.aggregate(_thread_counts_pipeline()).to_list(None)
+
+        direct: Dict[str, Dict[str, int]] = {}
+        parents: Dict[str, Optional[str]] = {}
+        ids: Dict[str, Any] = {}
+        async for cat in database.categories.aggregate(category_counts_pipeline()):
+            key = str(cat["_id"])
+            ids[key] = cat["_id"]
+            parents[key] = _category_id(cat.get("parent_id"))
+            direct[key] = {"threadCount": cat["thread_count"], "postCount": cat["post_count"]}
+
+        totals = {key: {"threadCount": 0, "postCount": 0} for key in ids}
+        for key, counts in direct.items():
+            current, seen = key, set()
+            while current in totals and current not in seen:
+                seen.add(current)
+                totals[current]["threadCount"] += counts["threadCount"]
+                totals[current]["postCount"] += counts["postCount"]
+                current = parents[current]
+
+        ops = [UpdateOne({"_id": ids[key]}, {"$set": counts}) for key, counts in totals.items()]
+        for lo in range(0, len(ops), BATCH_SIZE):
+            await database.categories.bulk_write(ops[lo:lo + BATCH_SIZE], ordered=False)
+        return {"categories": len(ops), "threads": await database.threads.estimated_document_count()}
+
+
+class ForumCountersJob:
+    """
+    ForumCountersJob
+    ----------------
+    Omräkning av forumantalen vid start och var FORUM_COUNTERS_RECONCILE_INTERVAL
+    sekund. Startas i lifespan; med flera processer räknar bara den som tar leasen.
+    """
+
+    LOCK_ID = "forum_counters"
+
+    def __init__(self, counters: ForumCounters, interval: Optional[int] = None):
+        self.counters = counters
+        self.interval = settings.FORUM_COUNTERS_RECONCILE_INTERVAL if interval is None else interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"[ForumCountersJob] Omräkning var {self.interval} s.")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                if await self._acquire():
+                    summary = await self.counters.reconcile()
+                    logger.info(f"[ForumCountersJob] Forumantal omräknade => {summary}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[ForumCountersJob] Omräkning misslyckades => {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def _acquire(self) -> bool:
+        """
+        Lease i 'maintenance_locks' som gäller till nästa intervall.
+        """
+        db_conn = await db.get_database()
+        now = datetime.utcnow()
+        try:
+            await db_conn["maintenance_locks"].find_one_and_update(
+                {"_id": self.LOCK_ID, "lease_expires_at": {"$lt": now}},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=self.interval * 0.9)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Leasen finns och har inte gått ut => annan process räknar
+            return False
+
+
+# Singleton-instanser
+forum_counters = ForumCounters()
+forum_counters_job = ForumCountersJob(forum_counters)
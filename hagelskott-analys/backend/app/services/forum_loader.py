@@ -0,0 +1,87 @@
+"""
+Batchhämtning av författare och kategorier för forumlistor (DataLoader-likt).
+
+En sida med 50 trådar gjorde tidigare en users.find_one och en
+categories.find_one per rad. ForumLoader samlar id:n för hela sidan och
+hämtar dem med en $in-fråga per kollektion; det som redan hämtats (eller
+saknas) minns under resten av requesten, så flera listor i samma request
+delar uppslagen. En ny loader per request (Depends(get_forum_loader)) =>
+inga inaktuella användarnamn mellan requests.
+
+    loader = await get_forum_loader()
+    await loader.prime(threads)                  # author_id + category_id
+    loader.author_name(thread["author_id"])      # "Unknown User" om den saknas
+    loader.category(thread["category_id"])       # dokument eller None
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from app.db.mongodb import db
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_AUTHOR = "Unknown User"
+
+# Fälten som listorna visar (resten av dokumenten hämtas inte)
+USER_PROJECTION = {"username": 1}
+CATEGORY_PROJECTION = {"name": 1, "english_name": 1, "name_en": 1, "name_sv": 1, "parent_id": 1}
+
+
+class ForumLoader:
+    """
+    ForumLoader
+    -----------
+    Id:n är strängar (som author_id/category_id i trådar och inlägg).
+    Ogiltiga id:n ger None utan fråga mot databasen.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._users: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._categories: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    async def _load(self, collection: str, cache: Dict[str, Optional[Dict[str, Any]]],
+                    ids: Iterable[Any], projection: Dict[str, int]) -> None:
+        missing = {str(i) for i in ids if i is not None} - cache.keys()
+        valid = [ObjectId(i) for i in missing if ObjectId.is_valid(i)]
+        for key in missing:
+            cache[key] = None
+        if valid:
+            async for doc in self.database[collection].find({"_id": {"$in": valid}}, projection):
+                cache[str(doc["_id"])] = doc
+
+    async def load_users(self, ids: Iterable[Any]) -> None:
+        await self._load("users", self._users, ids, USER_PROJECTION)
+
+    async def load_categories(self, ids: Iterable[Any]) -> None:
+        await self._load("categories", self._categories, ids, CATEGORY_PROJECTION)
+
+    async def prime(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Hämtar författare (author_id) och kategorier (category_id) för alla
+        rader: högst en fråga per kollektion, oavsett antal rader.
+        """
+        await asyncio.gather(
+            self.load_users([row.get("author_id") for row in rows]),
+            self.load_categories([row.get("category_id") for row in rows]),
+        )
+
+    def user(self, user_id: Any) -> Optional[Dict[str, Any]]:
+        return self._users.get(str(user_id)) if user_id is not None else None
+
+    def category(self, category_id: Any) -> Optional[Dict[str, Any]]:
+        return self._categories.get(str(category_id)) if category_id is not None else None
+
+    def author_name(self, user_id: Any) -> str:
+        user = self.user(user_id)
+        return user["username"] if user and user.get("username") else UNKNOWN_AUTHOR
+
+
+async def get_forum_loader() -> ForumLoader:
+    """
+    FastAPI-beroende: en ny loader per request.
+    """
+    return ForumLoader(await db.get_database())
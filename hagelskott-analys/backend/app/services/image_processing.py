@@ -5,8 +5,8 @@ import logging
 from pathlib import Path
 import io
 from datetime import datetime
-from PIL import Image, ImageEnhance
 from app.core.config import settings
+from app.services.preprocessing import PreprocessingPipeline, PreprocessedFrame, enhance_contrast, otsu_bbox
 
 # Konfigurera logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +19,22 @@ class ImageProcessor:
         self.adaptive_c = settings.ADAPTIVE_C
         self.target_size = (800, 800)  # Standardstorlek för bearbetade bilder
 
+        # Gemensam pipeline: omskalning, gråskala, kontrast, brusreducering, CLAHE, Gauss
+        self.pipeline = PreprocessingPipeline(blur_kernel_size=self.blur_kernel_size)
+
+    def preprocess(self, image: np.ndarray) -> PreprocessedFrame:
+        """
+        Förbehandla bild för träffmönsteranalys.
+
+        Returnerar en PreprocessedFrame som PatternAnalyzer.analyze_shot_pattern
+        kan ta emot direkt => ingen andra brusreducering i analysen.
+        """
+        try:
+            return self.pipeline.run(image)
+        except Exception as e:
+            logger.error(f"Error in image preprocessing: {str(e)}")
+            raise
+
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """
         Förbehandla bild för träffmönsteranalys
@@ -29,48 +45,7 @@ class ImageProcessor:
         Returns:
             Förbehandlad bild
         """
-        try:
-            # Kontrollera om bilden är tom eller ogiltig
-            if image is None or image.size == 0:
-                raise ValueError("Ogiltig eller tom bild")
-
-            # Skala om bilden om den är för stor
-            image = self._resize_image(image)
-
-            # Konvertera till gråskala om bilden är i färg
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = image.copy()
-
-            # Förbättra kontrast
-            enhanced = self._enhance_contrast(gray)
-
-            # Brusreducering
-            denoised = cv2.fastNlMeansDenoising(
-                enhanced,
-                None,
-                h=10,
-                templateWindowSize=7,
-                searchWindowSize=21
-            )
-
-            # Adaptiv histogramutjämning
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            equalized = clahe.apply(denoised)
-
-            # Gaussisk oskärpa för att reducera brus ytterligare
-            blurred = cv2.GaussianBlur(
-                equalized,
-                self.blur_kernel_size,
-                0
-            )
-
-            return blurred
-
-        except Exception as e:
-            logger.error(f"Error in image preprocessing: {str(e)}")
-            raise
+        return self.preprocess(image).image
 
     def save_processed_image(
         self,
@@ -127,27 +102,11 @@ class ImageProcessor:
             # Konvertera till gråskala för konturdetektering
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
 
-            # Tröskling för att hitta huvudområdet
-            _, binary = cv2.threshold(
-                gray,
-                0,
-                255,
-                cv2.THRESH_BINARY + cv2.THRESH_OTSU
-            )
-
-            # Hitta konturer
-            contours, _ = cv2.findContours(
-                binary,
-                cv2.RETR_EXTERNAL,
-                cv2.CHAIN_APPROX_SIMPLE
-            )
-
-            if not contours:
+            # Tröskling + största konturen (samma som ROI-steget i pipelinen)
+            bbox = otsu_bbox(gray)
+            if bbox is None:
                 return image
-
-            # Hitta största konturen
-            main_contour = max(contours, key=cv2.contourArea)
-            x, y, w, h = cv2.boundingRect(main_contour)
+            x, y, w, h = bbox
 
             # Lägg till marginal
             margin = 50
@@ -170,7 +129,7 @@ class ImageProcessor:
         """
         Skala om bilden om den är för stor
         """
-        max_dimension = 1600
+        max_dimension = self.pipeline.max_dimension
         height, width = image.shape[:2]
 
         if max(height, width) > max_dimension:
@@ -185,13 +144,8 @@ class ImageProcessor:
         """
         Förbättra bildkontrast
         """
-        # Konvertera till PIL Image för kontrastförbättring
-        pil_image = Image.fromarray(image)
-        enhancer = ImageEnhance.Contrast(pil_image)
-        enhanced_pil = enhancer.enhance(1.5)  # Öka kontrasten med 50%
-        
-        # Konvertera tillbaka till numpy array
-        return np.array(enhanced_pil)
+        # Öka kontrasten med 50% (samma resultat som PIL ImageEnhance, utan PIL-rundresa)
+        return enhance_contrast(image, self.pipeline.contrast_factor)
 
     def analyze_image_quality(self, image: np.ndarray) -> Dict[str, float]:
         """
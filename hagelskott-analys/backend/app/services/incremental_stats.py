@@ -0,0 +1,419 @@
+"""
+Inkrementell statistik för manuellt redigerade träffar.
+
+Att lägga till/ta bort några träffar i ett ark med tusentals pellets ska
+inte räkna om hela mönstret. HitAccumulator håller löpande summor i
+analysis_results.accumulators (schema 2, pixlar):
+
+    n, sum_x, sum_y     => centrum (medelvärdet av träffarna)
+    sum_d, sum_dd       => spridning (standardavvikelse för avstånden)
+    scale_factor        => 1 / pix_per_cm från analysen (för cm-värden)
+    version             => ökas vid varje redigering (optimistisk låsning)
+    epoch               => nytt id varje gång summorna byggs från början
+                           (version börjar då om), se version_filter
+
+Avstånd, zon och kvadrant räknas mot referenscentrum centroid_px, dvs.
+mönstrets centrum vid analysen (samma som PatternStats använde för de
+detekterade träffarna). De ändras alltså inte för befintliga pellets när
+träffar läggs till/tas bort, och zon-/kvadrantantalen kan räknas upp och ned.
+En reanalys ger nytt centrum och nya summor.
+
+Pellets lagras kolumnvis (pellet_storage). Nya träffar läggs sist i
+kolumnerna ($push); borttagna markeras med sitt index i removed_idx
+($addToSet), så att indexen aldrig förskjuts och en redigering blir en enda
+atomisk uppdatering. expand_results hoppar över de borttagna. När
+borttagna rader blir en stor andel av kolumnerna (needs_compaction) skrivs
+kolumnerna om utan dem (compact_update): removed_idx töms och summorna får
+ny epoch, eftersom radindexen ändras. En reanalys skriver också om allt.
+
+edit_update() bygger uppdateringen: O(k) i antalet redigerade träffar,
+utom när den yttersta träffen tas bort (pattern_radius räknas då om ur
+kolumnerna) och första redigeringen av ett dokument utan summor. Vilka
+pellets som tas bort avgörs av anroparen med pellet_index (närmaste träff,
+rektangel, lasso); indexets pixelkoordinater används även här, så
+pellet-kolumnerna behöver inte läsas från databasen vid varje redigering.
+"""
+import math
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.pattern_stats import QUADRANT_NAMES, ZONE_NAMES, ZONE_RADII, _round2
+from app.services.pellet_index import PelletIndex
+from app.services.pellet_storage import active_mask, pellet_pixels, percent_to_pixels
+
+# Kolumnerna skrivs om när minst så många rader är borttagna och de utgör
+# mer än den andelen av alla rader
+COMPACT_MIN_REMOVED = 32
+COMPACT_REMOVED_RATIO = 0.25
+
+
+def _dimensions(results: Dict[str, Any]) -> Tuple[int, int]:
+    dims = results.get("image_dimensions") or {}
+    return max(int(dims.get("width") or 0), 1), max(int(dims.get("height") or 0), 1)
+
+
+class HitAccumulator:
+    """
+    HitAccumulator
+    --------------
+    Löpande summor + zon-/kvadrantantal för ett analysresultat (schema 2).
+    from_results() läser de lagrade summorna eller bygger dem ur kolumnerna
+    (fresh = True => ska skrivas i sin helhet).
+    """
+
+    def __init__(self, width: int, height: int, center: np.ndarray, scale_factor: float = 1.0):
+        self.width = width
+        self.height = height
+        self.center = np.asarray(center, dtype=np.float64)
+        self.scale_factor = scale_factor
+        self.version = 0
+        self.epoch = ""
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_d = 0.0
+        self.sum_dd = 0.0
+        self.zone_counts = np.zeros(len(ZONE_NAMES), dtype=np.int64)
+        self.quadrant_counts = np.zeros(len(QUADRANT_NAMES), dtype=np.int64)
+        self.pattern_radius = 0.0
+        self.fresh = False
+
+    @classmethod
+    def from_results(cls, results: Dict[str, Any], index: Optional[PelletIndex]) -> "HitAccumulator":
+        width, height = _dimensions(results)
+        stored = results.get("accumulators")
+        center = np.asarray(results.get("centroid_px") or [0.0, 0.0], dtype=np.float64)
+        acc = cls(width, height, center, float((stored or {}).get("scale_factor", 1.0)))
+        acc.pattern_radius = float(results.get("pattern_radius") or 0.0)
+
+        if stored:
+            acc.version = int(stored.get("version", 0))
+            acc.epoch = str(stored.get("epoch") or "")
+            acc.n = int(stored.get("n", 0))
+            acc.sum_x = float(stored.get("sum_x", 0.0))
+            acc.sum_y = float(stored.get("sum_y", 0.0))
+            acc.sum_d = float(stored.get("sum_d", 0.0))
+            acc.sum_dd = float(stored.get("sum_dd", 0.0))
+            zones = results.get("zone_analysis") or {}
+            quadrants = results.get("distribution") or {}
+            acc.zone_counts[:] = [int((zones.get(name) or {}).get("hits", 0)) for name in ZONE_NAMES]
+            acc.quadrant_counts[:] = [int((quadrants.get(name) or {}).get("count", 0)) for name in QUADRANT_NAMES]
+            return acc
+
+        # Första redigeringen => bygg summorna ur de aktiva pellets (index krävs)
+        points = index.points[index.active]
+        if len(points) and not results.get("centroid_px"):
+            acc.center = points.mean(axis=0)
+        acc.scale_factor = _infer_scale(results, acc.center)
+        acc.rebase(acc.center)
+        acc.apply(points, 1)
+        return acc
+
+    def rebase(self, center: np.ndarray) -> None:
+        """
+        Nytt referenscentrum, summor och antal nollställs (fresh => skrivs
+        i sin helhet). Bara meningsfullt utan aktiva träffar.
+        """
+        self.center = np.asarray(center, dtype=np.float64)
+        self.n = 0
+        self.sum_x = self.sum_y = self.sum_d = self.sum_dd = 0.0
+        self.zone_counts[:] = 0
+        self.quadrant_counts[:] = 0
+        self.pattern_radius = 0.0
+        self.epoch = new_epoch()
+        self.version = 0
+        self.fresh = True
+
+    # -------------------------------------------------
+    # Klassning mot referenscentrum
+    # -------------------------------------------------
+    def classify(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (avstånd i px, zonindex, kvadrantindex) för points (N, 2) i px,
+        med samma regler som PatternStats.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        offsets = points - self.center
+        d_px = np.sqrt(offsets[:, 0] ** 2 + offsets[:, 1] ** 2)
+        zone = np.digitize(d_px, ZONE_RADII[:-1], right=True)
+        quadrant = 2 * (offsets[:, 1] >= 0) + (offsets[:, 0] >= 0)
+        return d_px, zone.astype(np.int64), quadrant.astype(np.int64)
+
+    def apply(self, points: np.ndarray, sign: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Lägger till (sign = 1) eller drar ifrån (sign = -1) träffarna.
+        """
+        d_px, zone, quadrant = self.classify(points)
+        if len(d_px) == 0:
+            return d_px, zone, quadrant
+        self.n += sign * len(d_px)
+        self.sum_x += sign * float(points[:, 0].sum())
+        self.sum_y += sign * float(points[:, 1].sum())
+        self.sum_d += sign * float(d_px.sum())
+        self.sum_dd += sign * float((d_px ** 2).sum())
+        self.zone_counts += sign * np.bincount(zone, minlength=len(ZONE_NAMES))
+        self.quadrant_counts += sign * np.bincount(quadrant, minlength=len(QUADRANT_NAMES))
+        if sign > 0:
+            self.pattern_radius = max(self.pattern_radius, float(d_px.max()) * self.scale_factor)
+        return d_px, zone, quadrant
+
+    # -------------------------------------------------
+    # Härledda fält
+    # -------------------------------------------------
+    def spread(self) -> float:
+        if self.n <= 0:
+            return 0.0
+        mean = self.sum_d / self.n
+        return math.sqrt(max(self.sum_dd / self.n - mean * mean, 0.0)) * self.scale_factor
+
+    def derived(self) -> Dict[str, Any]:
+        """
+        Fälten i analysis_results som följer av summorna.
+        """
+        n = max(self.n, 0)
+        area = math.pi * self.pattern_radius ** 2
+        return {
+            "centroid": {
+                "x": self.sum_x / n / self.width * 100 if n else 0.0,
+                "y": self.sum_y / n / self.height * 100 if n else 0.0,
+            },
+            "spread": self.spread(),
+            "pattern_radius": self.pattern_radius if n else 0.0,
+            "pattern_density": round(n / area, 4) if n and area > 0 else 0.0,
+        }
+
+    def stored(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "version": self.version,
+            "n": self.n,
+            "sum_x": self.sum_x,
+            "sum_y": self.sum_y,
+            "sum_d": self.sum_d,
+            "sum_dd": self.sum_dd,
+            "scale_factor": self.scale_factor,
+        }
+
+
+def _infer_scale(results: Dict[str, Any], center: np.ndarray) -> float:
+    """
+    scale_factor (cm per px) ur de lagrade avstånden (cm) mot pixelavstånden.
+    """
+    pellets = results.get("pellets") or {}
+    stored = np.asarray([np.nan if d is None else d for d in pellets.get("distance") or []], dtype=np.float64)
+    points = pellet_pixels(results).astype(np.float64)
+    if len(stored) != len(points) or len(points) == 0:
+        return 1.0
+    d_px = np.linalg.norm(points - center, axis=1)
+    usable = np.isfinite(stored) & (d_px > 5)
+    if not usable.any():
+        return 1.0
+    return float(np.median(stored[usable] / d_px[usable]))
+
+
+def _hit_key(x: float, y: float) -> Tuple[float, float]:
+    return round(float(x), 2), round(float(y), 2)
+
+
+def cancel_pending(
+    added: List[Dict[str, float]],
+    removed: List[Dict[str, float]]
+) -> Tuple[List[Dict[str, float]], List[Dict[str, float]]]:
+    """
+    En träff som läggs till och tas bort i samma anrop (samma koordinater,
+    två decimaler) tar ut varandra => (kvarvarande tillagda, borttagna).
+    """
+    pending = list(added)
+    keys = [_hit_key(h["x"], h["y"]) for h in pending]
+    remaining = []
+    for h in removed:
+        key = _hit_key(h["x"], h["y"])
+        if key in keys:
+            i = keys.index(key)
+            del keys[i], pending[i]
+        else:
+            remaining.append(h)
+    return pending, remaining
+
+
+def edit_update(
+    results: Dict[str, Any],
+    index: Optional[PelletIndex],
+    added: List[Dict[str, float]],
+    removed_idx: List[int]
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    MongoDB-uppdatering för en redigering av shots.analysis_results
+    (schema 2). added = [{"x": %, "y": %}, ...]; removed_idx = radindex i
+    pellet-kolumnerna (från index, se pellet_index.select_hits). index
+    behövs bara för borttagning och första gången (utan accumulators);
+    pellet-kolumnerna i results används bara då.
+
+    Returns:
+        (update eller None om inget ändras, sammanfattning {hit_count, ...})
+        Anroparen ska villkora uppdateringen med version_filter(results).
+    """
+    acc = HitAccumulator.from_results(results, index)
+    prefix = "analysis_results"
+    pending = [_hit_key(h["x"], h["y"]) for h in added]
+    if index is not None:
+        removed_idx = [int(i) for i in dict.fromkeys(removed_idx) if 0 <= i < len(index.active) and index.active[i]]
+    else:
+        removed_idx = []
+
+    if not pending and not removed_idx:
+        return None, {"hit_count": acc.n, **acc.derived(), "added": 0, "removed": 0}
+
+    before = acc.stored()
+    zones_before = acc.zone_counts.copy()
+    quadrants_before = acc.quadrant_counts.copy()
+    radius_before = acc.pattern_radius
+
+    # Samma omräkning procent => px som pellet_pixels (borttagning räknar likadant)
+    new_points = percent_to_pixels(
+        [x for x, _ in pending], [y for _, y in pending], acc.width, acc.height
+    ).astype(np.float64)
+
+    update: Dict[str, Any] = {"$set": {}, "$inc": {}}
+    if removed_idx:
+        d_px, _, _ = acc.apply(index.points[removed_idx], -1)
+        if len(d_px) and float(d_px.max()) * acc.scale_factor >= acc.pattern_radius - 1e-9:
+            # Den yttersta träffen försvann => nytt max ur de kvarvarande
+            keep = index.active.copy()
+            keep[removed_idx] = False
+            remaining, _, _ = acc.classify(index.points[keep])
+            acc.pattern_radius = float(remaining.max()) * acc.scale_factor if len(remaining) else 0.0
+        update["$addToSet"] = {f"{prefix}.removed_idx": {"$each": removed_idx}}
+
+    if len(new_points) and acc.n == 0:
+        # Inga aktiva träffar kvar => de nya träffarna bestämmer centrum
+        acc.rebase(new_points.mean(axis=0))
+
+    if len(new_points):
+        d_px, zone, quadrant = acc.apply(new_points, 1)
+        update["$push"] = {
+            f"{prefix}.pellets.x": {"$each": [x for x, _ in pending]},
+            f"{prefix}.pellets.y": {"$each": [y for _, y in pending]},
+            f"{prefix}.pellets.distance": {"$each": _round2(d_px * acc.scale_factor)},
+            f"{prefix}.pellets.zone": {"$each": zone.tolist()},
+            f"{prefix}.pellets.quadrant": {"$each": quadrant.tolist()},
+        }
+
+    acc.version += 1
+    derived = acc.derived()
+    if acc.fresh:
+        # Första redigeringen: lagrade antal kan vara inaktuella (t.ex. tömd zone_analysis)
+        update["$set"].update({
+            f"{prefix}.accumulators": acc.stored(),
+            f"{prefix}.hit_count": acc.n,
+            f"{prefix}.centroid_px": [float(acc.center[0]), float(acc.center[1])],
+            f"{prefix}.zone_analysis": _zone_analysis(acc),
+            f"{prefix}.distribution": {
+                name: {"count": int(acc.quadrant_counts[i])} for i, name in enumerate(QUADRANT_NAMES)
+            },
+        })
+    else:
+        after = acc.stored()
+        inc = update["$inc"]
+        for key in ("version", "n", "sum_x", "sum_y", "sum_d", "sum_dd"):
+            if after[key] != before[key]:
+                inc[f"{prefix}.accumulators.{key}"] = after[key] - before[key]
+        if after["n"] != before["n"]:
+            inc[f"{prefix}.hit_count"] = after["n"] - before["n"]
+        for i, name in enumerate(ZONE_NAMES):
+            if acc.zone_counts[i] != zones_before[i]:
+                inc[f"{prefix}.zone_analysis.{name}.hits"] = int(acc.zone_counts[i] - zones_before[i])
+            update["$set"][f"{prefix}.zone_analysis.{name}.percentage"] = _percentage(acc.zone_counts[i], acc.n)
+        for i, name in enumerate(QUADRANT_NAMES):
+            if acc.quadrant_counts[i] != quadrants_before[i]:
+                inc[f"{prefix}.distribution.{name}.count"] = int(acc.quadrant_counts[i] - quadrants_before[i])
+
+    if acc.pattern_radius != radius_before or acc.fresh:
+        update["$set"][f"{prefix}.pattern_radius"] = derived["pattern_radius"]
+    update["$set"].update({
+        f"{prefix}.centroid": derived["centroid"],
+        f"{prefix}.spread": derived["spread"],
+        f"{prefix}.pattern_density": derived["pattern_density"],
+    })
+    # Närmaste/yttersta träffar räknas fram vid läsning (expand_results)
+    update["$unset"] = {f"{prefix}.closest_idx": "", f"{prefix}.outer_idx": ""}
+    update = {op: fields for op, fields in update.items() if fields}
+
+    summary = {
+        "hit_count": acc.n, **derived,
+        "added": len(new_points), "removed": len(removed_idx),
+        # För pellet_index (advance), plockas bort av edit_hits
+        "added_points": new_points,
+        "index_key": (acc.epoch, acc.version),
+    }
+    return update, summary
+
+
+def version_filter(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Villkor som gör edit_update() till en jämför-och-byt: uppdateringen
+    matchar bara om ingen annan redigering hunnit emellan.
+    """
+    stored = results.get("accumulators")
+    if not stored:
+        return {"analysis_results.accumulators": {"$exists": False}}
+    return {
+        "analysis_results.accumulators.epoch": stored.get("epoch"),
+        "analysis_results.accumulators.version": int(stored.get("version", 0)),
+    }
+
+
+def new_epoch() -> str:
+    return uuid.uuid4().hex
+
+
+def needs_compaction(active: np.ndarray) -> bool:
+    """
+    active = bool per kolumnrad (active_mask / PelletIndex.active).
+    """
+    removed = len(active) - int(np.count_nonzero(active))
+    return removed >= COMPACT_MIN_REMOVED and removed > COMPACT_REMOVED_RATIO * len(active)
+
+
+def compact_update(results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    MongoDB-uppdatering som skriver om pellet-kolumnerna utan raderna i
+    removed_idx (schema 2, kolumnerna måste finnas i results). Summor och
+    antal är desamma (samma aktiva träffar), men radindexen ändras => ny
+    epoch så att cachade index (pellet_index_cache) blir inaktuella.
+    None om inget är borttaget eller kolumnerna inte är lika långa.
+    Anroparen ska villkora uppdateringen med version_filter(results).
+    """
+    active = active_mask(results)
+    if active.all():
+        return None
+    pellets = results.get("pellets") or {}
+    if any(len(values or []) != len(active) for values in pellets.values()):
+        return None
+    keep = np.flatnonzero(active).tolist()
+    prefix = "analysis_results"
+    update: Dict[str, Any] = {
+        "$set": {f"{prefix}.pellets": {name: [values[i] for i in keep] for name, values in pellets.items()}},
+        "$unset": {f"{prefix}.removed_idx": ""},
+    }
+    if results.get("accumulators"):
+        update["$set"][f"{prefix}.accumulators.epoch"] = new_epoch()
+        update["$set"][f"{prefix}.accumulators.version"] = 0
+    return update
+
+
+def _percentage(count: int, total: int) -> float:
+    return round(int(count) / total * 100, 2) if total > 0 else 0
+
+
+def _zone_analysis(acc: HitAccumulator) -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {
+            "radius": ZONE_RADII[i],
+            "hits": int(acc.zone_counts[i]),
+            "percentage": _percentage(acc.zone_counts[i], acc.n),
+        }
+        for i, name in enumerate(ZONE_NAMES)
+    }
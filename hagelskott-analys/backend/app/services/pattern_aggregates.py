@@ -0,0 +1,348 @@
+"""
+Förberäknade mönsterresultat per laddning/hagelgevär (collection
+'pattern_aggregates').
+
+En rad per (laddning, kaliber, choke, avstånd) med antal skott och summor +
+kvadratsummor per mått (METRICS) => medelvärde och varians räknas vid
+läsning:
+
+    mean = sum / n,  var = sumsq / n - mean ** 2   (populationsvarians)
+
+Summorna kan uppdateras med $inc, så ett nytt eller ändrat skott kostar en
+uppdatering per berörd rad i stället för en genomsökning av 'shots'.
+"Bästa choke för laddningen på 35 m" blir ett indexuppslag på (load,
+distance) som ger en rad per choke/kaliber.
+
+Varje skott sparar sitt bidrag (shots.aggregate_contribution: nyckel +
+måttvärden). sync_shot() byter bidraget atomiskt (find_one_and_update,
+dokumentet före) och drar sedan bort det gamla och lägger till det nya =>
+metadata som ändras, omanalyser och redigerade träffar flyttar skottet
+till rätt rad utan dubbelräkning, även vid samtidiga ändringar.
+rebuild() räknar om allt från 'shots' (t.ex. efter att METRICS ändrats).
+"""
+import logging
+import math
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from app.core.config import settings
+from app.db.mongodb import db
+from app.services.pattern_stats import ZONE_NAMES
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "pattern_aggregates"
+
+# Mått => riktning för "bäst" (max/min)
+METRICS: Dict[str, str] = {
+    "hit_count": "max",
+    "pattern_density": "max",
+    "spread": "min",
+    **{f"zone_{name}": "max" for name in ZONE_NAMES if name != "extreme"},
+    "zone_extreme": "min",
+}
+
+# Fält i shots som behövs för bidraget (pellet-kolumnerna läses aldrig)
+SHOT_PROJECTION = {
+    "metadata": 1,
+    "aggregate_contribution": 1,
+    "analysis_results.hit_count": 1,
+    "analysis_results.pattern_density": 1,
+    "analysis_results.spread": 1,
+    "analysis_results.zone_analysis": 1,
+}
+
+
+def _normalize(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def load_label(ammunition: Dict[str, Any]) -> Optional[str]:
+    """
+    Läsbar identitet för laddningen: fabrikat + modell för fabriksammunition,
+    komponenterna för en handladdning. None => okänd laddning (räknas inte).
+    """
+    if not ammunition:
+        return None
+    if ammunition.get("load_id"):
+        return str(ammunition["load_id"])
+    if ammunition.get("type") == "handload":
+        def fmt(field: str, pattern: str) -> Optional[str]:
+            value = _number(ammunition.get(field))
+            return pattern.format(value) if value else None
+
+        parts = [
+            ammunition.get("powder_type"),
+            fmt("powder_weight", "{:g} g"),
+            ammunition.get("shot_material"),
+            fmt("shot_size", "#{:g}"),
+            fmt("shot_weight", "{:g} g"),
+        ]
+        parts = [str(p) for p in parts if p]
+        return "Handladdning " + " / ".join(parts) if parts else None
+    name = " ".join(
+        str(p) for p in (ammunition.get("manufacturer"), ammunition.get("modelName") or ammunition.get("model")) if p
+    )
+    return name or None
+
+
+def aggregate_key(metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    {_id, load, load_label, gauge, choke, distance} för skottets metadata,
+    None om laddning eller avstånd saknas.
+    """
+    metadata = metadata or {}
+    shotgun = metadata.get("shotgun") or {}
+    ammunition = metadata.get("ammunition") or {}
+    conditions = metadata.get("conditions") or {}
+
+    label = load_label(ammunition)
+    distance = _number(metadata.get("distance") or conditions.get("distance"))
+    if not label or distance is None:
+        return None
+
+    gauge = shotgun.get("gauge") or ammunition.get("gauge")
+    choke = shotgun.get("choke")
+    key = {
+        "load": _normalize(label),
+        "load_label": label,
+        "gauge": _normalize(gauge) if gauge not in (None, "") else None,
+        "choke": str(getattr(choke, "value", choke)).strip() if choke else None,
+        "distance": int(round(distance)),
+    }
+    key["_id"] = "|".join(
+        "-" if key[field] is None else str(key[field]) for field in ("load", "gauge", "choke", "distance")
+    )
+    return key
+
+
+def shot_values(analysis_results: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Måttvärden (METRICS) för ett skotts analysresultat.
+    """
+    results = analysis_results or {}
+    zones = results.get("zone_analysis") or {}
+    values = {
+        "hit_count": _number(results.get("hit_count")),
+        "pattern_density": _number(results.get("pattern_density")),
+        "spread": _number(results.get("spread")),
+    }
+    for name in ZONE_NAMES:
+        values[f"zone_{name}"] = _number((zones.get(name) or {}).get("percentage"))
+    return {metric: value for metric, value in values.items() if value is not None}
+
+
+def contribution(shot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    key = aggregate_key(shot.get("metadata") or {})
+    if key is None:
+        return None
+    return {"key": key, "values": shot_values(shot.get("analysis_results") or {})}
+
+
+def _inc(values: Dict[str, float], sign: int) -> Dict[str, float]:
+    inc: Dict[str, float] = {"n": sign}
+    for metric, value in values.items():
+        inc[f"count.{metric}"] = sign
+        inc[f"sum.{metric}"] = sign * value
+        inc[f"sumsq.{metric}"] = sign * value * value
+    return inc
+
+
+def summarize(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rad i pattern_aggregates => {load, gauge, choke, distance, n, metrics:
+    {mått: {mean, std, n}}}.
+    """
+    metrics = {}
+    for metric in METRICS:
+        count = int((row.get("count") or {}).get(metric) or 0)
+        if count <= 0:
+            continue
+        mean = (row.get("sum") or {}).get(metric, 0.0) / count
+        var = max((row.get("sumsq") or {}).get(metric, 0.0) / count - mean * mean, 0.0)
+        metrics[metric] = {"mean": round(mean, 4), "std": round(math.sqrt(var), 4), "n": count}
+    return {
+        "load": row.get("load_label") or row.get("load"),
+        "gauge": row.get("gauge"),
+        "choke": row.get("choke"),
+        "distance": row.get("distance"),
+        "n": int(row.get("n") or 0),
+        "metrics": metrics,
+        "updated_at": row.get("updated_at"),
+    }
+
+
+class PatternAggregates:
+    """
+    PatternAggregates
+    -----------------
+    sync_shot()/remove_shot() anropas efter varje skrivning av ett skott.
+    Fel loggas men kastas inte vidare (raderna kan byggas om med rebuild()).
+    """
+
+    async def _collections(self):
+        db_conn = await db.get_database()
+        return db_conn["shots"], db_conn[COLLECTION]
+
+    async def _apply(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        _, agg_coll = await self._collections()
+        now = datetime.utcnow()
+        if old:
+            await agg_coll.update_one({"_id": old["key"]["_id"]}, {
+                "$inc": _inc(old.get("values") or {}, -1),
+                "$set": {"updated_at": now},
+            })
+        if new:
+            key = new["key"]
+            await agg_coll.update_one({"_id": key["_id"]}, {
+                "$inc": _inc(new["values"], 1),
+                "$set": {"updated_at": now, "load_label": key["load_label"]},
+                "$setOnInsert": {field: key[field] for field in ("load", "gauge", "choke", "distance")},
+            }, upsert=True)
+
+    async def sync_shot(self, shot_id: Any) -> None:
+        """
+        Flyttar skottets bidrag till raden som matchar dess nuvarande
+        metadata och resultat.
+        """
+        try:
+            shots_coll, _ = await self._collections()
+            shot_id = ObjectId(shot_id) if not isinstance(shot_id, ObjectId) else shot_id
+            shot = await shots_coll.find_one({"_id": shot_id}, SHOT_PROJECTION)
+            if not shot:
+                return
+            new = contribution(shot)
+            if new == shot.get("aggregate_contribution"):
+                return
+            before = await shots_coll.find_one_and_update(
+                {"_id": shot_id},
+                {"$set": {"aggregate_contribution": new}},
+                projection={"aggregate_contribution": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            if before is None:
+                return
+            await self._apply(before.get("aggregate_contribution"), new)
+        except Exception as e:
+            logger.error(f"[pattern_aggregates] Kunde ej uppdatera för {shot_id} => {e}", exc_info=True)
+
+    async def remove_shot(self, shot: Optional[Dict[str, Any]]) -> None:
+        """
+        Ett raderat skott (dokumentet som det såg ut vid raderingen).
+        """
+        if not shot or not shot.get("aggregate_contribution"):
+            return
+        try:
+            await self._apply(shot["aggregate_contribution"], None)
+        except Exception as e:
+            logger.error(f"[pattern_aggregates] Kunde ej ta bort {shot.get('_id')} => {e}", exc_info=True)
+
+    # -------------------------------------------------
+    # Frågor
+    # -------------------------------------------------
+    async def query(
+        self,
+        load: Optional[str] = None,
+        gauge: Optional[str] = None,
+        choke: Optional[str] = None,
+        distance: Optional[float] = None,
+        min_shots: int = 1
+    ) -> List[Dict[str, Any]]:
+        _, agg_coll = await self._collections()
+        query: Dict[str, Any] = {"n": {"$gte": max(int(min_shots), 1)}}
+        if load:
+            query["load"] = _normalize(load)
+        if gauge:
+            query["gauge"] = _normalize(gauge)
+        if choke:
+            query["choke"] = choke
+        if distance is not None:
+            query["distance"] = int(round(distance))
+        rows = await agg_coll.find(query).to_list(settings.PATTERN_AGGREGATES_MAX_ROWS)
+        return [summarize(row) for row in rows]
+
+    async def best_choke(
+        self,
+        load: str,
+        distance: float,
+        gauge: Optional[str] = None,
+        metric: str = "pattern_density",
+        min_shots: int = 1
+    ) -> Dict[str, Any]:
+        """
+        Chokerna för laddningen på avståndet, bäst först enligt metric
+        (riktning enligt METRICS). Rader utan choke räknas inte.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Okänt mått '{metric}', välj bland {', '.join(METRICS)}")
+        rows = [
+            row for row in await self.query(load=load, gauge=gauge, distance=distance, min_shots=min_shots)
+            if row["choke"] and metric in row["metrics"]
+        ]
+        reverse = METRICS[metric] == "max"
+        rows.sort(key=lambda row: row["metrics"][metric]["mean"], reverse=reverse)
+        return {
+            "load": load,
+            "distance": int(round(distance)),
+            "gauge": gauge,
+            "metric": metric,
+            "best": rows[0] if rows else None,
+            "ranking": rows,
+        }
+
+    # -------------------------------------------------
+    # Ombyggnad
+    # -------------------------------------------------
+    async def rebuild(self) -> Tuple[int, int]:
+        """
+        Räknar om alla rader och skottens bidrag från 'shots'.
+        Returnerar (antal skott med bidrag, antal rader).
+        """
+        shots_coll, agg_coll = await self._collections()
+        rows: Dict[str, Dict[str, Any]] = {}
+        ops: List[UpdateOne] = []
+        counted = 0
+        now = datetime.utcnow()
+
+        async for shot in shots_coll.find({}, SHOT_PROJECTION):
+            contrib = contribution(shot)
+            ops.append(UpdateOne({"_id": shot["_id"]}, {"$set": {"aggregate_contribution": contrib}}))
+            if contrib is not None:
+                counted += 1
+                key = contrib["key"]
+                row = rows.setdefault(key["_id"], {
+                    **key, "n": 0, "count": {}, "sum": {}, "sumsq": {}, "updated_at": now
+                })
+                for field, value in _inc(contrib["values"], 1).items():
+                    if field == "n":
+                        row["n"] += value
+                    else:
+                        group, metric = field.split(".", 1)
+                        row[group][metric] = row[group].get(metric, 0) + value
+            if len(ops) >= settings.BATCH_SIZE:
+                await shots_coll.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await shots_coll.bulk_write(ops, ordered=False)
+
+        await agg_coll.delete_many({})
+        if rows:
+            await agg_coll.insert_many(list(rows.values()))
+        logger.info(f"[pattern_aggregates] Ombyggt: {counted} skott, {len(rows)} rader.")
+        return counted, len(rows)
+
+
+# Singleton-instans
+pattern_aggregates = PatternAggregates()
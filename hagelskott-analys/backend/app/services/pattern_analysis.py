@@ -1,11 +1,18 @@
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 from dataclasses import dataclass
 from scipy.spatial import ConvexHull
 from sklearn.cluster import DBSCAN
 
+from app.core.config import settings
+from app.services.pattern_stats import PatternStats
+from app.services.pellet_storage import compact_results
+from app.services.preprocessing import PreprocessedFrame
+from app.services.tiling import Tile, dedupe_points, map_tiles, tile_layout
+from app.services.timing import StageTimer
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,138 @@ class Point:
     x: float
     y: float
 
+
+# Träffar: (N, 2) float32-array (x, y) eller, för äldre anropare, List[Point]
+Hits = Union[np.ndarray, List[Point]]
+
+
+def contour_features(contours: List[np.ndarray]) -> np.ndarray:
+    """
+    (N, 4) float64-tabell med area, perimeter, cx, cy för konturer från
+    cv2.findContours, beräknad för alla konturer i ett svep med NumPy.
+
+    Bitidentisk med cv2.contourArea / cv2.arcLength(closed=True) /
+    int(m10/m00), int(m01/m00) från cv2.moments för heltalskonturer:
+     - area och moment: shoelace-summor i double (heltalstermer => exakta)
+     - omkrets: segmentlängder i float32 som OpenCV, summerade i double
+       (exakt oavsett summeringsordning)
+    Konturer med m00 == 0 får cx = cy = 0.
+    """
+    if len(contours) == 0:
+        return np.empty((0, 4), dtype=np.float64)
+
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=len(contours))
+    starts = np.zeros(len(contours), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+
+    pts = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    x = pts[:, 0]
+    y = pts[:, 1]
+
+    # Föregående punkt inom samma (slutna) kontur
+    prev = np.arange(len(pts), dtype=np.intp) - 1
+    prev[starts] = starts + lengths - 1
+    xp = x[prev]
+    yp = y[prev]
+
+    cross = xp * y - x * yp
+    a00 = np.add.reduceat(cross, starts)
+    a10 = np.add.reduceat(cross * (xp + x), starts)
+    a01 = np.add.reduceat(cross * (yp + y), starts)
+
+    dx = (x - xp).astype(np.float32)
+    dy = (y - yp).astype(np.float32)
+    seg = np.sqrt(dx * dx + dy * dy).astype(np.float64)
+    perimeter = np.add.reduceat(seg, starts)
+    perimeter[lengths <= 1] = 0.0
+
+    area = np.abs(a00) * 0.5
+
+    # Som cv2.moments: tecknet följer orienteringen, m00 blir alltid >= 0
+    sign = np.where(a00 > 0, 1.0, -1.0)
+    m00 = a00 * (sign * 0.5)
+    m10 = a10 * (sign * (1.0 / 6.0))
+    m01 = a01 * (sign * (1.0 / 6.0))
+
+    cx = np.zeros_like(area)
+    cy = np.zeros_like(area)
+    nonzero = m00 != 0
+    cx[nonzero] = np.trunc(m10[nonzero] / m00[nonzero])
+    cy[nonzero] = np.trunc(m01[nonzero] / m00[nonzero])
+
+    return np.column_stack((area, perimeter, cx, cy))
+
+
+def contour_bounds(contours: List[np.ndarray]) -> np.ndarray:
+    """
+    (N, 4) int64-tabell med xmin, ymin, xmax, ymax (inklusive) per kontur.
+    """
+    if len(contours) == 0:
+        return np.empty((0, 4), dtype=np.int64)
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=len(contours))
+    starts = np.zeros(len(contours), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    pts = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    return np.column_stack((
+        np.minimum.reduceat(pts, starts, axis=0),
+        np.maximum.reduceat(pts, starts, axis=0)
+    ))
+
+
+def circle_edge_support(
+    edges: np.ndarray,
+    circles: np.ndarray,
+    gradients: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    samples: int = 180,
+    max_angle_deg: float = 25.0
+) -> np.ndarray:
+    """
+    Andel av punkterna längs varje cirkel (cx, cy, r) som ligger på en kant
+    i edges (binär kantbild, t.ex. utvidgad Canny). Med gradients = (gx, gy)
+    räknas bara kantpunkter vars gradient pekar radiellt (inom max_angle_deg),
+    som rösterna i HoughCircles => textur (gräs, text) ger lågt stöd.
+    Punkter utanför bilden räknas som saknade. Motsvarar ackumulatorvärdet
+    normerat med omkretsen => 0..1.
+    """
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+    if len(circles) == 0:
+        return np.empty(0, dtype=np.float64)
+    height, width = edges.shape[:2]
+    angles = np.linspace(0.0, 2.0 * np.pi, samples, endpoint=False)
+    cos_a, sin_a = np.cos(angles), np.sin(angles)
+    xs = np.rint(circles[:, 0:1] + circles[:, 2:3] * cos_a).astype(np.intp)
+    ys = np.rint(circles[:, 1:2] + circles[:, 2:3] * sin_a).astype(np.intp)
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    on_edge = np.zeros(xs.shape, dtype=bool)
+    on_edge[inside] = edges[ys[inside], xs[inside]] > 0
+
+    if gradients is not None:
+        gx, gy = gradients
+        hit_y, hit_x = ys[on_edge], xs[on_edge]
+        dx, dy = gx[hit_y, hit_x], gy[hit_y, hit_x]
+        # |cos| mellan gradienten och radien (mörk ring på ljus botten eller tvärtom)
+        radial = np.abs(dx * np.broadcast_to(cos_a, xs.shape)[on_edge] + dy * np.broadcast_to(sin_a, xs.shape)[on_edge])
+        magnitude = np.hypot(dx, dy)
+        on_edge[on_edge] = radial >= np.cos(np.radians(max_angle_deg)) * magnitude
+    return on_edge.sum(axis=1) / float(samples)
+
+def ring_contrast(
+    edges: np.ndarray,
+    circles: np.ndarray,
+    gradients: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    offset: float = 0.12
+) -> np.ndarray:
+    """
+    Kantstöd på cirkeln minus medelstödet på två koncentriska cirklar
+    (r * (1 +- offset)). En ritad ring ger högt stöd bara på r, textur
+    (gräs, text, hagelhål) ungefär lika högt överallt => nära 0.
+    """
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+    inner = circles * [1.0, 1.0, 1.0 - offset]
+    outer = circles * [1.0, 1.0, 1.0 + offset]
+    background = (circle_edge_support(edges, inner, gradients) + circle_edge_support(edges, outer, gradients)) / 2
+    return np.clip(circle_edge_support(edges, circles, gradients) - background, 0.0, 1.0)
+
 class PatternAnalyzer:
     """
     PatternAnalyzer
@@ -22,8 +161,16 @@ class PatternAnalyzer:
      - sensitivity (0..1)
      - pix_per_cm (kalibrering)
     Inget borttaget, alla metoder/parametrar finns kvar.
+
+    VERSION ska höjas när detekteringen ändras så att resultatet blir
+    annorlunda => cachade analyser (analysis_cache) blir automatiskt ogiltiga.
     """
 
+    VERSION = "3"
+
+    # Filtrens räckvidd utöver halva tröskelblocket: MORPH_OPEN + MORPH_CLOSE (3 x 3)
+    MORPH_REACH = 4
+
     def __init__(self):
         self.base_min_shot_area = 1.0
         self.base_max_shot_area = 2500.0
@@ -36,10 +183,42 @@ class PatternAnalyzer:
         self.hough_param1 = 100
         self.hough_param2 = 30
         self.hough_min_dist = 100
+        # Tvåstegssökning (se _detect_ring)
+        self.ring_coarse_dimension = 400        # px, grovsökningens längsta sida
+        self.ring_radius_fraction = (0.05, 0.5)  # radie: andel av kortaste resp. längsta sidan
+        self.ring_refine_window = 3             # +- px (i grovbilden) för radie/centrum i finsökningen
+        self.ring_contrast_offset = 0.12        # jämförelsecirklar r * (1 +- offset), se ring_contrast
+        self.ring_min_confidence = 0.25
+
+        # Adaptiv tröskling
+        self.adaptive_block_size = settings.ADAPTIVE_BLOCK_SIZE
+        self.adaptive_c = settings.ADAPTIVE_C
+
+        # Rutläge (se _tiled_features)
+        self.tiled = settings.ANALYSIS_TILED_MODE
+        self.tile_size = settings.ANALYSIS_TILE_SIZE
+        self.tile_overlap = settings.ANALYSIS_TILE_OVERLAP
+        self.tile_dedupe_radius = 2.0
+
+    def describe(self) -> Dict:
+        """
+        Alla parametrar som påverkar analysresultatet (t.ex. för cache-nycklar).
+        """
+        return {
+            "version": self.VERSION,
+            "shot_area": [self.base_min_shot_area, self.base_max_shot_area],
+            "min_circularity": self.base_min_circularity,
+            "ring_radius_px": [self.min_ring_radius_px, self.max_ring_radius_px],
+            "hough": [self.hough_dp, self.hough_param1, self.hough_param2, self.hough_min_dist],
+            "ring_search": [self.ring_coarse_dimension, list(self.ring_radius_fraction),
+                            self.ring_refine_window, self.ring_contrast_offset, self.ring_min_confidence],
+            "adaptive": [self.adaptive_block_size, self.adaptive_c],
+            "tiles": [self.tile_size, self.tile_overlap] if self.tiled else None,
+        }
 
     def analyze_shot_pattern(
         self,
-        image: np.ndarray,
+        image: Union[np.ndarray, PreprocessedFrame],
         sensitivity: float = 0.5,
         pix_per_cm: float = 1.0
     ) -> Dict:
@@ -47,6 +226,17 @@ class PatternAnalyzer:
         Huvudmetod:
          1) Justerar thresholds utifrån 'sensitivity'
          2) Om 'pix_per_cm' != 1 => skalar distanser => "riktigare" cm
+
+        'image' kan vara en PreprocessedFrame (från ImageProcessor.preprocess)
+        => dess detect-bild (redan brusreducerad) används direkt.
+
+        Delas upp i extract_candidates (oberoende av sensitivity/pix_per_cm)
+        och analyze_candidates (billig), så att kandidaterna kan sparas och
+        återanvändas vid reanalys.
+
+        Resultatet är i kolumnformat (schema_version 2, se pellet_storage);
+        pellet_storage.expand_results ger det äldre formatet. Ett fel ger
+        ett tomt resultat med "failed": True.
         """
 
         try:
@@ -56,165 +246,412 @@ class PatternAnalyzer:
 
             logger.info(f"[PatternAnalyzer] Start: sensitivity={sensitivity:.2f}, px/cm={pix_per_cm:.2f}")
 
-            # Justera param beroende på 'sensitivity'
-            self.min_shot_area = self.base_min_shot_area * (1.0 - 0.5 * sensitivity)
-            self.max_shot_area = self.base_max_shot_area
-            self.min_circularity = self.base_min_circularity - 0.1 * (sensitivity - 0.5)
-            if self.min_circularity < 0:
-                self.min_circularity = 0
+            candidates = self.extract_candidates(image)
+            return self.analyze_candidates(candidates, sensitivity=sensitivity, pix_per_cm=pix_per_cm)
 
-            # 1) Förbehandling
+        except Exception as e:
+            logger.error(f"analyze_shot_pattern => {e}", exc_info=True)
+            return self._create_failed_analysis()
+
+    def extract_candidates(self, image: Union[np.ndarray, PreprocessedFrame]) -> Dict:
+        """
+        Den dyra delen av analysen: ring-detektering, tröskling och konturer.
+        Resultatet beror inte på sensitivity/pix_per_cm.
+
+        En beskuren PreprocessedFrame (ROI-läge) ger koordinater och mått
+        för hela bilden, som utan beskärning.
+
+        Returns:
+            {
+              "features": ndarray (N, 4) float64 => area, perimeter, cx, cy per kontur,
+              "ring": {...} eller {},
+              "timings": {"ring_detection_ms": float, "contours_ms": float},
+              "width": int, "height": int
+            }
+        """
+        offset_x, offset_y = 0, 0
+        full_size = None
+
+        # 1) Förbehandling (hoppas över om pipelinen redan gjort den)
+        if isinstance(image, PreprocessedFrame):
+            offset_x, offset_y = image.offset
+            full_size = image.full_size
+            detect = image.detect
+            image = image.image
+            # Utan detect (t.ex. sparad artefakt) => samma brusreducering som nedan
+            denoised = detect if detect is not None else cv2.fastNlMeansDenoising(image, h=10)
+        else:
             gray = self._to_grayscale(image)
             denoised = cv2.fastNlMeansDenoising(gray, h=10)
 
-            # 2) Hitta ring (valfritt)
+        timer = StageTimer()
+
+        # 2) Hitta ring (valfritt)
+        with timer.stage("ring_detection"):
             ring_info = self._detect_ring(denoised)
 
-            # 3) Tröska + morph
-            adaptive_bin = cv2.adaptiveThreshold(
-                denoised, 255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
-                11, 2
-            )
-            kernel = np.ones((3,3), np.uint8)
-            opened = cv2.morphologyEx(adaptive_bin, cv2.MORPH_OPEN, kernel)
-            closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel)
+        # 3) Tröska + morph, 4) findContours (per ruta i rutläget)
+        with timer.stage("contours"):
+            if self.tiled and max(denoised.shape[:2]) > self.tile_size:
+                features = self._tiled_features(denoised)
+            else:
+                contours, _ = cv2.findContours(self._binarize(denoised), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                features = self._contour_features(contours)
+        if offset_x or offset_y:
+            features[:, 2] += offset_x
+            features[:, 3] += offset_y
+            if ring_info:
+                ring_info["centerX"] += offset_x
+                ring_info["centerY"] += offset_y
+
+        width, height = full_size or (image.shape[1], image.shape[0])
+        return {
+            "features": features,
+            "ring": ring_info,
+            "timings": timer.as_dict(),
+            "width": int(width),
+            "height": int(height),
+        }
+
+    def analyze_candidates(
+        self,
+        candidates: Dict,
+        sensitivity: float = 0.5,
+        pix_per_cm: float = 1.0
+    ) -> Dict:
+        """
+        Filtrerar kandidaterna från extract_candidates och bygger analysresultatet.
+        Körs på millisekunder => lämplig för parametersvep/reglage.
+        Ett fel ger ett tomt resultat med "failed": True (se _create_failed_analysis).
+        """
+        try:
+            # Justera param beroende på 'sensitivity'
+            self._apply_sensitivity(sensitivity)
 
-            # 4) findContours
-            contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            ring_info = candidates.get("ring") or {}
+            timer = StageTimer()
 
             # 5) Filtrera
-            valid_hits = self._filter_hits(contours)
-            if not valid_hits:
+            with timer.stage("filter"):
+                valid_hits = self._filter_candidates(candidates["features"])
+            if len(valid_hits) == 0:
                 empty_analysis = self._create_empty_analysis()
                 if ring_info:
                     empty_analysis["ring"] = ring_info
+                empty_analysis["timings"] = {**(candidates.get("timings") or {}), **timer.as_dict()}
                 return empty_analysis
 
-            centroid, dists = self._calculate_pattern_center(valid_hits)
-            height, width = image.shape[:2]
+            width = candidates["width"]
+            height = candidates["height"]
 
             # scale_factor => 1 / pix_per_cm
             scale_factor = 1.0 / pix_per_cm if pix_per_cm > 0 else 1.0
 
-            # Pellets
-            pellets = self._build_individual_pellets(valid_hits, centroid, width, height, scale_factor)
-
-            # pattern_radius, density
-            pattern_radius, density = self._compute_pattern_stats(valid_hits, dists, scale_factor)
-
-            # zone, distribution
-            zone_density = self._calculate_zone_density(valid_hits, centroid)
-            distribution = self._calculate_distribution(valid_hits, centroid)
-            closest_hits = self._find_closest_hits(valid_hits, centroid)
-            outer_hits = self._find_outer_hits(valid_hits, centroid)
-
-            analysis_results = {
-                "hit_count": len(valid_hits),
-                "pattern_density": round(density, 4),
-                "centroid": {
-                    "x": float(centroid[0] / width * 100),
-                    "y": float(centroid[1] / height * 100)
-                },
-                "spread": float(np.std(dists) * scale_factor),
-                "pattern_radius": float(pattern_radius),
-                "zone_analysis": zone_density,
-                "distribution": distribution,
-                "closest_hits": closest_hits,
-                "outer_hits": outer_hits,
-                "individual_pellets": pellets,
-                "image_dimensions": {"width": width, "height": height},
-                "ring": ring_info if ring_info else {},
-            }
+            # Centrum, avstånd, zoner och kvadranter räknas en gång (PatternStats)
+            with timer.stage("stats"):
+                stats = PatternStats(valid_hits, width, height, scale_factor)
+                analysis_results = stats.to_compact()
+            analysis_results["image_dimensions"] = {"width": width, "height": height}
+            analysis_results["ring"] = ring_info if ring_info else {}
+            analysis_results["timings"] = {**(candidates.get("timings") or {}), **timer.as_dict()}
             return analysis_results
 
         except Exception as e:
-            logger.error(f"analyze_shot_pattern => {e}", exc_info=True)
-            return self._create_empty_analysis()
+            logger.error(f"analyze_candidates => {e}", exc_info=True)
+            return self._create_failed_analysis()
+
+    def _apply_sensitivity(self, sensitivity: float) -> None:
+        self.min_shot_area = self.base_min_shot_area * (1.0 - 0.5 * sensitivity)
+        self.max_shot_area = self.base_max_shot_area
+        self.min_circularity = self.base_min_circularity - 0.1 * (sensitivity - 0.5)
+        if self.min_circularity < 0:
+            self.min_circularity = 0
 
     def _to_grayscale(self, image: np.ndarray) -> np.ndarray:
         if len(image.shape) == 3:
             return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         return image
 
+    def _ring_radius_range(self, width: int, height: int) -> Tuple[int, int]:
+        """
+        Radieintervall för ringen utifrån bildens mått, inom min/max_ring_radius_px.
+        """
+        min_fraction, max_fraction = self.ring_radius_fraction
+        min_r = max(self.min_ring_radius_px, int(min(width, height) * min_fraction))
+        max_r = min(self.max_ring_radius_px, int(np.ceil(max(width, height) * max_fraction)))
+        return min_r, max_r
+
+    def _ring_edges(self, gray_image: np.ndarray, blur: Tuple[Tuple[int, int], float]):
+        """
+        (suddad bild, kantbild, (gx, gy)) med samma Canny-trösklar och
+        Sobel-gradienter som HoughCircles. Kanterna utvidgas en pixel
+        (ringens linje hamnar sällan exakt på r).
+        """
+        blurred = cv2.GaussianBlur(gray_image, blur[0], blur[1])
+        gx = cv2.Sobel(blurred, cv2.CV_16S, 1, 0)
+        gy = cv2.Sobel(blurred, cv2.CV_16S, 0, 1)
+        edges = cv2.Canny(gx, gy, self.hough_param1 / 2, self.hough_param1)
+        gradients = (gx.astype(np.float32), gy.astype(np.float32))
+        return blurred, cv2.dilate(edges, np.ones((3, 3), np.uint8)), gradients
+
     def _detect_ring(self, gray_image: np.ndarray) -> Dict[str, float]:
-        blurred = cv2.GaussianBlur(gray_image, (9, 9), 2)
+        """
+        Tvåstegssökning efter målets ring:
+         1) HoughCircles på en nedskalad bild (ring_coarse_dimension) med
+            radieintervall från bildens mått. Bästa kandidat = högst
+            ring_contrast (kantpixlar med radiell gradient på cirkeln jämfört
+            med strax innanför/utanför), inte största radien som tidigare.
+         2) Förfining i full upplösning i ett fönster runt kandidaten med
+            radie +- ring_refine_window grova pixlar.
+        confidence = ring_contrast för den slutliga cirkeln (0..1, normerat
+        ackumulatorvärde); under ring_min_confidence => ingen ring.
+        """
+        height, width = gray_image.shape[:2]
+        min_r, max_r = self._ring_radius_range(width, height)
+        if max_r <= min_r:
+            return {}
+
+        # 1) Grovsökning
+        scale = min(1.0, self.ring_coarse_dimension / max(height, width))
+        coarse = gray_image
+        if scale < 1.0:
+            coarse = cv2.resize(
+                gray_image, (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                interpolation=cv2.INTER_AREA
+            )
+        blurred, edges, gradients = self._ring_edges(coarse, ((5, 5), 1) if scale < 1.0 else ((9, 9), 2))
         circles = cv2.HoughCircles(
             blurred,
             cv2.HOUGH_GRADIENT,
             dp=self.hough_dp,
-            minDist=self.hough_min_dist,
+            minDist=max(1.0, self.hough_min_dist * scale),
             param1=self.hough_param1,
             param2=self.hough_param2,
-            minRadius=self.min_ring_radius_px,
-            maxRadius=self.max_ring_radius_px
+            minRadius=max(1, int(min_r * scale)),
+            maxRadius=max(2, int(np.ceil(max_r * scale)))
         )
-        if circles is not None and len(circles) > 0:
-            circles = np.round(circles[0, :]).astype(int)
-            best_circle = sorted(circles, key=lambda c: c[2], reverse=True)[0]
-            cx, cy, r = best_circle
-            return {
-                "centerX": float(cx),
-                "centerY": float(cy),
-                "radius_px": float(r),
-                "confidence": 0.9
-            }
-        return {}
-
-    def _filter_hits(self, contours: List[np.ndarray]) -> List[Point]:
-        valid = []
-        for cnt in contours:
-            area = float(cv2.contourArea(cnt))
-            if self.min_shot_area <= area <= self.max_shot_area:
-                perimeter = float(cv2.arcLength(cnt, True))
-                circ = 0.0
-                if perimeter > 0:
-                    circ = float((4.0 * np.pi * area) / (perimeter ** 2))
-                if circ > self.min_circularity:
-                    M = cv2.moments(cnt)
-                    if M["m00"] != 0:
-                        cx = int(M["m10"] / M["m00"])
-                        cy = int(M["m01"] / M["m00"])
-                        valid.append(Point(cx, cy))
-        return valid
+        if circles is None or len(circles) == 0:
+            return {}
+        circles = circles[0]
+        support = ring_contrast(edges, circles, gradients, self.ring_contrast_offset)
+        # Högst kontrast, vid lika störst radie
+        best = np.lexsort((circles[:, 2], support))[-1]
+        cx, cy, r = (float(v) / scale for v in circles[best])
+        confidence = float(support[best])
+
+        # 2) Förfining i full upplösning
+        if scale < 1.0:
+            refined = self._refine_ring(gray_image, cx, cy, r, self.ring_refine_window / scale)
+            if refined is not None:
+                cx, cy, r, confidence = refined
+
+        if confidence < self.ring_min_confidence:
+            return {}
+        return {
+            "centerX": float(round(cx)),
+            "centerY": float(round(cy)),
+            "radius_px": float(round(r)),
+            "confidence": round(confidence, 3)
+        }
+
+    def _refine_ring(
+        self,
+        gray_image: np.ndarray,
+        cx: float,
+        cy: float,
+        r: float,
+        window: float
+    ) -> Optional[Tuple[float, float, float, float]]:
+        """
+        HoughCircles i full upplösning, begränsat till ringens omgivning och
+        r +- window. (cx, cy, r, ring_contrast) för cirkeln med högst kontrast
+        vars centrum ligger inom window från grovsökningens, annars None.
+        """
+        height, width = gray_image.shape[:2]
+        # Fönstret rymmer även ring_contrasts yttre jämförelsecirkel
+        reach = (r + window) * (1.0 + self.ring_contrast_offset) + 2
+        x0, y0 = max(0, int(cx - reach)), max(0, int(cy - reach))
+        x1, y1 = min(width, int(np.ceil(cx + reach)) + 1), min(height, int(np.ceil(cy + reach)) + 1)
+        if x1 - x0 < 3 or y1 - y0 < 3:
+            return None
+
+        blurred, edges, gradients = self._ring_edges(gray_image[y0:y1, x0:x1], ((9, 9), 2))
+        circles = cv2.HoughCircles(
+            blurred,
+            cv2.HOUGH_GRADIENT,
+            dp=1,
+            minDist=max(1.0, window),
+            param1=self.hough_param1,
+            param2=self.hough_param2,
+            minRadius=max(1, int(r - window)),
+            maxRadius=int(np.ceil(r + window))
+        )
+        if circles is None or len(circles) == 0:
+            return None
+        circles = circles[0]
+        near = np.hypot(circles[:, 0] + x0 - cx, circles[:, 1] + y0 - cy) <= window
+        if not near.any():
+            return None
+        circles = circles[near]
+        support = ring_contrast(edges, circles, gradients, self.ring_contrast_offset)
+        best = int(np.argmax(support))
+        rx, ry, rr = (float(v) for v in circles[best])
+        return rx + x0, ry + y0, rr, float(support[best])
+
+    def _binarize(self, gray: np.ndarray) -> np.ndarray:
+        adaptive_bin = cv2.adaptiveThreshold(
+            gray, 255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+            self.adaptive_block_size, self.adaptive_c
+        )
+        kernel = np.ones((3,3), np.uint8)
+        opened = cv2.morphologyEx(adaptive_bin, cv2.MORPH_OPEN, kernel)
+        return cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel)
+
+    def _tiled_features(self, gray: np.ndarray) -> np.ndarray:
+        """
+        Som tröskling + findContours + _contour_features på hela bilden, men
+        per ruta (tile_size + tile_overlap) i trådpoolen.
+
+        En ruta behåller bara konturer som ligger helt innanför området där
+        trösklingen är exakt (snittkanten minus filtrens räckvidd) => inga
+        avklippta halvor. En pellet som korsar en rutgräns hittas därmed hel
+        av minst en ruta så länge den är mindre än överlappet minus räckvidden.
+        Dubbletter i överlappsbanden tas bort med dedupe_points.
+
+        RETR_EXTERNAL döljer konturer inuti en större sluten kontur, även när
+        den större konturen går utanför rutan. Rutornas kärnor sätts därför
+        ihop till hela binärbilden, och bakgrunden som når bildkanten
+        (4-grannskap, som findContours) fylls en gång för hela bilden. En
+        kontur behålls bara om pixeln till vänster om dess startpunkt hör
+        till den bakgrunden => samma kandidater som i ett svep.
+        """
+        height, width = gray.shape[:2]
+        reach = self.adaptive_block_size // 2 + self.MORPH_REACH
+        tiles = tile_layout(width, height, self.tile_size, max(self.tile_overlap, reach + 1))
+
+        # Hela binärbilden med en pixels bakgrundsram (kärnorna överlappar inte => trådsäkert)
+        stitched = np.zeros((height + 2, width + 2), dtype=np.uint8)
+
+        def detect(tile: Tile) -> Tuple[np.ndarray, np.ndarray]:
+            binary = self._binarize(gray[tile.region])
+            stitched[tile.y0 + 1:tile.y1 + 1, tile.x0 + 1:tile.x1 + 1] = binary[tile.core]
+            contours, _ = cv2.findContours(
+                binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(tile.rx0, tile.ry0)
+            )
+            features = contour_features(contours)
+            if len(features) == 0:
+                return features, np.empty((0, 2), dtype=np.int64)
+            # Pixeln utanför konturen måste också vara exakt (annars kan blobben fortsätta där)
+            ix0, iy0, ix1, iy1 = tile.inner(width, height, reach)
+            bounds = contour_bounds(contours)
+            area = features[:, 0]
+            keep = (area <= self.base_max_shot_area) & (area != 0)
+            if ix0 > 0:
+                keep &= bounds[:, 0] > ix0
+            if iy0 > 0:
+                keep &= bounds[:, 1] > iy0
+            if ix1 < width:
+                keep &= bounds[:, 2] < ix1 - 1
+            if iy1 < height:
+                keep &= bounds[:, 3] < iy1 - 1
+            # Startpunkten (översta vänstra pixeln) har bakgrund till vänster
+            start_points = np.array([c[0, 0] for c, k in zip(contours, keep) if k], dtype=np.int64)
+            return features[keep], start_points.reshape(-1, 2)
+
+        per_tile = map_tiles(detect, tiles)
+
+        cv2.floodFill(stitched, None, (0, 0), 128, flags=4)
+        features = np.concatenate([f for f, _ in per_tile])
+        start_points = np.concatenate([p for _, p in per_tile])
+        outside = stitched[start_points[:, 1] + 1, start_points[:, 0]] == 128
+        tile_ids = np.repeat(np.arange(len(per_tile)), [len(f) for f, _ in per_tile])
+        features, tile_ids = features[outside], tile_ids[outside]
+        if len(per_tile) == 1:
+            return features
+
+        # Bara punkter i överlappsbanden (inom tile_overlap från en inre rutgräns) kan vara dubbletter
+        in_band = np.zeros(len(features), dtype=bool)
+        for axis, size in ((2, width), (3, height)):
+            coord = features[:, axis]
+            pos = np.mod(coord, self.tile_size)
+            lower = (pos < self.tile_overlap) & (coord >= self.tile_size)
+            upper = (self.tile_size - pos <= self.tile_overlap) & (coord - pos + self.tile_size < size)
+            in_band |= lower | upper
+
+        band_idx = np.flatnonzero(in_band)
+        keep = np.ones(len(features), dtype=bool)
+        keep[band_idx] = dedupe_points(features[band_idx, 2:4], tile_ids[band_idx], self.tile_dedupe_radius)
+        return features[keep]
+
+    def _contour_features(self, contours: List[np.ndarray]) -> np.ndarray:
+        """
+        Area, omkrets och tyngdpunkt per kontur som en (N, 4)-tabell.
+        Bara konturer som kan bli träffar för någon sensitivity tas med
+        (area <= max, m00 != 0); ordningen från findContours behålls.
 
+        Vektoriserat över alla konturer på en gång (contour_features) i
+        stället för contourArea/arcLength/moments per kontur.
+        """
+        features = contour_features(contours)
+        area = features[:, 0]
+        keep = (area <= self.base_max_shot_area) & (area != 0)
+        return features[keep]
+
+    def _filter_candidates(self, features: np.ndarray) -> np.ndarray:
+        """
+        Samma villkor som _filter_hits, men på kandidattabellen från
+        _contour_features (area, perimeter, cx, cy).
+        Returnerar träffarna som en sammanhängande (N, 2) float32-array (x, y).
+        """
+        if len(features) == 0:
+            return np.empty((0, 2), dtype=np.float32)
+        area = features[:, 0]
+        perimeter = features[:, 1]
+        circ = np.zeros_like(area)
+        np.divide(4.0 * np.pi * area, perimeter ** 2, out=circ, where=perimeter > 0)
+        mask = (area >= self.min_shot_area) & (area <= self.max_shot_area) & (circ > self.min_circularity)
+        return np.ascontiguousarray(features[mask, 2:4], dtype=np.float32)
+
+    def _filter_hits(self, contours: List[np.ndarray]) -> np.ndarray:
+        return self._filter_candidates(self._contour_features(contours))
+
+    @staticmethod
+    def _as_array(hits: Hits) -> np.ndarray:
+        """
+        (N, 2) float32 från antingen en array eller en lista av Point
+        (äldre anropare).
+        """
+        if isinstance(hits, np.ndarray):
+            return hits.reshape(-1, 2).astype(np.float32, copy=False)
+        return np.array([[p.x, p.y] for p in hits], dtype=np.float32).reshape(-1, 2)
+
+    # Äldre hjälpmetoder, finns kvar för anropare utanför analyze_candidates.
+    # Alla går via PatternStats.
     def _calculate_pattern_center(
         self,
-        hits: List[Point]
+        hits: Hits
     ) -> Tuple[np.ndarray, np.ndarray]:
-        arr = np.array([[p.x, p.y] for p in hits], dtype=np.float32)
-        centroid = np.mean(arr, axis=0)
-        distances = np.linalg.norm(arr - centroid, axis=1)
-        return centroid, distances
+        stats = PatternStats(self._as_array(hits), 1, 1)
+        return stats.centroid, stats.distances
 
     def _build_individual_pellets(
         self,
-        hits: List[Point],
+        hits: Hits,
         centroid: np.ndarray,
         width: int,
         height: int,
         scale_factor: float
     ) -> List[Dict[str, float]]:
-        pellets = []
-        cx, cy = centroid
-        for h in hits:
-            dx = (h.x - cx) * scale_factor
-            dy = (h.y - cy) * scale_factor
-            dist = float(np.sqrt(dx**2 + dy**2))
-            pellets.append({
-                "x": round((h.x / width) * 100, 2),
-                "y": round((h.y / height) * 100, 2),
-                "distance_from_center": round(dist, 2)
-            })
-        return pellets
+        return PatternStats(self._as_array(hits), width, height, scale_factor, centroid).individual_pellets()
 
     def _compute_pattern_stats(
         self,
-        hits: List[Point],
+        hits: Hits,
         distances: np.ndarray,
         scale_factor: float
     ) -> Tuple[float, float]:
-        if not hits:
+        if len(hits) == 0:
             return (0.0, 0.0)
         max_dist = float(np.max(distances)) * scale_factor
         area = np.pi * (max_dist ** 2)
@@ -226,127 +663,48 @@ class PatternAnalyzer:
 
     def _calculate_zone_density(
         self,
-        hits: List[Point],
+        hits: Hits,
         center: np.ndarray
     ) -> Dict[str, Dict]:
-        if not hits:
-            return {
-                "inner": {"radius": 100, "hits": 0, "pellets": [], "percentage": 0},
-                "middle": {"radius": 200, "hits": 0, "pellets": [], "percentage": 0},
-                "outer": {"radius": 300, "hits": 0, "pellets": [], "percentage": 0},
-                "extreme": {"radius": 9999, "hits": 0, "pellets": [], "percentage": 0}
-            }
-
-        zones = {
-            "inner":   {"radius": 100,  "hits": 0, "pellets": []},
-            "middle":  {"radius": 200,  "hits": 0, "pellets": []},
-            "outer":   {"radius": 300,  "hits": 0, "pellets": []},
-            "extreme": {"radius": 9999, "hits": 0, "pellets": []}
-        }
-        arr = np.array([[p.x, p.y] for p in hits], dtype=np.float32)
-        dists = np.linalg.norm(arr - center, axis=1)
-        total = len(hits)
-
-        for i, d in enumerate(dists):
-            px = float(arr[i][0])
-            py = float(arr[i][1])
-            if d <= zones["inner"]["radius"]:
-                zones["inner"]["hits"] += 1
-                zones["inner"]["pellets"].append({"x": px, "y": py})
-            elif d <= zones["middle"]["radius"]:
-                zones["middle"]["hits"] += 1
-                zones["middle"]["pellets"].append({"x": px, "y": py})
-            elif d <= zones["outer"]["radius"]:
-                zones["outer"]["hits"] += 1
-                zones["outer"]["pellets"].append({"x": px, "y": py})
-            else:
-                zones["extreme"]["hits"] += 1
-                zones["extreme"]["pellets"].append({"x": px, "y": py})
-
-        for k in zones:
-            z = zones[k]
-            if total > 0:
-                z["percentage"] = round(z["hits"] / total * 100, 2)
-            else:
-                z["percentage"] = 0
-        return zones
+        return PatternStats(self._as_array(hits), 1, 1, centroid=center).zone_analysis()
 
     def _calculate_distribution(
         self,
-        hits: List[Point],
+        hits: Hits,
         center: np.ndarray
     ) -> Dict[str, Dict]:
-        distros = {
-            "top_left": {"count": 0, "pellets": []},
-            "top_right": {"count": 0, "pellets": []},
-            "bottom_left": {"count": 0, "pellets": []},
-            "bottom_right": {"count": 0, "pellets": []}
-        }
-        cx, cy = center
-        for p in hits:
-            dx = p.x - cx
-            dy = p.y - cy
-            px = float(p.x)
-            py = float(p.y)
-
-            if dy < 0:  # top
-                if dx < 0:
-                    distros["top_left"]["count"] += 1
-                    distros["top_left"]["pellets"].append({"x": px, "y": py})
-                else:
-                    distros["top_right"]["count"] += 1
-                    distros["top_right"]["pellets"].append({"x": px, "y": py})
-            else:
-                if dx < 0:
-                    distros["bottom_left"]["count"] += 1
-                    distros["bottom_left"]["pellets"].append({"x": px, "y": py})
-                else:
-                    distros["bottom_right"]["count"] += 1
-                    distros["bottom_right"]["pellets"].append({"x": px, "y": py})
-        return distros
+        return PatternStats(self._as_array(hits), 1, 1, centroid=center).distribution()
 
     def _find_closest_hits(
         self,
-        hits: List[Point],
+        hits: Hits,
         center: np.ndarray,
         n: int = 5
     ) -> List[Dict[str, float]]:
-        if not hits:
-            return []
-        arr = np.array([[p.x, p.y] for p in hits], dtype=np.float32)
-        dists = np.linalg.norm(arr - center, axis=1)
-        idx_sorted = np.argsort(dists)[:n]
-        ret = []
-        for i in idx_sorted:
-            ret.append({
-                "x": float(arr[i][0]),
-                "y": float(arr[i][1]),
-                "distance": float(dists[i])
-            })
-        return ret
+        return PatternStats(self._as_array(hits), 1, 1, centroid=center).closest_hits(n)
 
     def _find_outer_hits(
         self,
-        hits: List[Point],
+        hits: Hits,
         center: np.ndarray,
         n: int = 5
     ) -> List[Dict[str, float]]:
-        if not hits:
-            return []
-        arr = np.array([[p.x, p.y] for p in hits], dtype=np.float32)
-        dists = np.linalg.norm(arr - center, axis=1)
-        idx_sorted = np.argsort(dists)[-n:]
-        ret = []
-        for i in idx_sorted:
-            ret.append({
-                "x": float(arr[i][0]),
-                "y": float(arr[i][1]),
-                "distance": float(dists[i])
-            })
-        return ret
+        return PatternStats(self._as_array(hits), 1, 1, centroid=center).outer_hits(n)
+
+    def _create_failed_analysis(self) -> Dict:
+        """
+        Tomt resultat efter ett fel. "failed" skiljer det från en bild utan
+        träffar => AnalysisExecutor cachar det inte (och tar bort flaggan).
+        """
+        failed = self._create_empty_analysis()
+        failed["failed"] = True
+        return failed
 
     def _create_empty_analysis(self) -> Dict:
-        return {
+        """
+        Tomt resultat, i samma lagringsformat (schema 2) som analyze_candidates.
+        """
+        return compact_results({
             "hit_count": 0,
             "pattern_density": 0.0,
             "centroid": {"x": 0.0, "y": 0.0},
@@ -369,7 +727,7 @@ class PatternAnalyzer:
             "individual_pellets": [],
             "image_dimensions": {"width": 0, "height": 0},
             "ring": {}
-        }
+        })
 
     @staticmethod
     def calculate_pattern_similarity(patterns: List[Dict]) -> float:
@@ -0,0 +1,231 @@
+"""
+Mönsterstatistik för detekterade träffar.
+
+PatternAnalyzer byggde tidigare om samma koordinat-array ur List[Point] och
+räknade om avstånden till centrum i varje hjälpmetod (centrum, zoner,
+fördelning, närmaste/yttersta träffar). PatternStats räknar centrum,
+avstånd, zon- och kvadrantindex en gång och härleder alla fält ur dem.
+
+Fälten och deras format är desamma som tidigare i analysresultatet.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Zoner (radie i pixlar från mönstrets centrum), sista zonen tar resten
+ZONE_NAMES = ("inner", "middle", "outer", "extreme")
+ZONE_RADII = (100, 200, 300, 9999)
+
+# Kvadrantindex = 2 * (dy >= 0) + (dx >= 0)
+QUADRANT_NAMES = ("top_left", "top_right", "bottom_left", "bottom_right")
+
+
+def _round2(values: np.ndarray) -> List[float]:
+    """
+    Samma resultat som [round(v, 2) for v in values], men vektoriserat.
+    np.round kan avvika från Pythons round när v * 100 hamnar nära .5;
+    de (få) värdena avrundas med round() i stället.
+    """
+    scaled = values * 100
+    rounded = (np.rint(scaled) / 100).tolist()
+    frac = scaled - np.floor(scaled)
+    for i in np.flatnonzero(np.abs(frac - 0.5) < 1e-6).tolist():
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+class PatternStats:
+    """
+    PatternStats
+    ------------
+    hits:         (N, 2) float32-array (x, y) i pixlar
+    width/height: bildens mått (för procentkoordinater)
+    scale_factor: 1 / pix_per_cm (för cm-avstånd)
+    centroid:     valfritt fast centrum (annars medelvärdet av träffarna)
+    """
+
+    def __init__(
+        self,
+        hits: np.ndarray,
+        width: int,
+        height: int,
+        scale_factor: float = 1.0,
+        centroid: Optional[np.ndarray] = None
+    ):
+        self.points = np.asarray(hits, dtype=np.float32).reshape(-1, 2)
+        self.width = width
+        self.height = height
+        self.scale_factor = scale_factor
+        self.count = len(self.points)
+
+        if centroid is None:
+            centroid = self.points.mean(axis=0) if self.count else np.zeros(2, dtype=np.float32)
+        self.centroid = np.asarray(centroid, dtype=np.float32)
+
+        self.offsets = self.points - self.centroid
+        self.distances = np.linalg.norm(self.offsets, axis=1)
+
+        # Zon: d <= 100 => 0, <= 200 => 1, <= 300 => 2, annars 3
+        self.zone_index = np.digitize(self.distances, ZONE_RADII[:-1], right=True)
+        self.zone_counts = np.bincount(self.zone_index, minlength=len(ZONE_NAMES))
+
+        self.quadrant_index = 2 * (self.offsets[:, 1] >= 0) + (self.offsets[:, 0] >= 0)
+        self.quadrant_counts = np.bincount(self.quadrant_index, minlength=len(QUADRANT_NAMES))
+
+    # -------------------------------------------------
+    # Index
+    # -------------------------------------------------
+    def closest_indices(self, n: int = 5) -> np.ndarray:
+        """
+        Index för de n träffar som ligger närmast centrum, stigande avstånd.
+        """
+        return self._smallest(self.distances, n)
+
+    def outer_indices(self, n: int = 5) -> np.ndarray:
+        """
+        Index för de n träffar som ligger längst ut, stigande avstånd
+        (den yttersta sist, som tidigare argsort()[-n:]).
+        """
+        return self._smallest(-self.distances, n)[::-1]
+
+    @staticmethod
+    def _smallest(values: np.ndarray, n: int) -> np.ndarray:
+        n = min(n, len(values))
+        if n <= 0:
+            return np.empty(0, dtype=np.intp)
+        if n < len(values):
+            candidates = np.argpartition(values, n - 1)[:n]
+        else:
+            candidates = np.arange(len(values))
+        # Sortera bara de n utvalda (lika avstånd => lägst index först)
+        return candidates[np.lexsort((candidates, values[candidates]))]
+
+    # -------------------------------------------------
+    # Härledda fält
+    # -------------------------------------------------
+    def pattern_radius(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return float(np.max(self.distances)) * self.scale_factor
+
+    def pattern_density(self) -> float:
+        area = np.pi * (self.pattern_radius() ** 2)
+        return self.count / area if area > 0 else 0.0
+
+    def spread(self) -> float:
+        return float(np.std(self.distances) * self.scale_factor)
+
+    def individual_pellets(self) -> List[Dict[str, float]]:
+        scaled = self.offsets * self.scale_factor
+        dists = np.sqrt(scaled[:, 0] ** 2 + scaled[:, 1] ** 2)
+        points = self.points.astype(np.float64)
+        xs = _round2((points[:, 0] / self.width) * 100)
+        ys = _round2((points[:, 1] / self.height) * 100)
+        return [
+            {"x": x, "y": y, "distance_from_center": d}
+            for x, y, d in zip(xs, ys, _round2(dists.astype(np.float64)))
+        ]
+
+    def zone_analysis(self) -> Dict[str, Dict[str, Any]]:
+        zones = {}
+        for i, name in enumerate(ZONE_NAMES):
+            hits = int(self.zone_counts[i])
+            zones[name] = {
+                "radius": ZONE_RADII[i],
+                "hits": hits,
+                "pellets": self._xy_dicts(self.zone_index == i),
+                "percentage": round(hits / self.count * 100, 2) if self.count else 0
+            }
+        return zones
+
+    def distribution(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "count": int(self.quadrant_counts[i]),
+                "pellets": self._xy_dicts(self.quadrant_index == i)
+            }
+            for i, name in enumerate(QUADRANT_NAMES)
+        }
+
+    def closest_hits(self, n: int = 5) -> List[Dict[str, float]]:
+        return self._hit_dicts(self.closest_indices(n))
+
+    def outer_hits(self, n: int = 5) -> List[Dict[str, float]]:
+        return self._hit_dicts(self.outer_indices(n))
+
+    def to_analysis(self) -> Dict[str, Any]:
+        """
+        Alla statistikfält i analysresultatet (utan ring/image_dimensions).
+        """
+        return {
+            "hit_count": self.count,
+            "pattern_density": round(self.pattern_density(), 4),
+            "centroid": {
+                "x": float(self.centroid[0] / self.width * 100),
+                "y": float(self.centroid[1] / self.height * 100)
+            },
+            "spread": self.spread(),
+            "pattern_radius": float(self.pattern_radius()),
+            "zone_analysis": self.zone_analysis(),
+            "distribution": self.distribution(),
+            "closest_hits": self.closest_hits(),
+            "outer_hits": self.outer_hits(),
+            "individual_pellets": self.individual_pellets(),
+        }
+
+    def to_compact(self) -> Dict[str, Any]:
+        """
+        Samma statistik i kolumnformat (schema_version 2, se pellet_storage):
+        en kolumn per pelletfält, zon/kvadrant som index per pellet och
+        närmaste/yttersta träffar som index i stället för kopior.
+        """
+        # pellet_storage importerar den här modulen => importeras här
+        from app.services.pellet_storage import SCHEMA_VERSION
+
+        scaled = self.offsets * self.scale_factor
+        dists = np.sqrt(scaled[:, 0] ** 2 + scaled[:, 1] ** 2).astype(np.float64)
+        points = self.points.astype(np.float64)
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "hit_count": self.count,
+            "pattern_density": round(self.pattern_density(), 4),
+            "centroid": {
+                "x": float(self.centroid[0] / self.width * 100) if self.width else 0.0,
+                "y": float(self.centroid[1] / self.height * 100) if self.height else 0.0
+            },
+            "centroid_px": [float(self.centroid[0]), float(self.centroid[1])],
+            "spread": self.spread() if self.count else 0.0,
+            "pattern_radius": float(self.pattern_radius()),
+            "zone_analysis": {
+                name: {
+                    "radius": ZONE_RADII[i],
+                    "hits": int(self.zone_counts[i]),
+                    "percentage": round(int(self.zone_counts[i]) / self.count * 100, 2) if self.count else 0
+                }
+                for i, name in enumerate(ZONE_NAMES)
+            },
+            "distribution": {
+                name: {"count": int(self.quadrant_counts[i])}
+                for i, name in enumerate(QUADRANT_NAMES)
+            },
+            "pellets": {
+                "x": _round2((points[:, 0] / max(self.width, 1)) * 100),
+                "y": _round2((points[:, 1] / max(self.height, 1)) * 100),
+                "distance": _round2(dists),
+                "zone": self.zone_index.tolist(),
+                "quadrant": self.quadrant_index.tolist(),
+            },
+            "closest_idx": self.closest_indices().tolist(),
+            "outer_idx": self.outer_indices().tolist(),
+        }
+
+    # -------------------------------------------------
+    # Hjälp
+    # -------------------------------------------------
+    def _xy_dicts(self, mask: np.ndarray) -> List[Dict[str, float]]:
+        return [{"x": x, "y": y} for x, y in self.points[mask].tolist()]
+
+    def _hit_dicts(self, indices: np.ndarray) -> List[Dict[str, float]]:
+        points = self.points[indices].tolist()
+        dists = self.distances[indices].tolist()
+        return [{"x": x, "y": y, "distance": d} for (x, y), d in zip(points, dists)]
@@ -0,0 +1,260 @@
+"""
+Rumsligt index över ett skotts pellets (för redigering av träffar).
+
+Att ta bort en träff betydde tidigare att jämföra (x, y) exakt mot alla
+pellets. PelletIndex är en rutnätshash i pixlar: pellets sorteras efter
+ruta (HIT_INDEX_CELL_PX) och en fråga slår upp de rutor den täcker med
+binärsökning, dvs. ungefär O(log n + träffar i rutorna) per fråga i stället
+för O(n). Stöds:
+
+    nearest(points, radius)   närmaste aktiva pellet inom radius per punkt
+    in_box(x0, y0, x1, y1)    alla aktiva pellets i rektangeln
+    in_polygon(polygon)       alla aktiva pellets i polygonen (lasso)
+
+Indexen är radindex i pellet-kolumnerna (schema 2). Eftersom kolumnerna
+bara växer ($push) och borttagna markeras i removed_idx förskjuts de aldrig,
+så indexet kan följa med en redigeringssession: advance() markerar borttagna
+och lägger nya pellets i en liten buffert som söks linjärt tills den byggs
+in vid nästa ombyggnad.
+
+pellet_index_cache håller index per skott (LRU + tid sedan senaste
+användning) och nyckeln är (accumulators.epoch, accumulators.version), så
+en redigering i en annan process eller en reanalys ger aldrig ett inaktuellt
+index, bara en ombyggnad.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.pellet_storage import active_mask, pellet_pixels, percent_to_pixels
+
+logger = logging.getLogger(__name__)
+
+# Nycklar i pellet_index_cache: (epoch, version) ur analysis_results.accumulators
+IndexKey = Tuple[str, int]
+
+
+def index_key(results: Dict[str, Any]) -> Optional[IndexKey]:
+    stored = results.get("accumulators")
+    if not stored or not stored.get("epoch"):
+        return None
+    return str(stored["epoch"]), int(stored.get("version", 0))
+
+
+class PelletIndex:
+    """
+    PelletIndex
+    -----------
+    Rutnätshash över pellets (N, 2) i pixlar. active följer removed_idx;
+    inaktiva pellets ligger kvar i indexet men returneras aldrig.
+    """
+
+    def __init__(self, points: np.ndarray, active: np.ndarray, width: int, height: int,
+                 key: Optional[IndexKey] = None, cell_size: Optional[float] = None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.active = np.asarray(active, dtype=bool).copy()
+        self.width = max(int(width), 1)
+        self.height = max(int(height), 1)
+        self.key = key
+        self.cell_size = float(cell_size or settings.HIT_INDEX_CELL_PX)
+        self._columns = int(np.ceil(self.width / self.cell_size)) + 1
+        self._rows = int(np.ceil(self.height / self.cell_size)) + 1
+        self._build()
+
+    @classmethod
+    def from_results(cls, results: Dict[str, Any]) -> "PelletIndex":
+        dims = results.get("image_dimensions") or {}
+        return cls(
+            pellet_pixels(results), active_mask(results),
+            int(dims.get("width") or 0), int(dims.get("height") or 0),
+            key=index_key(results)
+        )
+
+    def __len__(self) -> int:
+        return int(self.active.sum())
+
+    # -------------------------------------------------
+    # Rutnät
+    # -------------------------------------------------
+    def _cells(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cx = np.clip(np.floor(points[:, 0] / self.cell_size), 0, self._columns - 1).astype(np.int64)
+        cy = np.clip(np.floor(points[:, 1] / self.cell_size), 0, self._rows - 1).astype(np.int64)
+        return cx, cy
+
+    def _build(self) -> None:
+        cx, cy = self._cells(self.points)
+        keys = cy * self._columns + cx
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        # Pellets efter ombyggnaden (advance) söks linjärt tills nästa _build
+        self._indexed = len(self.points)
+
+    def _candidates(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        Aktiva pellets i rutorna som täcker rektangeln (kan innehålla
+        pellets strax utanför => filtreras av anroparen).
+        """
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([[x0, y0], [x1, y1]], dtype=np.float64))
+        # En rad rutor i taget: rutorna cx0..cx1 ligger i följd bland nycklarna
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) * self._columns
+        starts = np.searchsorted(self._keys, rows + cx0, side="left")
+        ends = np.searchsorted(self._keys, rows + cx1, side="right")
+        parts = [self._order[lo:hi] for lo, hi in zip(starts, ends) if hi > lo]
+        if self._indexed < len(self.points):
+            parts.append(np.arange(self._indexed, len(self.points)))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.concatenate(parts)
+        return candidates[self.active[candidates]]
+
+    # -------------------------------------------------
+    # Frågor
+    # -------------------------------------------------
+    def nearest(self, points: np.ndarray, radius: float) -> List[int]:
+        """
+        Närmaste aktiva pellet inom radius (px) för varje punkt, i punkternas
+        ordning. En pellet väljs högst en gång; punkter utan träff hoppas över.
+        """
+        taken = set()
+        found = []
+        for x, y in np.asarray(points, dtype=np.float64).reshape(-1, 2):
+            candidates = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            if len(candidates) == 0:
+                continue
+            d2 = ((self.points[candidates] - (x, y)) ** 2).sum(axis=1)
+            for i in np.argsort(d2, kind="stable"):
+                if d2[i] > radius * radius:
+                    break
+                if int(candidates[i]) not in taken:
+                    taken.add(int(candidates[i]))
+                    found.append(int(candidates[i]))
+                    break
+        return found
+
+    def in_box(self, x0: float, y0: float, x1: float, y1: float) -> List[int]:
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        candidates = self._candidates(x0, y0, x1, y1)
+        pts = self.points[candidates]
+        inside = (pts[:, 0] >= x0) & (pts[:, 0] <= x1) & (pts[:, 1] >= y0) & (pts[:, 1] <= y1)
+        return np.sort(candidates[inside]).tolist()
+
+    def in_polygon(self, polygon: np.ndarray) -> List[int]:
+        polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(polygon) < 3:
+            return []
+        (x0, y0), (x1, y1) = polygon.min(axis=0), polygon.max(axis=0)
+        candidates = self._candidates(x0, y0, x1, y1)
+        inside = _inside_polygon(self.points[candidates], polygon)
+        return np.sort(candidates[inside]).tolist()
+
+    # -------------------------------------------------
+    # Redigering
+    # -------------------------------------------------
+    def advance(self, key: Optional[IndexKey], removed_idx: Sequence[int], added: np.ndarray) -> None:
+        """
+        Följer en redigering: removed_idx blir inaktiva, added (px) läggs sist
+        (samma ordning som $push i kolumnerna).
+        """
+        if len(removed_idx):
+            self.active[np.asarray(removed_idx, dtype=np.int64)] = False
+        added = np.asarray(added, dtype=np.float64).reshape(-1, 2)
+        if len(added):
+            self.points = np.vstack([self.points, added])
+            self.active = np.concatenate([self.active, np.ones(len(added), dtype=bool)])
+            if len(self.points) - self._indexed > max(64, self._indexed // 8):
+                self._build()
+        self.key = key
+
+
+def _inside_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """
+    Udda-jämn-regeln (strålkastning), vektoriserad över punkterna.
+    """
+    inside = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for (ax, ay), (bx, by) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (ay > y) != (by > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+def select_hits(
+    index: PelletIndex,
+    points: Optional[List[Dict[str, float]]] = None,
+    radius: Optional[float] = None,
+    box: Optional[Dict[str, float]] = None,
+    polygon: Optional[List[Dict[str, float]]] = None
+) -> List[int]:
+    """
+    Pelletindex för ett urval i procentkoordinater (som i API:t):
+    points = [{"x", "y"}] (närmaste inom radius px), box = {"x0", "y0",
+    "x1", "y1"}, polygon = [{"x", "y"}, ...]. Urvalen slås ihop.
+    """
+    def to_px(hits: List[Dict[str, float]]) -> np.ndarray:
+        return percent_to_pixels(
+            [float(h["x"]) for h in hits], [float(h["y"]) for h in hits], index.width, index.height
+        ).astype(np.float64)
+
+    selected: List[int] = []
+    if points:
+        selected += index.nearest(to_px(points), settings.HIT_SELECT_RADIUS_PX if radius is None else float(radius))
+    if box:
+        (x0, y0), (x1, y1) = to_px([{"x": box["x0"], "y": box["y0"]}, {"x": box["x1"], "y": box["y1"]}])
+        selected += index.in_box(x0, y0, x1, y1)
+    if polygon:
+        selected += index.in_polygon(to_px(polygon))
+    return list(dict.fromkeys(selected))
+
+
+class PelletIndexCache:
+    """
+    PelletIndexCache
+    ----------------
+    LRU (HIT_INDEX_CACHE_MAX_ENTRIES) över index per skott. Poster som inte
+    använts på HIT_INDEX_CACHE_TTL sekunder tas bort (redigeringssessionen
+    är slut). Per process, som analysis_cache:s LRU.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = settings.HIT_INDEX_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.HIT_INDEX_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[str, Tuple[float, PelletIndex]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shot_id: Any, key: Optional[IndexKey]) -> Optional[PelletIndex]:
+        shot_id = str(shot_id)
+        entry = self._entries.get(shot_id)
+        now = time.monotonic()
+        if entry is None or key is None or entry[1].key != key or now - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        self._entries[shot_id] = (now, entry[1])
+        self._entries.move_to_end(shot_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, shot_id: Any, index: PelletIndex) -> None:
+        if self.max_entries <= 0 or index.key is None:
+            return
+        now = time.monotonic()
+        self._entries[str(shot_id)] = (now, index)
+        self._entries.move_to_end(str(shot_id))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        for stale in [sid for sid, (used, _) in self._entries.items() if now - used > self.ttl]:
+            del self._entries[stale]
+
+    def discard(self, shot_id: Any) -> None:
+        self._entries.pop(str(shot_id), None)
+
+
+# Singleton-instans
+pellet_index_cache = PelletIndexCache()
@@ -0,0 +1,223 @@
+"""
+Kompakt lagring av pellets i shots.analysis_results.
+
+Schema 1 (äldre) sparade varje pellet flera gånger som listor av dicts:
+individual_pellets, zone_analysis.*.pellets, distribution.*.pellets,
+closest_hits och outer_hits.
+
+Schema 2 (schema_version: 2) sparar dem en gång, kolumnvis:
+
+    "pellets": {
+        "x": [...], "y": [...],     # procent av bildens bredd/höjd (som individual_pellets)
+        "distance": [...],          # avstånd till centrum (cm), None för manuellt tillagda
+        "zone": [...],              # index i ZONE_NAMES
+        "quadrant": [...]           # index i QUADRANT_NAMES
+    },
+    "closest_idx": [...], "outer_idx": [...],   # index i pellets
+    "centroid_px": [cx, cy],
+    "zone_analysis": {namn: {radius, hits, percentage}},
+    "distribution": {namn: {count}}
+
+Manuellt redigerade resultat (se incremental_stats) har dessutom
+removed_idx (borttagna pellets, index i kolumnerna) och accumulators
+(löpande summor); closest_idx/outer_idx saknas då och räknas fram här.
+
+Pixelkoordinater räknas fram ur procent + image_dimensions. Detekterade
+pellets har heltalskoordinater och återskapas exakt.
+
+expand_results() bygger upp det gamla formatet för klienter som väntar sig
+det. compact_results() gör tvärtom (för migrering och för kod som fortfarande
+ändrar i det gamla formatet).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.pattern_stats import PatternStats, QUADRANT_NAMES, ZONE_NAMES, _round2
+
+SCHEMA_VERSION = 2
+
+# Antal närmaste/yttersta träffar i closest_hits/outer_hits
+EXTREME_HITS = 5
+
+# Fält som bara finns i schema 2 resp. bara i schema 1
+_COMPACT_KEYS = ("schema_version", "pellets", "closest_idx", "outer_idx", "centroid_px",
+                 "removed_idx", "accumulators")
+_LEGACY_KEYS = ("individual_pellets", "closest_hits", "outer_hits")
+
+
+def is_compact(results: Optional[Dict[str, Any]]) -> bool:
+    return bool(results) and results.get("schema_version") == SCHEMA_VERSION
+
+
+def _dimensions(results: Dict[str, Any]) -> Tuple[int, int]:
+    dims = results.get("image_dimensions") or {}
+    return int(dims.get("width") or 0), int(dims.get("height") or 0)
+
+
+def _pixel_coords(pct: List[float], size: int) -> np.ndarray:
+    """
+    Procent => pixlar. Om närmaste heltal ger exakt samma procentvärde
+    (alltid fallet för detekterade pellets) används heltalet.
+    """
+    pct_arr = np.asarray(pct, dtype=np.float64)
+    if size <= 0:
+        return pct_arr.astype(np.float32)
+    px = pct_arr * size / 100.0
+    snapped = np.rint(px)
+    exact = np.asarray(_round2((snapped / size) * 100), dtype=np.float64) == pct_arr
+    return np.where(exact, snapped, px).astype(np.float32)
+
+
+def percent_to_pixels(xs: List[float], ys: List[float], width: int, height: int) -> np.ndarray:
+    """
+    (N, 2) float32 pixelkoordinater för procentkoordinater.
+    """
+    return np.column_stack((_pixel_coords(xs, width), _pixel_coords(ys, height))).reshape(-1, 2)
+
+
+def pellet_pixels(results: Dict[str, Any]) -> np.ndarray:
+    """
+    (N, 2) float32 pixelkoordinater för pellets i ett schema 2-resultat
+    (alla kolumnrader, även borttagna => se active_mask).
+    """
+    pellets = results.get("pellets") or {}
+    width, height = _dimensions(results)
+    return percent_to_pixels(pellets.get("x") or [], pellets.get("y") or [], width, height)
+
+
+def active_mask(results: Dict[str, Any]) -> np.ndarray:
+    """
+    Bool per kolumnrad: False för pellets i removed_idx.
+    """
+    count = len((results.get("pellets") or {}).get("x") or [])
+    mask = np.ones(count, dtype=bool)
+    removed = [i for i in results.get("removed_idx") or [] if 0 <= i < count]
+    mask[removed] = False
+    return mask
+
+
+def expand_results(results: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Schema 2 => gamla formatet (individual_pellets, pellets per zon/kvadrant,
+    closest_hits/outer_hits). Schema 1 returneras oförändrat.
+    """
+    if not is_compact(results):
+        return results
+
+    expanded = {k: v for k, v in results.items() if k not in _COMPACT_KEYS}
+    pellets = results.get("pellets") or {}
+    active = active_mask(results)
+    edited = not active.all()
+    xs = pellets.get("x") or []
+    ys = pellets.get("y") or []
+    count = len(xs)
+    distances = pellets.get("distance") or [None] * count
+    zones = pellets.get("zone") or [None] * count
+    quadrants = pellets.get("quadrant") or [None] * count
+    px = pellet_pixels(results)
+    if edited:
+        keep = np.flatnonzero(active).tolist()
+        xs, ys = [xs[i] for i in keep], [ys[i] for i in keep]
+        distances = [distances[i] for i in keep]
+        zones = [zones[i] for i in keep]
+        quadrants = [quadrants[i] for i in keep]
+        px = px[active]
+        count = len(keep)
+
+    individual = []
+    for x, y, d in zip(xs, ys, distances):
+        pellet = {"x": x, "y": y}
+        if d is not None:
+            pellet["distance_from_center"] = d
+        individual.append(pellet)
+    expanded["individual_pellets"] = individual
+
+    px_list = px.tolist()
+
+    zone_analysis = {}
+    for name, zone in (results.get("zone_analysis") or {}).items():
+        index = ZONE_NAMES.index(name) if name in ZONE_NAMES else -1
+        zone_analysis[name] = {
+            **zone,
+            "pellets": [{"x": p[0], "y": p[1]} for p, z in zip(px_list, zones) if z == index]
+        }
+    expanded["zone_analysis"] = zone_analysis
+
+    distribution = {}
+    for name, quadrant in (results.get("distribution") or {}).items():
+        index = QUADRANT_NAMES.index(name) if name in QUADRANT_NAMES else -1
+        distribution[name] = {
+            **quadrant,
+            "pellets": [{"x": p[0], "y": p[1]} for p, q in zip(px_list, quadrants) if q == index]
+        }
+    expanded["distribution"] = distribution
+
+    centroid_px = np.asarray(results.get("centroid_px") or [0.0, 0.0], dtype=np.float32)
+    hit_distances = np.linalg.norm(px - centroid_px, axis=1).tolist() if count else []
+
+    def hit_dicts(indices: List[int]) -> List[Dict[str, float]]:
+        return [
+            {"x": px_list[i][0], "y": px_list[i][1], "distance": hit_distances[i]}
+            for i in indices if 0 <= i < count
+        ]
+
+    if "closest_idx" in results and not edited:
+        closest, outer = results.get("closest_idx") or [], results.get("outer_idx") or []
+    else:
+        # Redigerat resultat => närmaste/yttersta räknas fram ur de aktiva
+        order = np.argsort(np.asarray(hit_distances, dtype=np.float64), kind="stable").tolist()
+        closest, outer = order[:EXTREME_HITS], order[-EXTREME_HITS:]
+    expanded["closest_hits"] = hit_dicts(closest)
+    expanded["outer_hits"] = hit_dicts(outer)
+    return expanded
+
+
+def compact_results(results: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Gamla formatet => schema 2. Zon, kvadrant och närmaste/yttersta träffar
+    räknas fram ur individual_pellets (samma centrum som analysen använde);
+    lagrade antal i zone_analysis/distribution behålls.
+    Schema 2 returneras oförändrat.
+    """
+    if not results or is_compact(results):
+        return results
+
+    compact = {k: v for k, v in results.items() if k not in _LEGACY_KEYS}
+    individual = results.get("individual_pellets") or []
+    width, height = _dimensions(results)
+
+    xs = [p.get("x", 0.0) for p in individual]
+    ys = [p.get("y", 0.0) for p in individual]
+    px = np.column_stack((_pixel_coords(xs, width), _pixel_coords(ys, height))).reshape(-1, 2)
+    stats = PatternStats(px, max(width, 1), max(height, 1))
+
+    compact["zone_analysis"] = {
+        name: {k: v for k, v in zone.items() if k != "pellets"}
+        for name, zone in (results.get("zone_analysis") or {}).items()
+    }
+    compact["distribution"] = {
+        name: {k: v for k, v in quadrant.items() if k != "pellets"}
+        for name, quadrant in (results.get("distribution") or {}).items()
+    }
+    compact["pellets"] = {
+        "x": xs,
+        "y": ys,
+        "distance": [p.get("distance_from_center") for p in individual],
+        "zone": stats.zone_index.tolist(),
+        "quadrant": stats.quadrant_index.tolist(),
+    }
+    compact["closest_idx"] = stats.closest_indices(len(results.get("closest_hits") or [])).tolist()
+    compact["outer_idx"] = stats.outer_indices(len(results.get("outer_hits") or [])).tolist()
+    compact["centroid_px"] = [float(stats.centroid[0]), float(stats.centroid[1])]
+    compact["schema_version"] = SCHEMA_VERSION
+    return compact
+
+
+def expand_shot(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Expanderar doc["analysis_results"] på plats (för API-svar) och returnerar doc.
+    """
+    if doc and doc.get("analysis_results"):
+        doc["analysis_results"] = expand_results(doc["analysis_results"])
+    return doc
@@ -0,0 +1,341 @@
+"""
+Gemensam förbehandlingspipeline för ImageProcessor och PatternAnalyzer.
+
+Tidigare kördes fastNlMeansDenoising två gånger per bild (först i
+ImageProcessor.preprocess_image, sedan igen i PatternAnalyzer) och
+kontrastförbättringen gick via en numpy -> PIL -> numpy-rundresa.
+
+PreprocessingPipeline beskriver stegen deklarativt (STAGES), kör varje
+filter en gång och återanvänder arbetsbuffertar mellan stegen. Resultatet
+(PreprocessedFrame) bär med sig slutbilden (för kvalitetsmåtten) och
+detekteringens indata: slutbilden brusreducerad en gång till (steget
+"detect"), precis som PatternAnalyzer gjorde på egen hand tidigare =>
+samma träffar som före den gemensamma pipelinen.
+
+ROI-läge (ANALYSIS_ROI_MODE): steget "roi" letar upp målarket/ringen på en
+grov nivå (Otsu-kontur + HoughCircles, se locate_target) och beskär
+originalbilden före omskalningen => max_dimension gäller bara målet, som
+därmed analyseras i högre upplösning när fotot har breda marginaler.
+Beskärningen hamnar strax innanför arkets kant: kanten mot bakgrunden blir
+annars en yttre kontur som "äter upp" alla träffar (RETR_EXTERNAL).
+Bilder där målet redan fyller fotot beskärs inte (ANALYSIS_ROI_MIN_GAIN)
+och ger samma resultat som utan ROI. PreprocessedFrame.offset/full_size
+räknar tillbaka koordinaterna till hela bilden (i den beskurna bildens skala).
+
+Rutläge (ANALYSIS_TILED_MODE): max_dimension blir ANALYSIS_TILED_MAX_DIMENSION
+(i praktiken ingen nedskalning) och brusreduceringen, det enda dyra steget,
+körs per ruta i trådpoolen från app.services.tiling (båda passen). Överlappet är
+filtrets räckvidd (halva mall- + sökfönstret) => samma resultat som i ett svep.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.services.tiling import map_tiles, tile_layout
+from app.services.timing import StageTimer
+
+
+@dataclass
+class PreprocessedFrame:
+    """
+    Resultat från PreprocessingPipeline.run().
+
+    image:    slutbild (kontrast -> brusreducering -> CLAHE -> Gauss), uint8 gråskala
+    denoised: brusreducerad gråskalebild (före CLAHE/Gauss)
+    detect:   indata till PatternAnalyzer (slutbilden brusreducerad igen),
+              None => analysen brusreducerar image själv
+    scale:    skalfaktor från originalbilden (1.0 => ingen omskalning)
+    timings:  millisekunder per steg
+    offset:   (x, y) för beskärningen i den omskalade bilden (ROI-läge)
+    full_size: (bredd, höjd) för hela den omskalade bilden, None => ingen beskärning
+    """
+    image: np.ndarray
+    denoised: np.ndarray
+    scale: float = 1.0
+    timings: Dict[str, float] = field(default_factory=dict)
+    offset: Tuple[int, int] = (0, 0)
+    full_size: Optional[Tuple[int, int]] = None
+    detect: Optional[np.ndarray] = None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.image.shape
+
+    @property
+    def size(self) -> int:
+        return self.image.size
+
+
+def enhance_contrast(gray: np.ndarray, factor: float, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Motsvarar PIL.ImageEnhance.Contrast(img).enhance(factor) för gråskala:
+    blandar bilden med dess (avrundade) medelvärde => mean + factor * (x - mean).
+    Körs direkt i OpenCV (mättad uint8-aritmetik), kan skriva in-place.
+    PIL trunkerar i stället för att avrunda => -0.49 i offset ger bitidentiskt resultat.
+    """
+    mean = int(cv2.mean(gray)[0] + 0.5)
+    return cv2.addWeighted(gray, factor, gray, 0.0, (1.0 - factor) * mean - 0.49, dst=dst)
+
+
+def otsu_bbox(gray: np.ndarray, binary: Optional[np.ndarray] = None) -> Optional[Tuple[int, int, int, int]]:
+    """
+    (x, y, w, h) för största ljusa området efter Otsu-tröskling (målarket),
+    None om inget hittas. binary = redan trösklad bild (hoppar över trösklingen).
+    """
+    if binary is None:
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    return cv2.boundingRect(max(contours, key=cv2.contourArea))
+
+
+# Samma HoughCircles-parametrar som PatternAnalyzer._detect_ring (i fullupplösning)
+ROI_HOUGH = {"dp": 1.2, "param1": 100, "param2": 30, "min_dist": 100, "min_radius": 20, "max_radius": 2000}
+
+
+def locate_target(
+    image: np.ndarray,
+    coarse_dimension: int = 512,
+    margin: float = 0.03,
+    min_area_fraction: float = 0.05,
+    max_background_bright: float = 0.25
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Grov lokalisering av målet: skalar ner till coarse_dimension (INTER_AREA)
+    och tar unionen av
+      - största Otsu-konturen (målarket, som ImageProcessor.extract_region_of_interest),
+        krympt med margin (arkets kant ska inte med)
+      - största cirkeln från HoughCircles (ringen), utökad med margin
+    margin är en andel av bildens längsta sida. None om inget ark hittas
+    eller om mer än max_background_bright av ytan utanför det också är ljus
+    (då är "arket" bara en del av målet, t.ex. insidan av ringen). En
+    beskärning till bara ringen skulle tappa träffarna utanför den.
+    Returnerar (x, y, w, h) i image-koordinater.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, coarse_dimension / max(height, width))
+    small = image
+    if scale < 1.0:
+        small = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    small_area = gray.shape[0] * gray.shape[1]
+    pad = margin * max(gray.shape)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    sheet = otsu_bbox(gray, binary)
+    if sheet is None or sheet[2] * sheet[3] < min_area_fraction * small_area:
+        return None
+    x, y, w, h = sheet
+    outside_area = small_area - w * h
+    if outside_area > 0:
+        outside_bright = cv2.countNonZero(binary) - cv2.countNonZero(binary[y:y + h, x:x + w])
+        if outside_bright > max_background_bright * outside_area:
+            return None
+    inset = min(pad, w / 4, h / 4)
+    boxes = [(x + inset, y + inset, w - 2 * inset, h - 2 * inset)]
+
+    circles = cv2.HoughCircles(
+        cv2.GaussianBlur(gray, (9, 9), 2),
+        cv2.HOUGH_GRADIENT,
+        dp=ROI_HOUGH["dp"],
+        minDist=max(1.0, ROI_HOUGH["min_dist"] * scale),
+        param1=ROI_HOUGH["param1"],
+        param2=ROI_HOUGH["param2"],
+        minRadius=max(5, int(ROI_HOUGH["min_radius"] * scale)),
+        maxRadius=max(6, int(ROI_HOUGH["max_radius"] * scale))
+    )
+    if circles is not None and len(circles) > 0:
+        cx, cy, r = max(circles[0], key=lambda c: c[2])
+        r += pad
+        boxes.append((cx - r, cy - r, 2 * r, 2 * r))
+
+    # Unionen, tillbaka till image-koordinater (avrunda utåt)
+    x0 = max(0, int(min(b[0] for b in boxes) / scale))
+    y0 = max(0, int(min(b[1] for b in boxes) / scale))
+    x1 = min(width, int(np.ceil(max(b[0] + b[2] for b in boxes) / scale)))
+    y1 = min(height, int(np.ceil(max(b[1] + b[3] for b in boxes) / scale)))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+class PreprocessingPipeline:
+    """
+    PreprocessingPipeline
+    ---------------------
+    Stegen körs i ordningen i STAGES; varje steg är en metod _stage_<namn>.
+    Två buffertar används: 'work' (gråskala -> kontrast -> CLAHE -> Gauss,
+    in-place) samt 'denoised' som sparas i resultatet. 'detect' är
+    slutbilden brusreducerad en gång till (detect_denoise_h, samma fönster).
+    """
+
+    VERSION = "2"
+    STAGES = ("roi", "resize", "grayscale", "contrast", "denoise", "clahe", "blur", "detect")
+
+    def __init__(
+        self,
+        max_dimension: Optional[int] = None,
+        contrast_factor: float = 1.5,
+        denoise_h: float = 10,
+        denoise_template_window: int = 7,
+        denoise_search_window: int = 21,
+        detect_denoise_h: float = 10,
+        clahe_clip_limit: float = 2.0,
+        clahe_tile_grid: Tuple[int, int] = (8, 8),
+        blur_kernel_size: Optional[Tuple[int, int]] = None,
+        roi_enabled: Optional[bool] = None,
+        roi_coarse_dimension: Optional[int] = None,
+        roi_margin: Optional[float] = None,
+        roi_min_gain: Optional[float] = None,
+        tiled: Optional[bool] = None,
+        tile_size: Optional[int] = None
+    ):
+        self.tiled = settings.ANALYSIS_TILED_MODE if tiled is None else tiled
+        if max_dimension is None:
+            max_dimension = settings.ANALYSIS_TILED_MAX_DIMENSION if self.tiled else 1600
+        self.max_dimension = max_dimension
+        self.tile_size = tile_size or settings.ANALYSIS_TILE_SIZE
+        self.contrast_factor = contrast_factor
+        self.denoise_h = denoise_h
+        self.denoise_template_window = denoise_template_window
+        self.denoise_search_window = denoise_search_window
+        self.detect_denoise_h = detect_denoise_h
+        self.clahe_clip_limit = clahe_clip_limit
+        self.clahe_tile_grid = tuple(clahe_tile_grid)
+        self.blur_kernel_size = tuple(blur_kernel_size or settings.BLUR_KERNEL_SIZE)
+        self.roi_enabled = settings.ANALYSIS_ROI_MODE if roi_enabled is None else roi_enabled
+        self.roi_coarse_dimension = roi_coarse_dimension or settings.ANALYSIS_ROI_COARSE_DIMENSION
+        self.roi_margin = settings.ANALYSIS_ROI_MARGIN if roi_margin is None else roi_margin
+        self.roi_min_gain = settings.ANALYSIS_ROI_MIN_GAIN if roi_min_gain is None else roi_min_gain
+
+    def describe(self) -> Dict[str, Any]:
+        """
+        Alla parametrar som påverkar resultatet (t.ex. för cache-nycklar).
+        """
+        return {
+            "version": self.VERSION,
+            "stages": list(self.STAGES),
+            "max_dimension": self.max_dimension,
+            "contrast_factor": self.contrast_factor,
+            "denoise": [self.denoise_h, self.denoise_template_window, self.denoise_search_window],
+            "detect_denoise": self.detect_denoise_h,
+            "clahe": [self.clahe_clip_limit, list(self.clahe_tile_grid)],
+            "blur_kernel_size": list(self.blur_kernel_size),
+            "roi": [self.roi_enabled, self.roi_coarse_dimension, self.roi_margin, self.roi_min_gain],
+        }
+
+    def run(self, image: np.ndarray) -> PreprocessedFrame:
+        if image is None or image.size == 0:
+            raise ValueError("Ogiltig eller tom bild")
+
+        state: Dict[str, Any] = {"image": image, "scale": 1.0, "roi": None}
+        timer = StageTimer()
+        for name in self.STAGES:
+            with timer.stage(name):
+                getattr(self, f"_stage_{name}")(state)
+
+        offset, full_size = (0, 0), None
+        if state["roi"] is not None:
+            # Beskärningen i originalkoordinater => den omskalade bildens koordinater
+            x0, y0, width, height = state["roi"]
+            scale = state["scale"]
+            offset = (int(round(x0 * scale)), int(round(y0 * scale)))
+            full_size = (int(round(width * scale)), int(round(height * scale)))
+
+        return PreprocessedFrame(
+            image=state["work"],
+            denoised=state["denoised"],
+            scale=state["scale"],
+            timings=timer.stages,
+            offset=offset,
+            full_size=full_size,
+            detect=state["detect"]
+        )
+
+    # -------------------------------------------------
+    # Steg
+    # -------------------------------------------------
+    def _stage_roi(self, state: Dict[str, Any]) -> None:
+        if not self.roi_enabled:
+            return
+        image = state["image"]
+        height, width = image.shape[:2]
+        bbox = locate_target(image, self.roi_coarse_dimension, self.roi_margin)
+        if bbox is None:
+            return
+
+        x, y, w, h = bbox
+        # Lönar sig inte => kör på hela bilden (samma resultat som utan ROI)
+        if w * h > (1.0 - self.roi_min_gain) * width * height:
+            return
+
+        state["image"] = image[y:y + h, x:x + w]
+        state["roi"] = (x, y, width, height)
+
+    def _stage_resize(self, state: Dict[str, Any]) -> None:
+        image = state["image"]
+        height, width = image.shape[:2]
+        if max(height, width) > self.max_dimension:
+            scale = self.max_dimension / max(height, width)
+            state["image"] = cv2.resize(image, (int(width * scale), int(height * scale)))
+            state["scale"] = scale
+
+    def _stage_grayscale(self, state: Dict[str, Any]) -> None:
+        image = state["image"]
+        if len(image.shape) == 3:
+            state["work"] = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            # Kopia => vi får skriva in-place utan att röra anroparens bild
+            state["work"] = image.copy()
+
+    def _stage_contrast(self, state: Dict[str, Any]) -> None:
+        work = state["work"]
+        enhance_contrast(work, self.contrast_factor, dst=work)
+
+    def _stage_denoise(self, state: Dict[str, Any]) -> None:
+        state["denoised"] = self._denoise_image(state["work"], self.denoise_h)
+
+    def _denoise_image(self, gray: np.ndarray, h: float) -> np.ndarray:
+        height, width = gray.shape[:2]
+        if not self.tiled or max(height, width) <= self.tile_size:
+            return self._denoise(gray, h)
+
+        # Räckvidd: halva mallfönstret + halva sökfönstret
+        reach = self.denoise_template_window // 2 + self.denoise_search_window // 2
+        tiles = tile_layout(width, height, self.tile_size, reach)
+        denoised = np.empty_like(gray)
+
+        def denoise_tile(tile):
+            out = self._denoise(gray[tile.region], h)
+            denoised[tile.y0:tile.y1, tile.x0:tile.x1] = out[tile.core]
+
+        map_tiles(denoise_tile, tiles)
+        return denoised
+
+    def _denoise(self, gray: np.ndarray, h: float) -> np.ndarray:
+        return cv2.fastNlMeansDenoising(
+            gray,
+            None,
+            h=h,
+            templateWindowSize=self.denoise_template_window,
+            searchWindowSize=self.denoise_search_window
+        )
+
+    def _stage_clahe(self, state: Dict[str, Any]) -> None:
+        # cv2.CLAHE har interna buffertar och är inte trådsäker => en per körning
+        # (billig att skapa), så att samma pipeline kan köras i flera trådar
+        clahe = cv2.createCLAHE(clipLimit=self.clahe_clip_limit, tileGridSize=self.clahe_tile_grid)
+        # Kontrastbufferten behövs inte längre => återanvänds som utdata
+        clahe.apply(state["denoised"], dst=state["work"])
+
+    def _stage_blur(self, state: Dict[str, Any]) -> None:
+        work = state["work"]
+        cv2.GaussianBlur(work, self.blur_kernel_size, 0, dst=work)
+
+    def _stage_detect(self, state: Dict[str, Any]) -> None:
+        state["detect"] = self._denoise_image(state["work"], self.detect_denoise_h)
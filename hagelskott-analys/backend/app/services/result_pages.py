@@ -0,0 +1,110 @@
+"""
+Keyset-paginering för listan av analyser (GET /results).
+
+skip/limit låter MongoDB läsa och kasta alla tidigare dokument, så sida 500
+kostar 500 sidor. Här sorteras alltid på (fält, _id) och nästa sida hämtas
+med villkoret "efter sista raden":
+
+    fallande:  fält < v  ELLER  (fält == v OCH _id < id)
+    stigande:  fält > v  ELLER  (fält == v OCH _id > id)
+
+vilket med ett sammansatt index (se connect_db) blir en indexsökning oavsett
+sida. Sista raden skickas till klienten som en opak cursor (base64 av
+bson-JSON, så datum och ObjectId behåller sina typer).
+
+Dokument utan sorteringsfältet (null) sorteras först stigande och sist
+fallande, som i MongoDB; villkoren nedan tar hänsyn till det.
+
+SUMMARY_PROJECTION utesluter pellet-listorna (båda schemana) för listvyer.
+"""
+import base64
+import binascii
+from typing import Any, Dict, Optional, Tuple
+
+from bson import ObjectId, json_util
+
+from app.services.pattern_stats import QUADRANT_NAMES, ZONE_NAMES
+
+# sort_by i API:t => lagrad sökväg
+SORT_FIELDS = {
+    "timestamp": "timestamp",
+    "hit_count": "analysis_results.hit_count",
+    "spread": "analysis_results.spread",
+}
+
+SUMMARY_PROJECTION: Dict[str, int] = {
+    # Schema 2
+    "analysis_results.pellets": 0,
+    "analysis_results.removed_idx": 0,
+    "analysis_results.accumulators": 0,
+    "analysis_results.closest_idx": 0,
+    "analysis_results.outer_idx": 0,
+    # Schema 1
+    "analysis_results.individual_pellets": 0,
+    "analysis_results.closest_hits": 0,
+    "analysis_results.outer_hits": 0,
+    **{f"analysis_results.zone_analysis.{name}.pellets": 0 for name in ZONE_NAMES},
+    **{f"analysis_results.distribution.{name}.pellets": 0 for name in QUADRANT_NAMES},
+    # Används bara av aggregaten
+    "aggregate_contribution": 0,
+}
+
+
+def _value(doc: Dict[str, Any], path: str) -> Any:
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def encode_cursor(doc: Dict[str, Any], sort_by: str, sort_order: int) -> str:
+    """
+    Cursor som pekar på doc (sista raden på sidan).
+    """
+    payload = {"s": sort_by, "o": sort_order, "v": _value(doc, SORT_FIELDS[sort_by]), "id": doc["_id"]}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: int) -> Tuple[Any, ObjectId]:
+    """
+    (värde, _id) ur en cursor. ValueError om den är trasig eller skapad
+    för en annan sortering.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json_util.loads(raw)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Ogiltig cursor.") from e
+    if not isinstance(payload, dict) or not isinstance(payload.get("id"), ObjectId):
+        raise ValueError("Ogiltig cursor.")
+    if payload.get("s") != sort_by or payload.get("o") != sort_order:
+        raise ValueError("Cursorn hör till en annan sortering.")
+    return payload.get("v"), payload["id"]
+
+
+def keyset_filter(sort_by: str, sort_order: int, value: Any, last_id: ObjectId) -> Dict[str, Any]:
+    """
+    Villkor för raderna efter (value, last_id) i sorteringen (fält, _id).
+    """
+    field = SORT_FIELDS[sort_by]
+    op = "$lt" if sort_order < 0 else "$gt"
+    same = {field: value, "_id": {op: last_id}}
+    if value is None:
+        # Null först stigande => alla med värde återstår; sist fallande => bara null
+        return {"$or": [{field: {"$ne": None}}, same]} if sort_order > 0 else same
+    after = [{field: {op: value}}, same]
+    if sort_order < 0:
+        after.append({field: None})
+    return {"$or": after}
+
+
+def page_query(query: Dict[str, Any], sort_by: str, sort_order: int,
+               cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Filtret + keyset-villkoret för sidan efter cursor (ingen cursor => första sidan).
+    """
+    if not cursor:
+        return query
+    after = keyset_filter(sort_by, sort_order, *decode_cursor(cursor, sort_by, sort_order))
+    return {"$and": [query, after]} if query else after
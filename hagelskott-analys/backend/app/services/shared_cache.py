@@ -0,0 +1,150 @@
+"""
+Cache i processen som delar invalidering mellan arbetsprocesserna.
+
+Varje process (WORKER_COUNT uvicorn-arbetare) har sina egna poster, men en
+namnrymd har ett versionsnummer i 'cache_versions' ({_id: namnrymd,
+version}). invalidate() ökar versionen med $inc; övriga processer läser den
+högst en gång per CACHE_VERSION_CHECK_INTERVAL sekunder (en find_one på
+_id, delad av alla requests i processen) och betraktar poster med äldre
+version som inaktuella. En ändring syns därmed i alla processer inom ungefär
+en sekund, även på en fristående MongoDB (change streams kräver replica set).
+
+Hämtning per nyckel:
+
+    färsk post                 returneras direkt
+    utgången post (TTL)        den gamla returneras och en omladdning
+                               startas i bakgrunden (stale-while-revalidate)
+    invaliderad post (version) laddas om, och samtidiga anrop väntar på
+    ingen post / force_refresh samma laddning (ett asyncio.Lock per nyckel)
+
+så en utgången eller invaliderad cache ger en enda fråga per process och
+nyckel i stället för en per samtidig request. Invaliderade värden lämnas
+aldrig ut: de var uttryckligen inaktuella, hur länge sedan det än var.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.db.mongodb import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "cache_versions"
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    loaded_at: float
+    version: int
+
+
+class SharedCache:
+    """
+    SharedCache
+    -----------
+    get(key, loader) där loader är en korutinfunktion utan argument som
+    hämtar värdet. Värdena delas mellan requests => får inte ändras av
+    anroparen.
+    """
+
+    def __init__(self, namespace: str, ttl: float, check_interval: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.check_interval = settings.CACHE_VERSION_CHECK_INTERVAL if check_interval is None else check_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._version = 0
+        self._version_checked_at = float("-inf")
+        self._version_lock = asyncio.Lock()
+
+    # -------------------------------------------------
+    # Version (delad mellan processerna)
+    # -------------------------------------------------
+    async def _current_version(self) -> int:
+        if time.monotonic() - self._version_checked_at < self.check_interval:
+            return self._version
+        async with self._version_lock:
+            # En annan request kan ha läst versionen medan vi väntade
+            if time.monotonic() - self._version_checked_at >= self.check_interval:
+                try:
+                    database = await db.get_database()
+                    doc = await database[COLLECTION].find_one({"_id": self.namespace})
+                    self._version = int(doc["version"]) if doc else 0
+                except Exception as e:
+                    # Ingen kontakt => fortsätt med den senast kända versionen
+                    logger.warning(f"[SharedCache:{self.namespace}] Kunde ej läsa version => {e}")
+                self._version_checked_at = time.monotonic()
+        return self._version
+
+    async def invalidate(self) -> None:
+        """
+        Tömmer posterna i den här processen och ökar versionen för de övriga.
+        """
+        self._entries.clear()
+        try:
+            database = await db.get_database()
+            doc = await database[COLLECTION].find_one_and_update(
+                {"_id": self.namespace},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._version = int(doc["version"])
+            self._version_checked_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"[SharedCache:{self.namespace}] Kunde ej öka version => {e}", exc_info=True)
+        logger.info(f"[SharedCache:{self.namespace}] Invaliderad (version {self._version}).")
+
+    # -------------------------------------------------
+    # Hämtning
+    # -------------------------------------------------
+    async def get(self, key: str, loader: Loader, force_refresh: bool = False) -> Any:
+        version = await self._current_version()
+        entry = self._entries.get(key)
+        if entry is None or force_refresh or entry.version != version:
+            return await self._load(key, loader, version, force_refresh)
+        if time.monotonic() - entry.loaded_at >= self.ttl:
+            self._refresh_in_background(key, loader, version)
+        return entry.value
+
+    async def _load(self, key: str, loader: Loader, version: int, force_refresh: bool = False) -> Any:
+        requested_at = time.monotonic()
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Laddad av ett samtidigt anrop medan vi väntade => samma värde
+            entry = self._entries.get(key)
+            if entry is not None and entry.version >= version and (
+                entry.loaded_at >= requested_at
+                or (not force_refresh and time.monotonic() - entry.loaded_at < self.ttl)
+            ):
+                return entry.value
+            value = await loader()
+            # Invaliderad under laddningen => värdet lämnas ut men sparas inte
+            if version >= self._version:
+                self._entries[key] = _Entry(value, time.monotonic(), version)
+            return value
+
+    def _refresh_in_background(self, key: str, loader: Loader, version: int) -> None:
+        task = self._refreshing.get(key)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._load(key, loader, version, force_refresh=True))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda t: self._refresh_done(key, t))
+
+    def _refresh_done(self, key: str, task: asyncio.Task) -> None:
+        if self._refreshing.get(key) is task:
+            del self._refreshing[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Den gamla posten ligger kvar => nästa anrop försöker igen
+            logger.error(f"[SharedCache:{self.namespace}] Omladdning av {key} misslyckades => {task.exception()}")
@@ -0,0 +1,169 @@
+"""
+Rutindelning av stora bilder (ANALYSIS_TILED_MODE).
+
+Skannade mönsterark (1 x 1 m) är långt större än pipelinens 1600 px, och
+nedskalningen tappar små hagel (#9). I rutläget analyseras bilden i full
+upplösning: den delas i rutor om ANALYSIS_TILE_SIZE px med ANALYSIS_TILE_OVERLAP
+px överlapp per sida, och varje ruta bearbetas i en trådpool (OpenCV släpper
+GIL:en under sina anrop => rutorna körs parallellt på alla kärnor).
+
+Varje filter har en räckvidd (t.ex. halva blockstorleken i adaptiveThreshold):
+pixlar närmare än räckvidden från en inre snittkant blir inte som i helbilden.
+Den som använder rutorna ansvarar för att bara lita på pixlar/konturer minst
+så långt in (se Tile.inner).
+
+Konturer i överlappsbanden hittas av flera rutor; dedupe_points tar bort
+dubbletterna med en spatial hash (celler om radius px).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    x0, y0, x1, y1:  rutans egen del (kärnan), rutorna täcker bilden utan glapp
+    rx0, ry0, rx1, ry1: kärnan + överlapp, klippt mot bilden (det som bearbetas)
+    """
+    index: int
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+    rx0: int
+    ry0: int
+    rx1: int
+    ry1: int
+
+    @property
+    def region(self) -> Tuple[slice, slice]:
+        return slice(self.ry0, self.ry1), slice(self.rx0, self.rx1)
+
+    @property
+    def core(self) -> Tuple[slice, slice]:
+        """
+        Kärnan i rutans egna koordinater (för att klistra tillbaka resultat).
+        """
+        return slice(self.y0 - self.ry0, self.y1 - self.ry0), slice(self.x0 - self.rx0, self.x1 - self.rx0)
+
+    def inner(self, width: int, height: int, reach: int) -> Tuple[int, int, int, int]:
+        """
+        (x0, y0, x1, y1) i bildkoordinater där filter med räckvidden reach ger
+        samma resultat som i helbilden. Bildens egna kanter räknas inte som snitt.
+        """
+        return (
+            self.rx0 + reach if self.rx0 > 0 else 0,
+            self.ry0 + reach if self.ry0 > 0 else 0,
+            self.rx1 - reach if self.rx1 < width else width,
+            self.ry1 - reach if self.ry1 < height else height,
+        )
+
+
+def tile_layout(width: int, height: int, tile_size: int, overlap: int) -> List[Tile]:
+    """
+    Rutor i radordning. Bilder som ryms i en ruta ger en enda ruta (hela bilden).
+    """
+    tile_size = max(1, int(tile_size))
+    overlap = max(0, int(overlap))
+    tiles = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            x1 = min(width, x0 + tile_size)
+            y1 = min(height, y0 + tile_size)
+            tiles.append(Tile(
+                index=len(tiles),
+                x0=x0, y0=y0, x1=x1, y1=y1,
+                rx0=max(0, x0 - overlap), ry0=max(0, y0 - overlap),
+                rx1=min(width, x1 + overlap), ry1=min(height, y1 + overlap),
+            ))
+    return tiles
+
+
+# Processens trådpool för rutorna (skapas vid första användningen)
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def tile_workers() -> int:
+    """
+    ANALYSIS_TILE_WORKERS, 0 => kärnorna delade på analysprocesserna
+    (varje arbetsprocess i AnalysisExecutor har en egen pool).
+    """
+    if settings.ANALYSIS_TILE_WORKERS > 0:
+        return settings.ANALYSIS_TILE_WORKERS
+    return max(1, (os.cpu_count() or 1) // max(1, settings.ANALYSIS_WORKERS))
+
+
+def get_tile_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = tile_workers()
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tile")
+            logger.info(f"[tiling] Trådpool med {workers} trådar")
+        return _pool
+
+
+def map_tiles(func: Callable[[Tile], T], tiles: List[Tile]) -> List[T]:
+    """
+    func(tile) för alla rutor, resultaten i rutornas ordning.
+    En ruta => körs direkt utan poolen.
+    """
+    if len(tiles) <= 1:
+        return [func(tile) for tile in tiles]
+    return list(get_tile_pool().map(func, tiles))
+
+
+def dedupe_points(points: np.ndarray, tile_ids: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Bool-mask över points (N, 2): False för punkter som ligger inom radius
+    från en redan behållen punkt från en annan ruta (den första behålls).
+    Punkter från samma ruta jämförs aldrig (två konturer i samma ruta är
+    alltid olika objekt).
+
+    Spatial hash: cellstorlek = radius => grannar finns i de 3 x 3 närmaste cellerna.
+    """
+    keep = np.ones(len(points), dtype=bool)
+    if len(points) < 2:
+        return keep
+
+    radius = max(float(radius), 1e-6)
+    radius_sq = radius * radius
+    cells = np.floor(np.asarray(points, dtype=np.float64) / radius).astype(np.int64)
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    coords = np.asarray(points, dtype=np.float64).tolist()
+    ids = np.asarray(tile_ids).tolist()
+
+    for i, (cx, cy) in enumerate(cells.tolist()):
+        x, y = coords[i]
+        duplicate = False
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for j in grid.get((gx, gy), ()):
+                    if ids[j] != ids[i]:
+                        dx = coords[j][0] - x
+                        dy = coords[j][1] - y
+                        if dx * dx + dy * dy <= radius_sq:
+                            duplicate = True
+                            break
+                if duplicate:
+                    break
+            if duplicate:
+                break
+        if duplicate:
+            keep[i] = False
+        else:
+            grid.setdefault((cx, cy), []).append(i)
+    return keep
@@ -0,0 +1,131 @@
+"""
+Tidsmätning per steg i analyskedjan.
+
+StageTimer samlar millisekunder per namngivet steg:
+
+    timer = StageTimer()
+    with timer.stage("ring_detection"):
+        ring = self._detect_ring(gray)
+    timer.as_dict()   # {"ring_detection_ms": 12.345}
+
+Används av PreprocessingPipeline (ImageProcessor), PatternAnalyzer och
+analysis_executor; den samlade uppdelningen sparas som analysis_timings på
+shot-dokumentet.
+
+TimingStats håller de senaste ANALYSIS_TIMINGS_WINDOW värdena per steg och
+ger p50/p95 + histogram (GET /api/health/analysis-timings). Statistiken är
+per process: med flera uvicorn-workers visar varje process sina egna analyser.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Övre gränser (ms) för histogrammets hinkar; sista hinken är "över 30 s"
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class StageTimer:
+    """
+    Millisekunder per steg i den ordning stegen kördes. Samma namn två
+    gånger => tiderna summeras (t.ex. ett steg som körs per ruta).
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = round(self.stages.get(name, 0.0) + float(ms), 3)
+
+    def as_dict(self, prefix: str = "") -> Dict[str, float]:
+        """
+        {"<prefix><steg>_ms": ms} => formatet i analysis_timings.
+        """
+        return {f"{prefix}{name}_ms": ms for name, ms in self.stages.items()}
+
+
+class TimingStats:
+    """
+    Rullande fönster med de senaste värdena per nyckel i analysis_timings.
+    """
+
+    def __init__(self, window: Optional[int] = None):
+        self.window = settings.ANALYSIS_TIMINGS_WINDOW if window is None else window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.analyses = 0
+        self.started_at = datetime.utcnow()
+
+    def record(self, timings: Optional[Dict[str, Any]]) -> None:
+        if not timings or self.window <= 0:
+            return
+        with self._lock:
+            self.analyses += 1
+            for key, value in timings.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                samples = self._samples.get(key)
+                if samples is None:
+                    samples = self._samples[key] = deque(maxlen=self.window)
+                samples.append(float(value))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self.analyses = 0
+            self.started_at = datetime.utcnow()
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        {"analyses", "window", "since", "stages": {nyckel: {count, p50, p95,
+        mean, max, histogram}}}; stegen sorterade efter p95, dyrast först.
+        """
+        with self._lock:
+            snapshot = {key: np.fromiter(values, dtype=np.float64) for key, values in self._samples.items()}
+            analyses = self.analyses
+
+        stages = {}
+        for key, values in snapshot.items():
+            if values.size == 0:
+                continue
+            p50, p95 = np.percentile(values, [50, 95])
+            counts = np.bincount(np.searchsorted(HISTOGRAM_BOUNDS_MS, values), minlength=len(HISTOGRAM_BOUNDS_MS) + 1)
+            stages[key] = {
+                "count": int(values.size),
+                "p50": round(float(p50), 3),
+                "p95": round(float(p95), 3),
+                "mean": round(float(values.mean()), 3),
+                "max": round(float(values.max()), 3),
+                "histogram": [
+                    {"le": bound, "count": int(count)}
+                    for bound, count in zip(list(HISTOGRAM_BOUNDS_MS) + [None], counts.tolist())
+                ],
+            }
+
+        return {
+            "analyses": analyses,
+            "window": self.window,
+            "since": self.started_at.isoformat(),
+            "stages": dict(sorted(stages.items(), key=lambda item: item[1]["p95"], reverse=True)),
+        }
+
+
+# Singleton-instans (per process), fylls av analysis_executor
+analysis_timing_stats = TimingStats()
@@ -0,0 +1,107 @@
+"""
+Strömmande mottagning av uppladdade bilder.
+
+Tidigare lästes hela filen in med file.read(), storleken kontrollerades
+först efteråt, bytes kopierades vidare till imdecode och skrevs sedan till
+disk (i /upload dessutom omkodad med cv2.imwrite). Här:
+ - läses filen i bitar om UPLOAD_CHUNK_SIZE och avbryts så fort den
+   överskrider gränsen (eller direkt om UploadFile.size redan är för stor)
+ - skrivs bitarna till slutlig sökväg (via .part + os.replace) och
+   SHA-256 räknas under tiden
+ - avkodas bilden från en memmap av den sparade filen => ingen extra kopia
+   av originalet i minnet
+Originalfilen sparas oförändrad.
+"""
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import aiofiles
+import cv2
+import numpy as np
+from fastapi import UploadFile
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(ValueError):
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Bildfilen överskrider {max_bytes / (1024 * 1024):.2f} MB.")
+
+
+class EmptyUploadError(ValueError):
+    def __init__(self):
+        super().__init__("Uppladdad bild är tom (inga bytes).")
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size_bytes: int
+    sha256: str
+
+
+async def spool_upload(
+    file: UploadFile,
+    dest_path: str,
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> SpooledUpload:
+    """
+    Skriver file till dest_path i bitar och räknar SHA-256 under tiden.
+    Avbryter med UploadTooLargeError när max_bytes passeras (inget lämnas
+    kvar på disk), EmptyUploadError om filen är tom.
+    """
+    max_bytes = settings.MAX_UPLOAD_SIZE if max_bytes is None else max_bytes
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    tmp_path = f"{dest_path}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out_file.write(chunk)
+
+        if size == 0:
+            raise EmptyUploadError()
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    logger.debug(f"[upload_storage] Sparade {dest_path} ({size} bytes)")
+    return SpooledUpload(path=str(dest_path), size_bytes=size, sha256=digest.hexdigest())
+
+
+def decode_image_file(path: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """
+    Avkodar en sparad bild via memmap (filen läses av OS:et, inte till en
+    egen bytes-buffert). None om OpenCV inte kan avkoda den.
+    Blockerande => anropa via asyncio.to_thread.
+    """
+    if os.path.getsize(path) == 0:
+        return None
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    try:
+        return cv2.imdecode(data, flags)
+    finally:
+        del data
@@ -0,0 +1,239 @@
+"""
+Användarstatistik i 'user_statistics' (ett dokument per user_id).
+
+Dokumentet uppdateras med en enda atomisk uppdatering per händelse:
+
+    ny analys           $inc total_shots/total_hits/sum_pattern_density, $max best_pattern_density (upsert)
+    ändrade träffar     $inc total_hits med skillnaden, $max best_pattern_density
+    raderad analys      $inc med minus (best_pattern_density kan då bli för hög)
+
+Genomsnitten räknas vid läsning (get), så inget behöver läsas före en
+skrivning och samtidiga uppladdningar/redigeringar kan inte skriva över
+varandra. Det som inte går att hålla exakt med $inc/$max (bästa täthet
+efter radering/redigering, analyser som ändrats utanför AnalysisService)
+rättas av recompute(): en aggregering över 'shots' som skriver resultatet
+med $merge. UserStatisticsJob kör den periodiskt
+(USER_STATS_REFRESH_INTERVAL); en lease i 'maintenance_locks' gör att bara
+en process åt gången räknar om. En händelse som skrivs medan omräkningen
+pågår kan skrivas över av $merge och kommer då med först vid nästa omräkning.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import settings
+from app.db.mongodb import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "user_statistics"
+_COUNTERS = ("total_shots", "total_hits", "sum_pattern_density")
+# Fält från det äldre formatet (genomsnitt lagrade i dokumentet) som
+# $merge med whenMatched "merge" inte tar bort
+_LEGACY_FIELDS = ("average_hits",)
+
+
+def _recompute_pipeline(match: Dict[str, Any], now: datetime) -> List[Dict[str, Any]]:
+    """
+    shots => ett statistikdokument per user_id, skrivet med $merge
+    (kräver unikt index på user_statistics.user_id, se connect_db).
+    whenMatched "merge" => bara de omräknade fälten skrivs, övriga
+    (t.ex. created_at) ligger kvar.
+    """
+    return [
+        {"$match": {**match, "user_id": {"$exists": True, "$ne": None}}},
+        {"$group": {
+            "_id": "$user_id",
+            "total_shots": {"$sum": 1},
+            "total_hits": {"$sum": {"$ifNull": ["$analysis_results.hit_count", 0]}},
+            "sum_pattern_density": {"$sum": {"$ifNull": ["$analysis_results.pattern_density", 0]}},
+            "best_pattern_density": {"$max": {"$ifNull": ["$analysis_results.pattern_density", 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id",
+            "total_shots": 1,
+            "total_hits": 1,
+            "sum_pattern_density": 1,
+            "best_pattern_density": 1,
+            "last_updated": {"$literal": now},
+            "recomputed_at": {"$literal": now},
+        }},
+        {"$merge": {"into": COLLECTION, "on": "user_id", "whenMatched": "merge", "whenNotMatched": "insert"}},
+    ]
+
+
+class UserStatisticsStore:
+    """
+    UserStatisticsStore
+    -------------------
+    Skrivningar (record_*) loggar fel men kastar aldrig => statistiken
+    stoppar inte analysflödet; recompute() rättar det som missats.
+    """
+
+    async def _collection(self):
+        db_conn = await db.get_database()
+        return db_conn[COLLECTION]
+
+    async def _increment(self, user_id: str, inc: Dict[str, Any], density: Optional[float]) -> None:
+        try:
+            now = datetime.utcnow()
+            update: Dict[str, Any] = {
+                "$set": {"last_updated": now},
+                "$setOnInsert": {"created_at": now},
+            }
+            if inc:
+                update["$inc"] = inc
+            if density is not None:
+                update["$max"] = {"best_pattern_density": float(density)}
+            stats_coll = await self._collection()
+            await stats_coll.update_one({"user_id": user_id}, update, upsert=True)
+        except Exception as e:
+            logger.error(f"[user_statistics] Kunde ej uppdatera {user_id} => {e}", exc_info=True)
+
+    async def record_shot(self, user_id: str, analysis_results: Dict[str, Any]) -> None:
+        """
+        En ny analys (skapad en gång per shot-dokument).
+        """
+        density = float(analysis_results.get("pattern_density") or 0.0)
+        await self._increment(user_id, {
+            "total_shots": 1,
+            "total_hits": int(analysis_results.get("hit_count") or 0),
+            "sum_pattern_density": density,
+        }, density)
+
+    async def record_edit(self, user_id: str, hits_before: int, density_before: float,
+                          analysis_results: Dict[str, Any]) -> None:
+        """
+        Träffar/täthet ändrade i en befintlig analys => bara skillnaden.
+        """
+        density = float(analysis_results.get("pattern_density") or 0.0)
+        await self._increment(user_id, {
+            "total_hits": int(analysis_results.get("hit_count") or 0) - int(hits_before or 0),
+            "sum_pattern_density": density - float(density_before or 0.0),
+        }, density)
+
+    async def record_delete(self, user_id: str, analysis_results: Dict[str, Any]) -> None:
+        await self._increment(user_id, {
+            "total_shots": -1,
+            "total_hits": -int(analysis_results.get("hit_count") or 0),
+            "sum_pattern_density": -float(analysis_results.get("pattern_density") or 0.0),
+        }, None)
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        """
+        Det förberäknade dokumentet + genomsnitt. Saknas det, eller är det i
+        det äldre formatet (lagrat average_hits), räknas det fram först.
+        """
+        stats_coll = await self._collection()
+        doc = await stats_coll.find_one({"user_id": user_id}, {"_id": 0})
+        if doc is None or any(field in doc for field in _LEGACY_FIELDS):
+            await self.recompute(user_id)
+            doc = await stats_coll.find_one({"user_id": user_id}, {"_id": 0}) or {"user_id": user_id}
+
+        shots = max(int(doc.get("total_shots") or 0), 0)
+        return {
+            "user_id": user_id,
+            "total_shots": shots,
+            "total_hits": int(doc.get("total_hits") or 0),
+            "average_hits": round(doc.get("total_hits", 0) / shots, 2) if shots else 0.0,
+            "average_pattern_density": round(doc.get("sum_pattern_density", 0.0) / shots, 4) if shots else 0.0,
+            "best_pattern_density": float(doc.get("best_pattern_density") or 0.0),
+            "last_updated": doc.get("last_updated"),
+            "recomputed_at": doc.get("recomputed_at"),
+        }
+
+    async def recompute(self, user_id: Optional[str] = None) -> int:
+        """
+        Räknar om statistiken ur 'shots' (en användare eller alla) och
+        skriver den med $merge. Användare utan analyser nollställs.
+        Returnerar antal nollställda dokument.
+        """
+        db_conn = await db.get_database()
+        stats_coll = db_conn[COLLECTION]
+        # MongoDB sparar millisekunder => samma värde i $merge och jämförelsen nedan
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        match = {"user_id": user_id} if user_id else {}
+        await db_conn["shots"].aggregate(_recompute_pipeline(match, now)).to_list(None)
+
+        # Äldre format => get() räknar om så länge fältet finns, så ta bort det
+        legacy = {"user_id": user_id} if user_id else {}
+        legacy["$or"] = [{field: {"$exists": True}} for field in _LEGACY_FIELDS]
+        await stats_coll.update_many(legacy, {"$unset": {field: "" for field in _LEGACY_FIELDS}})
+
+        # Ingen analys kvar => ingen rad från $group, dokumentet nollställs här
+        stale = {"user_id": user_id} if user_id else {}
+        stale["$or"] = [{"recomputed_at": {"$lt": now}}, {"recomputed_at": {"$exists": False}}]
+        res = await stats_coll.update_many(stale, {"$set": {
+            **{key: 0 for key in _COUNTERS},
+            "best_pattern_density": 0.0,
+            "last_updated": now,
+            "recomputed_at": now,
+        }})
+        return res.modified_count
+
+
+class UserStatisticsJob:
+    """
+    UserStatisticsJob
+    -----------------
+    Periodisk omräkning (materialisering) av all användarstatistik. Startas i
+    lifespan; med flera processer räknar bara den som tar leasen.
+    """
+
+    LOCK_ID = "user_statistics"
+
+    def __init__(self, store: UserStatisticsStore, interval: Optional[int] = None):
+        self.store = store
+        self.interval = settings.USER_STATS_REFRESH_INTERVAL if interval is None else interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task or self.interval <= 0:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"[UserStatisticsJob] Omräkning var {self.interval} s.")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self._acquire():
+                    reset = await self.store.recompute()
+                    logger.info(f"[UserStatisticsJob] Statistik omräknad ({reset} nollställda).")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[UserStatisticsJob] Omräkning misslyckades => {e}", exc_info=True)
+
+    async def _acquire(self) -> bool:
+        """
+        Lease i 'maintenance_locks' som gäller till nästa intervall.
+        """
+        db_conn = await db.get_database()
+        now = datetime.utcnow()
+        try:
+            await db_conn["maintenance_locks"].find_one_and_update(
+                {"_id": self.LOCK_ID, "lease_expires_at": {"$lt": now}},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=self.interval * 0.9)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Leasen finns och har inte gått ut => annan process räknar
+            return False
+
+
+# Singleton-instanser
+user_statistics = UserStatisticsStore()
+user_statistics_job = UserStatisticsJob(user_statistics)
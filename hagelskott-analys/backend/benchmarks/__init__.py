@@ -0,0 +1,6 @@
+"""
+Prestandamätningar för analys-pipelinen.
+
+Körs från backend-mappen, t.ex.:
+    python -m benchmarks.preprocessing --images uploads/admin_user
+"""
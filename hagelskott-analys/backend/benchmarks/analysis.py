@@ -0,0 +1,246 @@
+"""
+Genomströmning + träffsäkerhet för hela analysen på syntetiska ark.
+
+Varje bild körs som i appen: ImageProcessor.preprocess (samma kedja som
+preprocess_image, men hela PreprocessedFrame följer med) och
+PatternAnalyzer.analyze_shot_pattern. Mäts:
+
+- bilder/s och latens per bild (p50/p95), plus tid per steg
+  (preprocess_<steg>_ms + analysens egna steg, som analysis_timings)
+- minnestopp per bild (tracemalloc i en extra körning => numpy-buffertar,
+  inte OpenCV:s interna) och processens max RSS
+- precision/recall mot facit: en träff räknas om den ligger inom
+  --tolerance hålradier från ett facithål (en-till-en, se roi.match_hits)
+
+Korpusen genereras i minnet (benchmarks.synthetic.default_corpus) eller
+läses från en mapp skapad av benchmarks.synthetic (--corpus). Resultatet
+kan sparas som JSON (--output) och jämföras med en tidigare körning
+(--baseline); då avslutas skriptet med felkod vid regression.
+
+    python -m benchmarks.analysis --resolutions 1200 2400 --output /tmp/analys.json
+    python -m benchmarks.analysis --baseline /tmp/analys.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.image_processing import ImageProcessor
+from app.services.pattern_analysis import PatternAnalyzer
+from benchmarks.roi import match_hits
+from benchmarks.synthetic import TargetSpec, default_corpus, render_target
+
+
+def load_corpus(args: argparse.Namespace) -> Iterator[Tuple[str, TargetSpec, np.ndarray, np.ndarray]]:
+    """
+    (namn, spec, bild, facit) för --corpus-mappen eller den genererade korpusen.
+    """
+    if args.corpus:
+        corpus = Path(args.corpus)
+        for entry in json.loads((corpus / "facit.json").read_text()):
+            image = cv2.imread(str(corpus / entry["image"]))
+            if image is not None:
+                truth = np.asarray(entry["truth"], dtype=np.float64).reshape(-1, 2)
+                yield entry["image"], TargetSpec(**entry["spec"]), image, truth
+        return
+    for spec in default_corpus(args.resolutions, args.seeds):
+        image, truth = render_target(spec)
+        yield spec.name, spec, image, truth
+
+
+def detected_hits(results: Dict[str, Any], width: int, height: int) -> np.ndarray:
+    """
+    Träffarna (schema 2, procent av bilden) i originalbildens pixlar.
+    """
+    pellets = results.get("pellets") or {}
+    xs = np.asarray(pellets.get("x") or [], dtype=np.float64) * width / 100.0
+    ys = np.asarray(pellets.get("y") or [], dtype=np.float64) * height / 100.0
+    return np.stack([xs, ys], axis=1) if len(xs) else np.zeros((0, 2))
+
+
+def analyze(processor: ImageProcessor, analyzer: PatternAnalyzer,
+            image: np.ndarray, sensitivity: float) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    frame = processor.preprocess(image)
+    results = analyzer.analyze_shot_pattern(frame, sensitivity=sensitivity)
+    stages = {f"preprocess_{name}_ms": ms for name, ms in frame.timings.items()}
+    stages.update(results.get("timings") or {})
+    return results, stages
+
+
+def memory_peak_mb(processor: ImageProcessor, analyzer: PatternAnalyzer,
+                   image: np.ndarray, sensitivity: float) -> float:
+    tracemalloc.start()
+    try:
+        analyze(processor, analyzer, image, sensitivity)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "mean": round(statistics.mean(values), 2)}
+
+
+def _ratio(numerator: int, denominator: int) -> float:
+    return round(numerator / denominator, 4) if denominator else 1.0
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    processor = ImageProcessor()
+    analyzer = PatternAnalyzer()
+
+    rows = []
+    latencies: List[float] = []
+    stage_runs: Dict[str, List[float]] = {}
+    warm = False
+    for name, spec, image, truth in load_corpus(args):
+        if not warm:
+            # Första körningen bygger upp OpenCV/trådpooler => räknas inte
+            analyze(processor, analyzer, image, args.sensitivity)
+            warm = True
+
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results, stages = analyze(processor, analyzer, image, args.sensitivity)
+            elapsed = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed)
+            for stage, ms in stages.items():
+                stage_runs.setdefault(stage, []).append(ms)
+            best = elapsed if best is None else min(best, elapsed)
+
+        height, width = image.shape[:2]
+        hits = detected_hits(results, width, height)
+        tolerance = args.tolerance * spec.hole_radius_px
+        matched = match_hits(truth, hits, tolerance)
+        rows.append({
+            "image": name,
+            "size": [width, height],
+            "ms": round(best, 1),
+            "truth": len(truth),
+            "hits": len(hits),
+            "matched": matched,
+            "precision": _ratio(matched, len(hits)),
+            "recall": _ratio(matched, len(truth)),
+            "memory_peak_mb": round(memory_peak_mb(processor, analyzer, image, args.sensitivity), 1)
+            if args.memory else None,
+        })
+
+    if not rows:
+        raise SystemExit("Tom korpus")
+
+    truth_total = sum(r["truth"] for r in rows)
+    hits_total = sum(r["hits"] for r in rows)
+    matched_total = sum(r["matched"] for r in rows)
+    precision = _ratio(matched_total, hits_total)
+    recall = _ratio(matched_total, truth_total)
+    result = {
+        "created_at": datetime.utcnow().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads(),
+        },
+        "parameters": {
+            "sensitivity": args.sensitivity,
+            "tolerance_radii": args.tolerance,
+            "repeat": args.repeat,
+            "corpus": args.corpus or {"resolutions": args.resolutions, "seeds": args.seeds},
+            "analyzer": analyzer.describe(),
+            "preprocessing": processor.pipeline.describe(),
+        },
+        "images": len(rows),
+        "images_per_sec": round(1000 * len(latencies) / sum(latencies), 3),
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {stage: _percentiles(values) for stage, values in stage_runs.items()},
+        "memory_peak_mb": max(r["memory_peak_mb"] for r in rows) if args.memory else None,
+        # ru_maxrss är KiB på Linux, byte på macOS
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                            / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1),
+        "precision": precision,
+        "recall": recall,
+        "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "rows": rows,
+    }
+    return result
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], max_drop: float, max_slowdown: float) -> List[str]:
+    """
+    Regressioner mot en tidigare körning (tom lista => inga).
+    """
+    problems = []
+    for key in ("precision", "recall"):
+        if result[key] < baseline[key] - max_drop:
+            problems.append(f"{key} {baseline[key]:.4f} => {result[key]:.4f}")
+    slowest = baseline["images_per_sec"] * (1.0 - max_slowdown)
+    if result["images_per_sec"] < slowest:
+        problems.append(f"bilder/s {baseline['images_per_sec']:.3f} => {result['images_per_sec']:.3f}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=None, help="Mapp från benchmarks.synthetic (annars genereras korpusen)")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[1200, 2400], help="Bildbredder (px)")
+    parser.add_argument("--seeds", type=int, default=1, help="Antal slumpfrön per variant")
+    parser.add_argument("--repeat", type=int, default=1, help="Antal körningar per bild")
+    parser.add_argument("--sensitivity", type=float, default=0.5)
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Max avstånd till facit, i hålradier")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="Hoppa över tracemalloc-körningen")
+    parser.add_argument("--output", default=None, help="Spara resultatet som JSON")
+    parser.add_argument("--baseline", default=None, help="Tidigare JSON att jämföra med")
+    parser.add_argument("--max-drop", type=float, default=0.02, help="Tillåten minskning av precision/recall")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="Tillåten minskning av bilder/s (andel)")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+    problems = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        problems = compare(result, baseline, args.max_drop, args.max_slowdown)
+        result["regressions"] = problems
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{'bild':<62} {'ms':>7} {'facit':>6} {'träffar':>8} {'prec':>6} {'recall':>6} {'MB':>6}")
+        for r in result["rows"]:
+            memory = f"{r['memory_peak_mb']:.0f}" if r["memory_peak_mb"] is not None else "-"
+            print(f"{r['image'][-62:]:<62} {r['ms']:>7.0f} {r['truth']:>6} {r['hits']:>8} "
+                  f"{r['precision']:>6.3f} {r['recall']:>6.3f} {memory:>6}")
+        latency = result["latency_ms"]
+        print(f"{result['images_per_sec']:.2f} bilder/s, latens p50 {latency['p50']:.0f} ms / p95 {latency['p95']:.0f} ms, "
+              f"max RSS {result['max_rss_mb']:.0f} MB")
+        print(f"precision {result['precision']:.3f}, recall {result['recall']:.3f}, F1 {result['f1']:.3f}")
+        print("dyraste stegen (p95 ms): " + ", ".join(
+            f"{stage} {values['p95']:.0f}"
+            for stage, values in sorted(result["stages_ms"].items(), key=lambda item: -item[1]["p95"])[:5]
+        ))
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
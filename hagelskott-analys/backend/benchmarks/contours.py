@@ -0,0 +1,133 @@
+"""
+Regressionstest + mätning för den vektoriserade träffextraktionen.
+
+"Före" = den tidigare loopen i PatternAnalyzer._filter_hits
+(contourArea/arcLength/moments + en Point per träff).
+"Efter" = contour_features + PatternAnalyzer._filter_candidates.
+
+Konturerna tas fram med analysens tröskling men utan brusreducering, vilket
+ger många fler (och mindre) blobbar än i appen => tätare mönster att mäta på.
+Skriptet avbryts med felkod om kandidaterna eller träffarna skiljer sig.
+
+    python -m benchmarks.contours --images uploads/admin_user --limit 10
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import List
+
+import cv2
+import numpy as np
+
+from app.services.pattern_analysis import PatternAnalyzer, contour_features
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+SENSITIVITIES = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+def _contours(image: np.ndarray, analyzer: PatternAnalyzer) -> List[np.ndarray]:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    binary = cv2.adaptiveThreshold(
+        gray, 255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
+        analyzer.adaptive_block_size, analyzer.adaptive_c
+    )
+    kernel = np.ones((3, 3), np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return list(contours)
+
+
+def legacy_filter_hits(analyzer: PatternAnalyzer, contours: List[np.ndarray]) -> np.ndarray:
+    """
+    Den tidigare implementationen (en kontur i taget).
+    """
+    valid = []
+    for cnt in contours:
+        area = float(cv2.contourArea(cnt))
+        if analyzer.min_shot_area <= area <= analyzer.max_shot_area:
+            perimeter = float(cv2.arcLength(cnt, True))
+            circ = 0.0
+            if perimeter > 0:
+                circ = float((4.0 * np.pi * area) / (perimeter ** 2))
+            if circ > analyzer.min_circularity:
+                M = cv2.moments(cnt)
+                if M["m00"] != 0:
+                    valid.append((int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])))
+    return np.array(valid, dtype=np.float32).reshape(-1, 2)
+
+
+def _legacy_features(contours: List[np.ndarray]) -> np.ndarray:
+    rows = []
+    for cnt in contours:
+        M = cv2.moments(cnt)
+        cx = int(M["m10"] / M["m00"]) if M["m00"] != 0 else 0
+        cy = int(M["m01"] / M["m00"]) if M["m00"] != 0 else 0
+        rows.append((cv2.contourArea(cnt), cv2.arcLength(cnt, True), cx, cy))
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="uploads/admin_user", help="Mapp med målbilder")
+    parser.add_argument("--limit", type=int, default=10, help="Max antal bilder")
+    parser.add_argument("--repeat", type=int, default=3, help="Antal körningar per bild")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    images = [img for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+    if not images:
+        raise SystemExit(f"Inga bilder hittades i {args.images}")
+
+    analyzer = PatternAnalyzer()
+    before_ms, after_ms, contour_counts, mismatches = [], [], [], []
+    for index, image in enumerate(images):
+        contours = _contours(image, analyzer)
+        contour_counts.append(len(contours))
+
+        if not np.array_equal(contour_features(contours), _legacy_features(contours)):
+            mismatches.append({"image": str(paths[index]), "stage": "features"})
+
+        for sensitivity in SENSITIVITIES:
+            analyzer._apply_sensitivity(sensitivity)
+            legacy = legacy_filter_hits(analyzer, contours)
+            vectorized = analyzer._filter_hits(contours)
+            if not np.array_equal(legacy, vectorized):
+                mismatches.append({"image": str(paths[index]), "sensitivity": sensitivity})
+
+        analyzer._apply_sensitivity(0.5)
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            legacy_filter_hits(analyzer, contours)
+            before_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            analyzer._filter_hits(contours)
+            after_ms.append((time.perf_counter() - start) * 1000)
+
+    result = {
+        "images": len(images),
+        "mean_contours": round(statistics.mean(contour_counts), 1),
+        "before_ms": round(statistics.mean(before_ms), 3),
+        "after_ms": round(statistics.mean(after_ms), 3),
+        "mismatches": mismatches,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{len(images)} bilder, i snitt {result['mean_contours']} konturer per bild")
+        print(f"före:  {result['before_ms']:.3f} ms")
+        print(f"efter: {result['after_ms']:.3f} ms")
+        print(f"avvikelser: {len(mismatches)}")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
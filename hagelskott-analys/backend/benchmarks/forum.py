@@ -0,0 +1,184 @@
+"""
+Latens för kategorilistan med antal vid cachemiss.
+
+Ett eget forum seedas i databasen --db på MONGODB_URL (kräver en MongoDB):
+FORUM_CATEGORIES som i /seed, --threads trådar och --posts inlägg fördelade
+slumpmässigt (Zipf-likt, några få kategorier/trådar får det mesta). Sedan
+mäts, --repeat gånger vardera:
+
+- n_plus_1: det tidigare sättet, count_documents + alla tråd-id:n + en
+  count_documents per kategori (3 rundturer per kategori)
+- aggregation: category_counts_pipeline, en aggregering
+- counters: get_cached_categories(force_refresh=True), som läser antalen
+  som forum_counters underhåller (efter en reconcile)
+
+Antalen från n_plus_1 och aggregation jämförs, och summan av
+huvudkategoriernas räknare mot totalen (räknarna gäller hela underträdet).
+Databasen tas bort efteråt om inte --keep anges (med --keep och samma --db
+hoppas seedningen över nästa gång).
+
+    python -m benchmarks.forum --posts 100000 --threads 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.api.forum_categories import FORUM_CATEGORIES, create_category_recursive, get_cached_categories
+from app.core.config import settings
+from app.db.mongodb import db
+from app.services.forum_counters import category_counts_pipeline, forum_counters
+
+BATCH_SIZE = 5000
+
+
+async def seed(database, threads: int, posts: int, seed_value: int) -> None:
+    rng = random.Random(seed_value)
+    for cat_data in FORUM_CATEGORIES:
+        await create_category_recursive(database, cat_data)
+    category_ids = [str(c["_id"]) async for c in database.categories.find({}, {"_id": 1})]
+
+    # Samma index som connect_db
+    await database.threads.create_index([("category_id", 1)])
+    await database.posts.create_index([("thread_id", 1)])
+
+    weights = [1.0 / (rank + 1) for rank in range(len(category_ids))]
+    start = datetime.utcnow() - timedelta(days=365)
+    thread_docs = [{
+        "title": f"Tråd {i}",
+        "content": "Första inlägget",
+        "author_id": str(i % 97),
+        "category_id": rng.choices(category_ids, weights)[0],
+        "created_at": start + timedelta(minutes=i),
+        "updated_at": start + timedelta(minutes=i),
+        "views": 0,
+    } for i in range(threads)]
+    thread_ids: List[str] = []
+    for lo in range(0, len(thread_docs), BATCH_SIZE):
+        res = await database.threads.insert_many(thread_docs[lo:lo + BATCH_SIZE])
+        thread_ids += [str(i) for i in res.inserted_ids]
+
+    thread_weights = [1.0 / (rank + 1) ** 0.5 for rank in range(len(thread_ids))]
+    for lo in range(0, posts, BATCH_SIZE):
+        count = min(BATCH_SIZE, posts - lo)
+        await database.posts.insert_many([{
+            "thread_id": thread_id,
+            "content": "Inlägg " * 20,
+            "author_id": str(rng.randrange(97)),
+            "created_at": start,
+            "updated_at": start,
+            "attachments": [],
+        } for thread_id in rng.choices(thread_ids, thread_weights, k=count)])
+
+
+async def n_plus_1(database) -> Dict[str, Dict[str, int]]:
+    counts = {}
+    async for category in database.categories.find():
+        category_id = str(category["_id"])
+        thread_count = await database.threads.count_documents({"category_id": category_id})
+        thread_ids = [str(t["_id"]) async for t in database.threads.find({"category_id": category_id})]
+        post_count = 0
+        if thread_ids:
+            post_count = await database.posts.count_documents({"thread_id": {"$in": thread_ids}})
+        counts[category_id] = {"thread_count": thread_count, "post_count": post_count}
+    return counts
+
+
+async def aggregation(database) -> Dict[str, Dict[str, int]]:
+    return {
+        str(c["_id"]): {"thread_count": c["thread_count"], "post_count": c["post_count"]}
+        async for c in database.categories.aggregate(category_counts_pipeline())
+    }
+
+
+async def counters(database) -> Dict[str, Dict[str, int]]:
+    categories = await get_cached_categories("sv", force_refresh=True)
+    return {
+        c["_id"]: {"thread_count": c["thread_count"], "post_count": c["post_count"], "root": not c.get("parent_id")}
+        for c in categories
+    }
+
+
+async def measure(fn, database, repeat: int) -> Dict[str, Any]:
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await fn(database)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {
+        "result": result,
+        "ms": {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "mean": round(statistics.mean(latencies), 1)},
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    client = AsyncIOMotorClient(args.mongodb_url or settings.MONGODB_URL)
+    database = client[args.db]
+    # get_cached_categories läser via singletonen => peka den på benchmark-databasen
+    db.client, db.database = client, database
+    try:
+        if await database.categories.estimated_document_count() == 0:
+            start = time.perf_counter()
+            await seed(database, args.threads, args.posts, args.seed)
+            print(f"Seedat på {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        await forum_counters.reconcile()
+        reconcile_ms = (time.perf_counter() - start) * 1000
+
+        modes = {"n_plus_1": n_plus_1, "aggregation": aggregation, "counters": counters}
+        runs = {name: await measure(fn, database, args.repeat) for name, fn in modes.items()}
+        threads = await database.threads.count_documents({})
+        posts = await database.posts.count_documents({})
+        roots = [c for c in runs["counters"]["result"].values() if c["root"]]
+        return {
+            "categories": await database.categories.count_documents({}),
+            "threads": threads,
+            "posts": posts,
+            "modes": {name: r["ms"] for name, r in runs.items()},
+            "reconcile_ms": round(reconcile_ms, 1),
+            "counts_match": runs["aggregation"]["result"] == runs["n_plus_1"]["result"],
+            "counters_match": (sum(c["thread_count"] for c in roots) == threads
+                               and sum(c["post_count"] for c in roots) == posts),
+        }
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongodb-url", default=None, help="Annars settings.MONGODB_URL")
+    parser.add_argument("--db", default="hagel_benchmark_forum", help="Databas för benchmarken (tas bort efteråt)")
+    parser.add_argument("--threads", type=int, default=5000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Behåll databasen (och seedningen)")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['categories']} kategorier, {result['threads']} trådar, {result['posts']} inlägg")
+    for name, ms in result["modes"].items():
+        print(f"{name:<12} p50 {ms['p50']:>8.1f} ms  p95 {ms['p95']:>8.1f} ms")
+    print(f"reconcile {result['reconcile_ms']:.1f} ms")
+    print("antalen stämmer" if result["counts_match"] else "ANTALEN SKILJER SIG")
+    print("räknarna stämmer" if result["counters_match"] else "RÄKNARNA SKILJER SIG")
+
+
+if __name__ == "__main__":
+    main()
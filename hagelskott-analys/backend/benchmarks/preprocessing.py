@@ -0,0 +1,152 @@
+"""
+Jämför förbehandlingen före/efter den gemensamma PreprocessingPipeline.
+
+"Före" = den gamla kedjan: ImageProcessor (kontrast via PIL, fastNlMeans,
+CLAHE, Gauss) + PatternAnalyzer:s egen gråskala + andra fastNlMeans.
+"Efter" = PreprocessingPipeline (samma filter, kontrast i OpenCV,
+återanvända buffertar; analysens brusreducering är steget "detect").
+
+Bilderna skalas som i appen ned till max 1600 px.
+
+    python -m benchmarks.preprocessing --images uploads/admin_user --limit 10
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from app.core.config import settings
+from app.services.pattern_analysis import PatternAnalyzer
+from app.services.preprocessing import PreprocessingPipeline
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def _timed(timings: Dict[str, float], name: str, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[name] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def legacy_preprocess(image: np.ndarray) -> Dict[str, float]:
+    """
+    Den tidigare kedjan, steg för steg, med tider i ms.
+    """
+    timings: Dict[str, float] = {}
+
+    def resize(img):
+        height, width = img.shape[:2]
+        if max(height, width) > 1600:
+            scale = 1600 / max(height, width)
+            return cv2.resize(img, (int(width * scale), int(height * scale)))
+        return img
+
+    image = _timed(timings, "resize", resize, image)
+    gray = _timed(timings, "grayscale", cv2.cvtColor, image, cv2.COLOR_BGR2GRAY)
+    enhanced = _timed(
+        timings, "contrast",
+        lambda g: np.array(ImageEnhance.Contrast(Image.fromarray(g)).enhance(1.5)), gray
+    )
+    denoised = _timed(
+        timings, "denoise", cv2.fastNlMeansDenoising, enhanced, None,
+        h=10, templateWindowSize=7, searchWindowSize=21
+    )
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    equalized = _timed(timings, "clahe", clahe.apply, denoised)
+    blurred = _timed(timings, "blur", cv2.GaussianBlur, equalized, settings.BLUR_KERNEL_SIZE, 0)
+    # PatternAnalyzer körde sedan en andra brusreducering på resultatet
+    _timed(timings, "analyzer_denoise", cv2.fastNlMeansDenoising, blurred, h=10)
+    return timings
+
+
+def pipeline_preprocess(pipeline: PreprocessingPipeline, image: np.ndarray) -> Dict[str, float]:
+    frame = pipeline.run(image)
+    timings = dict(frame.timings)
+    timings["analyzer_denoise"] = timings.pop("detect", 0.0)
+    return timings
+
+
+def _summarize(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    stages = runs[0].keys()
+    summary = {stage: round(statistics.mean(r[stage] for r in runs), 2) for stage in stages}
+    summary["total"] = round(statistics.mean(sum(r.values()) for r in runs), 2)
+    return summary
+
+
+def _hit_counts(images: List[np.ndarray]) -> Dict[str, List[int]]:
+    """
+    Antal träffar med gammal resp. ny förbehandling (ska vara desamma).
+    "Före" = den gamla kedjan (PIL-kontrast) + analysens egen gråskala och
+    brusreducering.
+    """
+    analyzer = PatternAnalyzer()
+    pipeline = PreprocessingPipeline()
+    before, after = [], []
+    for image in images:
+        height, width = image.shape[:2]
+        resized = image
+        if max(height, width) > pipeline.max_dimension:
+            scale = pipeline.max_dimension / max(height, width)
+            resized = cv2.resize(image, (int(width * scale), int(height * scale)))
+        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+        enhanced = np.array(ImageEnhance.Contrast(Image.fromarray(gray)).enhance(1.5))
+        denoised = cv2.fastNlMeansDenoising(enhanced, None, h=10, templateWindowSize=7, searchWindowSize=21)
+        equalized = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(denoised)
+        legacy = cv2.GaussianBlur(equalized, settings.BLUR_KERNEL_SIZE, 0)
+        before.append(analyzer.analyze_shot_pattern(legacy)["hit_count"])
+        after.append(analyzer.analyze_shot_pattern(pipeline.run(image))["hit_count"])
+    return {"before": before, "after": after}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="uploads/admin_user", help="Mapp med målbilder")
+    parser.add_argument("--limit", type=int, default=10, help="Max antal bilder")
+    parser.add_argument("--repeat", type=int, default=1, help="Antal körningar per bild")
+    parser.add_argument("--hits", action="store_true", help="Jämför även antal detekterade träffar")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    images = [img for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+    if not images:
+        raise SystemExit(f"Inga bilder hittades i {args.images}")
+
+    pipeline = PreprocessingPipeline()
+    before, after = [], []
+    for image in images:
+        for _ in range(args.repeat):
+            before.append(legacy_preprocess(image))
+            after.append(pipeline_preprocess(pipeline, image))
+
+    result = {
+        "images": len(images),
+        "repeat": args.repeat,
+        "before_ms": _summarize(before),
+        "after_ms": _summarize(after),
+    }
+    if args.hits:
+        result["hit_counts"] = _hit_counts(images)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{len(images)} bilder x {args.repeat} körningar (medel ms per bild)")
+    print(f"{'steg':<18}{'före':>10}{'efter':>10}")
+    for stage in result["before_ms"]:
+        print(f"{stage:<18}{result['before_ms'][stage]:>10.2f}{result['after_ms'].get(stage, 0.0):>10.2f}")
+    if args.hits:
+        print(f"träffar före:  {result['hit_counts']['before']}")
+        print(f"träffar efter: {result['hit_counts']['after']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Mätning av ringdetekteringen: den tidigare enstegssökningen (HoughCircles
+i full upplösning, radie 20..2000 px, största cirkeln vinner) mot
+tvåstegssökningen i PatternAnalyzer._detect_ring.
+
+Bilderna går först genom förbehandlingen (som i appen). Ingen facit finns,
+så skriptet visar bara båda resultaten; --draw sparar en bild per indata
+med den gamla (blå) och nya (röda) ringen för okulär kontroll.
+
+    python -m benchmarks.ring --images uploads/admin_user --limit 8 --draw /tmp/ringar
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict
+
+import cv2
+import numpy as np
+
+from app.services.pattern_analysis import PatternAnalyzer
+from app.services.preprocessing import PreprocessingPipeline
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def legacy_detect_ring(analyzer: PatternAnalyzer, gray_image: np.ndarray) -> Dict[str, float]:
+    """
+    Den tidigare implementationen.
+    """
+    blurred = cv2.GaussianBlur(gray_image, (9, 9), 2)
+    circles = cv2.HoughCircles(
+        blurred,
+        cv2.HOUGH_GRADIENT,
+        dp=analyzer.hough_dp,
+        minDist=analyzer.hough_min_dist,
+        param1=analyzer.hough_param1,
+        param2=analyzer.hough_param2,
+        minRadius=analyzer.min_ring_radius_px,
+        maxRadius=analyzer.max_ring_radius_px
+    )
+    if circles is not None and len(circles) > 0:
+        circles = np.round(circles[0, :]).astype(int)
+        cx, cy, r = sorted(circles, key=lambda c: c[2], reverse=True)[0]
+        return {"centerX": float(cx), "centerY": float(cy), "radius_px": float(r), "confidence": 0.9}
+    return {}
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _circle(ring: Dict[str, float]):
+    if not ring:
+        return None
+    return [int(ring["centerX"]), int(ring["centerY"]), int(ring["radius_px"])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="uploads/admin_user", help="Mapp med målbilder")
+    parser.add_argument("--limit", type=int, default=5, help="Max antal bilder")
+    parser.add_argument("--skip-legacy", action="store_true", help="Kör bara tvåstegssökningen")
+    parser.add_argument("--draw", default=None, help="Mapp för bilder med ritade ringar")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    if not paths:
+        raise SystemExit(f"Inga bilder i {args.images}")
+    if args.draw:
+        Path(args.draw).mkdir(parents=True, exist_ok=True)
+
+    analyzer = PatternAnalyzer()
+    pipeline = PreprocessingPipeline()
+    rows = []
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        gray = pipeline.run(image).image
+
+        new, new_ms = _timed(analyzer._detect_ring, gray)
+        old, old_ms = ({}, None) if args.skip_legacy else _timed(legacy_detect_ring, analyzer, gray)
+        rows.append({
+            "image": path.name,
+            "size": [gray.shape[1], gray.shape[0]],
+            "legacy_ms": round(old_ms, 1) if old_ms is not None else None,
+            "two_stage_ms": round(new_ms, 1),
+            "legacy": _circle(old),
+            "two_stage": _circle(new),
+            "confidence": new.get("confidence"),
+        })
+
+        if args.draw:
+            canvas = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+            for ring, color in ((old, (255, 0, 0)), (new, (0, 0, 255))):
+                if ring:
+                    center = (int(ring["centerX"]), int(ring["centerY"]))
+                    cv2.circle(canvas, center, int(ring["radius_px"]), color, max(2, gray.shape[1] // 300))
+            cv2.imwrite(str(Path(args.draw) / f"{path.stem}.jpg"), canvas)
+
+    result = {"images": len(rows), "rows": rows}
+    result["two_stage_ms"] = round(statistics.mean(r["two_stage_ms"] for r in rows), 1)
+    if not args.skip_legacy:
+        result["legacy_ms"] = round(statistics.mean(r["legacy_ms"] for r in rows), 1)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{'bild':<40} {'storlek':>11} {'före ms':>8} {'efter ms':>8}  {'före (x, y, r)':<20} {'efter (x, y, r)':<20} conf")
+    for r in rows:
+        size = f"{r['size'][0]}x{r['size'][1]}"
+        old_ms = f"{r['legacy_ms']:.0f}" if r["legacy_ms"] is not None else "-"
+        print(f"{r['image'][-40:]:<40} {size:>11} {old_ms:>8} {r['two_stage_ms']:>8.0f}  "
+              f"{str(r['legacy']):<20} {str(r['two_stage']):<20} {r['confidence'] if r['confidence'] is not None else '-'}")
+    summary = f"snitt efter: {result['two_stage_ms']:.0f} ms"
+    if "legacy_ms" in result:
+        summary = f"snitt före: {result['legacy_ms']:.0f} ms, " + summary
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
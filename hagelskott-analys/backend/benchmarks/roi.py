@@ -0,0 +1,188 @@
+"""
+Mätning av ROI-läget (grov lokalisering => beskärning => full detektering).
+
+Varje bild körs genom förbehandling + extract_candidates utan och med
+ROI-steget, dels som den är, dels utlagd på en bredare, mörkare bakgrund
+(--pad, dvs. ett mobilfoto med stora marginaler).
+
+Referens = träffarna (sensitivity 0.5) utan ROI på den ursprungliga bilden.
+Alla träffar räknas om till originalbildens pixlar; recall/precision =
+andel träffar som finns i både referensen och läget inom --tolerance px.
+Bilder som inte skalas om ska ge recall = precision = 1 även med ROI.
+
+    python -m benchmarks.roi --images uploads/admin_user --limit 5 --no-ring
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.pattern_analysis import PatternAnalyzer
+from app.services.preprocessing import PreprocessingPipeline
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def pad_image(image: np.ndarray, pad: float, seed: int = 0) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Lägger bilden mitt på en mörk, brusig bakgrund (pad * bildens storlek per sida).
+    Returnerar (ny bild, (x, y) för originalet i den).
+    """
+    height, width = image.shape[:2]
+    py, px = int(height * pad), int(width * pad)
+    rng = np.random.default_rng(seed)
+    canvas = rng.normal(70, 12, (height + 2 * py, width + 2 * px, 3))
+    canvas = cv2.GaussianBlur(np.clip(canvas, 0, 255).astype(np.uint8), (5, 5), 0)
+    canvas[py:py + height, px:px + width] = image
+    return canvas, (px, py)
+
+
+def match_hits(reference: np.ndarray, other: np.ndarray, tolerance: float) -> int:
+    """
+    Antal träffar i reference med en motsvarighet i other (närmast, en-till-en).
+    """
+    if len(reference) == 0 or len(other) == 0:
+        return 0
+    dists = np.linalg.norm(reference[:, None, :] - other[None, :, :], axis=2)
+    matched = 0
+    used = np.zeros(len(other), dtype=bool)
+    for i in np.argsort(dists.min(axis=1)):
+        for j in np.argsort(dists[i]):
+            if dists[i, j] > tolerance:
+                break
+            if not used[j]:
+                used[j] = True
+                matched += 1
+                break
+    return matched
+
+
+def run_mode(pipeline: PreprocessingPipeline, analyzer: PatternAnalyzer,
+             image: np.ndarray, repeat: int) -> Dict[str, Any]:
+    """
+    Snabbaste av repeat körningar; träffarna i bildens egna pixelkoordinater.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame = pipeline.run(image)
+        candidates = analyzer.extract_candidates(frame)
+        best = min(best, (time.perf_counter() - start) * 1000)
+
+    analyzer._apply_sensitivity(0.5)
+    hits = analyzer._filter_candidates(candidates["features"]).astype(np.float64) / frame.scale
+    height, width = image.shape[:2]
+    return {
+        "ms": best,
+        "hits": hits,
+        "area": frame.image.shape[0] * frame.image.shape[1] / (width * height * frame.scale ** 2),
+        "scale": frame.scale,
+    }
+
+
+def _parity(reference: np.ndarray, hits: np.ndarray, tolerance: float) -> Tuple[float, float]:
+    matched = match_hits(reference, hits, tolerance)
+    recall = matched / len(reference) if len(reference) else 1.0
+    precision = matched / len(hits) if len(hits) else 1.0
+    return round(recall, 4), round(precision, 4)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="uploads/admin_user", help="Mapp med målbilder")
+    parser.add_argument("--limit", type=int, default=5, help="Max antal bilder")
+    parser.add_argument("--min-dimension", type=int, default=500, help="Bara bilder med längsta sida >= detta")
+    parser.add_argument("--pad", type=float, default=0.5, help="Bakgrund per sida i de utlagda varianterna (0 => inga)")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="Max avstånd (px i originalet) för samma träff")
+    parser.add_argument("--repeat", type=int, default=1, help="Antal körningar per läge (snabbaste räknas)")
+    parser.add_argument("--no-ring", action="store_true", help="Hoppa över ringdetekteringen i båda lägena")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    images: List[Tuple[str, np.ndarray]] = []
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is not None and max(image.shape[:2]) >= args.min_dimension:
+            images.append((path.name, image))
+        if len(images) >= args.limit:
+            break
+    if not images:
+        raise SystemExit(f"Inga bilder >= {args.min_dimension} px i {args.images}")
+
+    analyzer = PatternAnalyzer()
+    if args.no_ring:
+        analyzer._detect_ring = lambda gray: {}
+    full = PreprocessingPipeline(roi_enabled=False)
+    roi = PreprocessingPipeline(roi_enabled=True)
+
+    rows = []
+    for name, image in images:
+        variants = [(name, image, (0, 0))]
+        if args.pad > 0:
+            padded, origin = pad_image(image, args.pad)
+            variants.append((f"{name} +pad", padded, origin))
+
+        reference = None
+        for label, variant, (ox, oy) in variants:
+            full_run = run_mode(full, analyzer, variant, args.repeat)
+            roi_run = run_mode(roi, analyzer, variant, args.repeat)
+            for run in (full_run, roi_run):
+                run["hits"] -= (ox, oy)
+            if reference is None:
+                reference = full_run["hits"]
+
+            full_recall, full_precision = _parity(reference, full_run["hits"], args.tolerance)
+            roi_recall, roi_precision = _parity(reference, roi_run["hits"], args.tolerance)
+            rows.append({
+                "image": label,
+                "size": [variant.shape[1], variant.shape[0]],
+                "roi_area": round(roi_run["area"], 3),
+                "full_ms": round(full_run["ms"], 1),
+                "roi_ms": round(roi_run["ms"], 1),
+                "speedup": round(full_run["ms"] / roi_run["ms"], 2),
+                "reference_hits": len(reference),
+                "full_hits": len(full_run["hits"]),
+                "roi_hits": len(roi_run["hits"]),
+                "full_recall": full_recall,
+                "full_precision": full_precision,
+                "roi_recall": roi_recall,
+                "roi_precision": roi_precision,
+            })
+
+    result = {
+        "images": len(images),
+        "total_full_ms": round(sum(r["full_ms"] for r in rows), 1),
+        "total_roi_ms": round(sum(r["roi_ms"] for r in rows), 1),
+        "full_recall": round(statistics.mean(r["full_recall"] for r in rows), 4),
+        "roi_recall": round(statistics.mean(r["roi_recall"] for r in rows), 4),
+        "roi_precision": round(statistics.mean(r["roi_precision"] for r in rows), 4),
+        "rows": rows,
+    }
+    result["speedup"] = round(result["total_full_ms"] / result["total_roi_ms"], 2)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{'bild':<40} {'storlek':>11} {'yta':>5} {'full ms':>8} {'roi ms':>8} {'x':>5} "
+          f"{'träffar ref/full/roi':>20} {'recall full/roi':>16} {'prec roi':>8}")
+    for r in rows:
+        size = f"{r['size'][0]}x{r['size'][1]}"
+        hits = f"{r['reference_hits']}/{r['full_hits']}/{r['roi_hits']}"
+        print(
+            f"{r['image'][-40:]:<40} {size:>11} {r['roi_area']:>5.2f} {r['full_ms']:>8.0f} {r['roi_ms']:>8.0f} "
+            f"{r['speedup']:>5.2f} {hits:>20} {r['full_recall']:>7.3f}/{r['roi_recall']:<8.3f} {r['roi_precision']:>8.3f}"
+        )
+    print(f"totalt: {result['total_full_ms']:.0f} ms => {result['total_roi_ms']:.0f} ms ({result['speedup']:.2f}x)")
+    print(f"recall mot referensen: utan ROI {result['full_recall']:.3f}, med ROI {result['roi_recall']:.3f} "
+          f"(precision {result['roi_precision']:.3f})")
+
+
+if __name__ == "__main__":
+    main()
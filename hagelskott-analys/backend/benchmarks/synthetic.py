@@ -0,0 +1,196 @@
+"""
+Syntetiska mönsterark med känt facit.
+
+render_target(spec) ritar ett ark (papper med struktur, valfri ring, mörka
+pellethål) och returnerar bilden + hålens centrum i pixlar. Hålen läggs ut
+normalfördelat runt en mittpunkt (spread = standardavvikelse som andel av
+arkets bredd) och minst min_gap px isär, så att varje hål i facit är ett
+eget objekt; får inte alla plats blir facit kortare än pellets.
+
+Storlekarna utgår från ett ark på sheet_mm (75 cm) och hål på hole_mm
+(ca 2,5 mm, hagel #7): samma spec i högre upplösning ger större hål.
+Efter ritningen läggs oskärpa (blur, sigma i px) och sensorbrus (noise,
+sigma i gråskalenivåer) på, i den ordningen.
+
+Skriptet sparar en korpus (bilder + facit.json) för de andra mätningarna:
+
+    python -m benchmarks.synthetic --output /tmp/syntet --resolutions 1200 2400
+"""
+import argparse
+import json
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+
+@dataclass(frozen=True)
+class TargetSpec:
+    """
+    width/height: bildens storlek i px (arket fyller bilden)
+    pellets:      antal hål som ska ritas
+    spread:       standardavvikelse för hålens läge, andel av bredden
+    noise:        sensorbrus, sigma i gråskalenivåer
+    blur:         Gauss-oskärpa, sigma i px (0 => ingen)
+    texture:      pappersstruktur, amplitud i gråskalenivåer
+    ring:         rita en tryckt ring (radie 0.4 * bredden) runt mitten
+    """
+    width: int = 1600
+    height: int = 1600
+    pellets: int = 150
+    spread: float = 0.16
+    noise: float = 4.0
+    blur: float = 0.8
+    texture: float = 10.0
+    ring: bool = False
+    sheet_mm: float = 750.0
+    hole_mm: float = 2.5
+    min_gap: float = 2.0
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        ring = "_ring" if self.ring else ""
+        return (f"syn_{self.width}x{self.height}_n{self.pellets}_s{self.spread:g}"
+                f"_noise{self.noise:g}_blur{self.blur:g}_tex{self.texture:g}{ring}_seed{self.seed}")
+
+    @property
+    def hole_radius_px(self) -> float:
+        return self.hole_mm / 2 * self.width / self.sheet_mm
+
+
+def _paper(rng: np.random.Generator, height: int, width: int, amplitude: float) -> np.ndarray:
+    """
+    Ljust papper: grov ojämnhet (belysning) + fin fiberstruktur.
+    """
+    paper = np.full((height, width), 228.0, dtype=np.float32)
+    if amplitude <= 0:
+        return paper
+    for cells, weight in ((4, 0.6), (32, 0.3), (max(8, width // 6), 0.1)):
+        coarse = rng.normal(0.0, 1.0, (max(2, cells * height // width), cells)).astype(np.float32)
+        paper += amplitude * weight * cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    return paper
+
+
+def _place_pellets(rng: np.random.Generator, spec: TargetSpec, radius: float) -> np.ndarray:
+    """
+    Hålens centrum (N, 2) i px: normalfördelat runt en slumpad mittpunkt nära
+    bildens mitt, inom arket och minst 2 * radius + min_gap från varandra.
+    """
+    center = np.array([spec.width, spec.height], dtype=np.float64) * (0.5 + rng.uniform(-0.05, 0.05, 2))
+    sigma = spec.spread * spec.width
+    margin = radius + 2
+    min_dist_sq = (2 * radius + spec.min_gap) ** 2
+
+    cell = 2 * radius + spec.min_gap
+    grid = {}
+    placed: List[Tuple[float, float]] = []
+    for _ in range(spec.pellets * 20):
+        if len(placed) >= spec.pellets:
+            break
+        x, y = rng.normal(center, sigma)
+        if not (margin <= x < spec.width - margin and margin <= y < spec.height - margin):
+            continue
+        cx, cy = int(x // cell), int(y // cell)
+        neighbours = (
+            grid.get((gx, gy), ())
+            for gx in (cx - 1, cx, cx + 1) for gy in (cy - 1, cy, cy + 1)
+        )
+        if any((x - px) ** 2 + (y - py) ** 2 < min_dist_sq for cell_points in neighbours for px, py in cell_points):
+            continue
+        grid.setdefault((cx, cy), []).append((x, y))
+        placed.append((x, y))
+    return np.asarray(placed, dtype=np.float64).reshape(-1, 2)
+
+
+def render_target(spec: TargetSpec) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (BGR-bild, facit (N, 2) float64 med hålens centrum i px).
+    """
+    rng = np.random.default_rng(spec.seed)
+    canvas = _paper(rng, spec.height, spec.width, spec.texture)
+
+    if spec.ring:
+        # Tryckt ring: mörkare än papperet men ljusare än hålen
+        thickness = max(2, int(round(spec.width / 250)))
+        center = (spec.width // 2, spec.height // 2)
+        cv2.circle(canvas, center, int(0.4 * spec.width), 150.0, thickness, cv2.LINE_AA)
+
+    radius = spec.hole_radius_px
+    truth = _place_pellets(rng, spec, radius)
+
+    # Hålen: mörk bakgrund genom papperet, lätt ovala och olika stora.
+    # Ritas i 16x upplösning (shift=4) för mjuka kanter även vid små radier.
+    shift = 4
+    for (x, y), scale, aspect, angle, depth in zip(
+        truth,
+        rng.uniform(0.85, 1.15, len(truth)),
+        rng.uniform(0.8, 1.0, len(truth)),
+        rng.uniform(0, 180, len(truth)),
+        rng.uniform(35, 75, len(truth)),
+    ):
+        axes = (int(radius * scale * (1 << shift)), int(radius * scale * aspect * (1 << shift)))
+        cv2.ellipse(
+            canvas, (int(x * (1 << shift)), int(y * (1 << shift))), axes, float(angle),
+            0, 360, float(depth), -1, cv2.LINE_AA, shift
+        )
+
+    if spec.blur > 0:
+        canvas = cv2.GaussianBlur(canvas, (0, 0), spec.blur)
+    if spec.noise > 0:
+        canvas += rng.normal(0.0, spec.noise, canvas.shape).astype(np.float32)
+
+    gray = np.clip(canvas, 0, 255).astype(np.uint8)
+    # Lätt gulton på papperet => äkta färgbild genom gråskalesteget
+    image = cv2.merge([
+        cv2.convertScaleAbs(gray, alpha=0.92),
+        cv2.convertScaleAbs(gray, alpha=0.98),
+        gray,
+    ])
+    return image, truth
+
+
+def default_corpus(resolutions: List[int], seeds: int = 1) -> List[TargetSpec]:
+    """
+    Standardkorpusen: per upplösning ett glest, ett normalt och ett tätt
+    mönster, ett suddigt/brusigt foto och ett ark med tryckt ring.
+    """
+    variants = [
+        TargetSpec(pellets=60, spread=0.2),
+        TargetSpec(pellets=150, spread=0.16),
+        TargetSpec(pellets=300, spread=0.12),
+        TargetSpec(pellets=150, spread=0.16, noise=10.0, blur=1.6, texture=18.0),
+        TargetSpec(pellets=150, spread=0.14, ring=True),
+    ]
+    return [
+        replace(variant, width=resolution, height=resolution, seed=seed)
+        for resolution in resolutions
+        for variant in variants
+        for seed in range(seeds)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="Mapp för bilder + facit.json")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[1200, 2400], help="Bildbredder (px)")
+    parser.add_argument("--seeds", type=int, default=1, help="Antal slumpfrön per variant")
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    manifest = []
+    for spec in default_corpus(args.resolutions, args.seeds):
+        image, truth = render_target(spec)
+        filename = f"{spec.name}.png"
+        cv2.imwrite(str(output / filename), image)
+        manifest.append({"image": filename, "spec": asdict(spec), "truth": np.round(truth, 2).tolist()})
+
+    (output / "facit.json").write_text(json.dumps(manifest, indent=1))
+    print(f"{len(manifest)} bilder => {output}")
+
+
+if __name__ == "__main__":
+    main()
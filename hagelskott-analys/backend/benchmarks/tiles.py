@@ -0,0 +1,123 @@
+"""
+Mätning + paritetskontroll för rutläget (ANALYSIS_TILED_MODE).
+
+Varje bild skalas upp --upscale gånger (som en högupplöst skanning) och
+körs genom förbehandling + extract_candidates i full upplösning, dels i ett
+svep, dels per ruta i trådpoolen. Kandidaterna och träffarna (sensitivity
+0.5) ska bli desamma; undantaget är långa, smala konturer som inte ryms i
+överlappet (de kan aldrig bli träffar). Som jämförelse visas även antalet
+träffar med den vanliga nedskalningen till 1600 px.
+
+Tiderna gäller brusreduceringen och detekteringen (tröskling, morfologi,
+konturer) var för sig; trådarna = ANALYSIS_TILE_WORKERS (0 => kärnor / ANALYSIS_WORKERS).
+
+    python -m benchmarks.tiles --images uploads/admin_user --limit 3 --upscale 3
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import cv2
+import numpy as np
+
+from app.services.pattern_analysis import PatternAnalyzer
+from app.services.preprocessing import PreprocessingPipeline
+from app.services.tiling import tile_workers
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def run(pipeline: PreprocessingPipeline, analyzer: PatternAnalyzer, image: np.ndarray) -> Dict[str, Any]:
+    frame = pipeline.run(image)
+    start = time.perf_counter()
+    candidates = analyzer.extract_candidates(frame)
+    detect_ms = (time.perf_counter() - start) * 1000
+
+    analyzer._apply_sensitivity(0.5)
+    return {
+        "features": candidates["features"],
+        "hits": analyzer._filter_candidates(candidates["features"]),
+        "denoise_ms": frame.timings["denoise"],
+        "detect_ms": detect_ms,
+    }
+
+
+def _rows(values: np.ndarray) -> set:
+    return {tuple(r) for r in values.tolist()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="uploads/admin_user", help="Mapp med målbilder")
+    parser.add_argument("--limit", type=int, default=3, help="Max antal bilder")
+    parser.add_argument("--upscale", type=float, default=3.0, help="Uppskalning av varje bild")
+    parser.add_argument("--tile-size", type=int, default=None, help="Rutstorlek (standard ANALYSIS_TILE_SIZE)")
+    parser.add_argument("--json", action="store_true", help="Skriv resultatet som JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:args.limit]
+    if not paths:
+        raise SystemExit(f"Inga bilder i {args.images}")
+
+    single = PatternAnalyzer()
+    single.tiled = False
+    tiled = PatternAnalyzer()
+    tiled.tiled = True
+    if args.tile_size:
+        tiled.tile_size = args.tile_size
+    for analyzer in (single, tiled):
+        # Ringdetekteringen är densamma i båda lägena och dominerar annars tiden
+        analyzer._detect_ring = lambda gray: {}
+
+    full_single = PreprocessingPipeline(tiled=False, max_dimension=1 << 30)
+    full_tiled = PreprocessingPipeline(tiled=True, max_dimension=1 << 30, tile_size=tiled.tile_size)
+    downscaled = PreprocessingPipeline(tiled=False, max_dimension=1600)
+
+    rows = []
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        image = cv2.resize(image, None, fx=args.upscale, fy=args.upscale, interpolation=cv2.INTER_CUBIC)
+
+        one = run(full_single, single, image)
+        many = run(full_tiled, tiled, image)
+        small = run(downscaled, single, image)
+
+        rows.append({
+            "image": path.name,
+            "size": [image.shape[1], image.shape[0]],
+            "candidates": [len(one["features"]), len(many["features"])],
+            "candidates_only_single": len(_rows(one["features"]) - _rows(many["features"])),
+            "candidates_only_tiled": len(_rows(many["features"]) - _rows(one["features"])),
+            "hits": [len(one["hits"]), len(many["hits"])],
+            "hits_equal": _rows(one["hits"]) == _rows(many["hits"]),
+            "hits_downscaled": len(small["hits"]),
+            "denoise_ms": [round(one["denoise_ms"], 1), round(many["denoise_ms"], 1)],
+            "detect_ms": [round(one["detect_ms"], 1), round(many["detect_ms"], 1)],
+        })
+
+    result = {"workers": tile_workers(), "tile_size": tiled.tile_size, "rows": rows}
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"rutor {tiled.tile_size} px, {result['workers']} trådar")
+    print(f"{'bild':<40} {'storlek':>11} {'kand. svep/rutor':>17} {'träffar':>11} {'1600px':>6} "
+          f"{'brus ms':>15} {'detekt. ms':>13}")
+    for r in rows:
+        size = f"{r['size'][0]}x{r['size'][1]}"
+        cand = f"{r['candidates'][0]}/{r['candidates'][1]}"
+        hits = f"{r['hits'][0]}/{r['hits'][1]}" + ("" if r["hits_equal"] else "!")
+        print(
+            f"{r['image'][-40:]:<40} {size:>11} {cand:>17} {hits:>11} {r['hits_downscaled']:>6} "
+            f"{r['denoise_ms'][0]:>7.0f}/{r['denoise_ms'][1]:<7.0f} {r['detect_ms'][0]:>6.0f}/{r['detect_ms'][1]:<6.0f}"
+        )
+    if not all(r["hits_equal"] for r in rows):
+        raise SystemExit("Träffarna skiljer sig mellan ett svep och rutor")
+
+
+if __name__ == "__main__":
+    main()
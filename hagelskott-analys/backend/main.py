@@ -61,12 +61,18 @@ from fastapi.staticfiles import StaticFiles
 # men hade också "from app.api.routes import settings" i ditt exempel.
 # Vi använder "app.core.config" för Pydantic Settings:
 from app.core.config import settings
+from app.core.profiling import profile_request, profiling_requested
 
 from jose import JWTError
 
 from app.db.mongodb import db            # MongoDB wrapper
 from app.core.security import get_password_hash
 from app.services.analysis_service import analysis_service
+from app.services.analysis_executor import analysis_executor
+from app.services.analysis_jobs import analysis_job_queue
+from app.services.timing import analysis_timing_stats
+from app.services.user_statistics import user_statistics, user_statistics_job
+from app.services.forum_counters import forum_counters_job
 from app.services.pattern_analysis import PatternAnalyzer
 from app.core.targets import get_target, get_available_targets
 
@@ -83,6 +89,7 @@ from app.api.routes import analysis, auth, users
 from app.api.routes.auth import get_current_active_user, User, create_test_users
 from app.api.routes import quiz as quiz_router
 from app.api.routes import admin
+from app.api.routes.admin import get_current_admin
 from app.api.websocket import websocket_endpoint
 from app.api.users import router as users_router
 
@@ -129,6 +136,18 @@ async def lifespan(app: FastAPI):
         await seed_forum_categories_internal()
         logger.info("Forum categories seeded")
 
+        # 4) Starta processpoolen för bildanalys
+        analysis_executor.start()
+
+        # 5) Starta bakgrundsarbetarna för analysjobb
+        analysis_job_queue.start()
+
+        # 6) Periodisk omräkning av användarstatistiken
+        user_statistics_job.start()
+
+        # 7) Forumantal: omräkning efter seedningen och sedan periodiskt
+        forum_counters_job.start()
+
     except Exception as e:
         logger.error(f"Startup error: {str(e)}")
         raise
@@ -138,6 +157,10 @@ async def lifespan(app: FastAPI):
 
     # Nedstängning
     try:
+        await analysis_job_queue.stop()
+        await user_statistics_job.stop()
+        await forum_counters_job.stop()
+        analysis_executor.shutdown()
         await db.close_db()
         logger.info("Database connection closed")
     except Exception as e:
@@ -300,6 +323,16 @@ async def logger_middleware(request: Request, call_next):
     return response
 
 
+#################################################################
+# Profilering av enskild request (PROFILING_HEADER, se app.core.profiling)
+#################################################################
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    if not profiling_requested(request):
+        return await call_next(request)
+    return await profile_request(request, call_next)
+
+
 #################################################################
 # Startup-event: seed forumkategorier, admin-user, indexes
 #################################################################
@@ -599,15 +632,17 @@ async def upload_profile_image(
 #################################################################
 # Analysera hagelsvärms-bild (exempel)
 #################################################################
-@app.post("/api/analyze")
+@app.post("/api/analyze", status_code=status.HTTP_202_ACCEPTED)
 async def analyze_shot_pattern(
     file: UploadFile = File(...),
     metadata: str = Form(...),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Exempel: tar emot en bild + metadata,
-    anropar analysis_service -> analysera.
+    Tar emot en bild + metadata och lägger analysen i jobbkön.
+    Svarar direkt med job_id; resultatet hämtas via
+    GET /api/analyze/jobs/{job_id} eller pushas över websocket
+    (meddelandetyp "analysis_job").
     """
     try:
         metadata_dict = json.loads(metadata)
@@ -617,24 +652,66 @@ async def analyze_shot_pattern(
                 detail=f"Fel filtyp. Endast {', '.join(settings.ALLOWED_IMAGE_TYPES)} är tillåtna."
             )
 
-        result = await analysis_service.analyze_shot_image(
+        job = await analysis_job_queue.enqueue_upload(
             file=file,
             user_id=current_user.username,
             metadata=metadata_dict
         )
+        return job
 
-        return {
-            "pattern_id": str(result["_id"]),
-            "results": result["analysis_results"],
-            "metadata": result["metadata"],
-            "image_url": result.get("image_url")
-        }
-
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/analyze/queue")
+async def get_analysis_queue_stats(current_user: User = Depends(get_current_active_user)):
+    """
+    Ködjup och latens för analysjobben.
+    """
+    try:
+        return await analysis_job_queue.queue_stats()
+    except Exception as e:
+        logger.error(f"Error fetching queue stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Kunde inte hämta köstatus")
+
+
+@app.get("/api/analyze/statistics")
+async def get_my_analysis_statistics(current_user: User = Depends(get_current_active_user)):
+    """
+    Användarens förberäknade analysstatistik (ett dokument i 'user_statistics').
+    """
+    try:
+        return await user_statistics.get(current_user.username)
+    except Exception as e:
+        logger.error(f"Error fetching analysis statistics: {str(e)}")
+        raise HTTPException(status_code=500, detail="Kunde inte hämta statistik")
+
+
+@app.post("/api/analyze/statistics/recompute")
+async def recompute_analysis_statistics(current_user: User = Depends(get_current_admin)):
+    """
+    Räknar om all användarstatistik ur 'shots' direkt (annars periodiskt).
+    """
+    try:
+        reset = await user_statistics.recompute()
+        return {"message": "Statistiken omräknad.", "reset": reset}
+    except Exception as e:
+        logger.error(f"Error recomputing analysis statistics: {str(e)}")
+        raise HTTPException(status_code=500, detail="Kunde inte räkna om statistiken")
+
+
+@app.get("/api/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """
+    Status för ett analysjobb (polling). När status är "completed" finns
+    shot_id => resultatet hämtas via /api/analysis/results/{shot_id}.
+    """
+    return await analysis_job_queue.get_job(job_id, current_user.username)
+
+
 #################################################################
 # Visualization-exempel
 #################################################################
@@ -904,6 +981,21 @@ async def health_check():
     logger.info(f"Health check response: {response}")
     return response
 
+
+@app.get("/api/health/analysis-timings", tags=["Health"])
+async def analysis_timings_health(
+    reset: bool = Query(False, description="Nollställ fönstret efter läsningen"),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    p50/p95 + histogram per analyssteg (ms) för de senaste analyserna i
+    den här processen (ANALYSIS_TIMINGS_WINDOW). Endast admin.
+    """
+    summary = analysis_timing_stats.summary()
+    if reset:
+        analysis_timing_stats.reset()
+    return summary
+
 # Lägg till en test-endpoint för att verifiera CORS
 @app.get("/api/test-cors")
 async def test_cors():
@@ -0,0 +1,70 @@
+# migrate_pellet_storage.py
+"""
+Skriver om äldre shots (analysis_results utan schema_version 2) till det
+kolumnvisa pelletformatet, se app/services/pellet_storage.py.
+
+    python -m scripts.migrate_pellet_storage --dry-run
+    python -m scripts.migrate_pellet_storage --batch-size 200
+"""
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from app.db.mongodb import db
+from app.services.pellet_storage import SCHEMA_VERSION, compact_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main(dry_run: bool, batch_size: int):
+    database = await db.get_database()
+    shots = database["shots"]
+
+    query = {
+        "analysis_results": {"$type": "object"},
+        "analysis_results.schema_version": {"$ne": SCHEMA_VERSION},
+    }
+    cursor = shots.find(query, {"analysis_results": 1})
+
+    migrated = 0
+    failed = 0
+    batch = []
+
+    async def flush():
+        nonlocal migrated
+        if batch and not dry_run:
+            result = await shots.bulk_write(batch, ordered=False)
+            migrated += result.modified_count
+        elif batch:
+            migrated += len(batch)
+        batch.clear()
+
+    async for doc in cursor:
+        try:
+            compact = compact_results(doc["analysis_results"])
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Kunde ej konvertera shot {doc['_id']} => {e}")
+            continue
+
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"analysis_results": compact}}))
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+
+    verb = "Skulle migrera" if dry_run else "Migrerade"
+    logger.info(f"{verb} {migrated} shots till schema {SCHEMA_VERSION} ({failed} misslyckades).")
+
+    # Stäng DB-anslutning
+    await db.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrera shots till kolumnvis pelletlagring")
+    parser.add_argument("--dry-run", action="store_true", help="Räkna bara, skriv inget")
+    parser.add_argument("--batch-size", type=int, default=500, help="Antal uppdateringar per bulk_write")
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run, args.batch_size))